@@ -3,7 +3,10 @@ import sys
 import json
 import re
 import hashlib
+import copy
+import mmap
 import threading
+import queue
 import time
 import psutil
 import platform
@@ -11,6 +14,7 @@ import requests
 from datetime import datetime, timedelta
 from scapy.all import sniff, IP, TCP, UDP, Raw, get_if_list
 from scapy.layers.tls.all import TLS
+from scapy.packet import split_layers
 from PySide6.QtCore import QObject, Signal
 #import yara
 import subprocess
@@ -19,22 +23,140 @@ import os
 import numpy as np
 from scapy.layers.tls.all import *
 import pandas as pd
-from collections import defaultdict
-from PySide6.QtWidgets import QMessageBox
+from collections import defaultdict, OrderedDict
 from typing import Optional, Dict, Any
+from urllib.parse import unquote, unquote_plus
+from back_recursos import peak_rss_mb
+
+# O ClientHello é extraído direto dos bytes pelo JA3Analyzer: evita que o
+# scapy disseque a camada TLS em todo pacote da porta 443 durante a captura
+split_layers(TCP, TLS, sport=443)
+split_layers(TCP, TLS, dport=443)
+
+class EventSuppressor:
+    """Supressão e agregação de eventos repetitivos por (evento, ip, porta)"""
+    
+    def __init__(self, window: float = 10.0, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+    
+    def register(self, key: tuple, entry: Dict[str, Any], now: Optional[float] = None):
+        """
+        Registra uma ocorrência do evento.
+        
+        Returns:
+            tuple: (emitir_original, lista de registros agregados prontos)
+        """
+        now = time.time() if now is None else now
+        rollups = []
+        
+        with self._lock:
+            if now - self._last_sweep >= self.window:
+                rollups.extend(self._sweep(now))
+            
+            state = self._events.get(key)
+            if state is None:
+                # Sem espaço para novas chaves: não suprime para não perder eventos
+                if len(self._events) >= self.max_keys:
+                    return True, rollups
+                    
+                self._events[key] = {
+                    'entry': entry,
+                    'window_start': now,
+                    'first_seen': now,
+                    'last_seen': now,
+                    'count': 0,
+                    'bucket': int(now),
+                    'bucket_count': 1,
+                    'peak_rate': 1
+                }
+                return True, rollups
+            
+            # Ocorrência repetida: apenas contabiliza
+            state['entry'] = entry
+            state['count'] += 1
+            state['last_seen'] = now
+            if state['first_seen'] is None:
+                state['first_seen'] = now
+            if int(now) == state['bucket']:
+                state['bucket_count'] += 1
+            else:
+                state['bucket'] = int(now)
+                state['bucket_count'] = 1
+            state['peak_rate'] = max(state['peak_rate'], state['bucket_count'])
+            
+            if now - state['window_start'] >= self.window:
+                rollups.append(self._rollup(state))
+                self._reset_window(state, now)
+                
+        return False, rollups
+    
+    def flush(self, now: Optional[float] = None, force: bool = False):
+        """Retorna os registros agregados pendentes e descarta chaves ociosas"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if force:
+                rollups = [self._rollup(s) for s in self._events.values() if s['count'] > 0]
+                self._events.clear()
+                return rollups
+            return self._sweep(now)
+    
+    def _sweep(self, now):
+        """Fecha janelas expiradas (chamado com o lock adquirido)"""
+        rollups = []
+        for key in list(self._events):
+            state = self._events[key]
+            if now - state['window_start'] < self.window:
+                continue
+            if state['count'] > 0:
+                rollups.append(self._rollup(state))
+                self._reset_window(state, now)
+            elif now - state['last_seen'] >= self.window:
+                # Nenhuma repetição na última janela: libera a chave
+                del self._events[key]
+        self._last_sweep = now
+        return rollups
+    
+    def _reset_window(self, state, now):
+        state['window_start'] = now
+        state['first_seen'] = None
+        state['count'] = 0
+        state['peak_rate'] = 0
+    
+    def _rollup(self, state):
+        """Monta o registro agregado a partir do estado da chave"""
+        entry = dict(state['entry'])
+        additional_data = dict(entry.get('additional_data') or {})
+        additional_data['aggregated'] = {
+            'count': state['count'],
+            'first_seen': datetime.fromtimestamp(state['first_seen']).isoformat(),
+            'last_seen': datetime.fromtimestamp(state['last_seen']).isoformat(),
+            'peak_rate': state['peak_rate'],
+            'window': self.window
+        }
+        entry['additional_data'] = additional_data
+        entry['timestamp'] = datetime.fromtimestamp(state['last_seen']).isoformat()
+        return entry
 
 class JSONLogger:
     """Logger personalizado que gera logs em formato JSON com estrutura padronizada"""
     
-    def __init__(self, log_file: str = "firewall_logs.json"):
+    def __init__(self, log_file: str = "firewall_logs.json", suppression_window: float = 10.0):
         self.log_file = log_file
+        self.suppressor = EventSuppressor(window=suppression_window)
+        self._flush_timer = None
         # Cria o arquivo de log se não existir
         open(self.log_file, 'a').close()
+        self.start_periodic_flush()
     
     def _log(self, event_name: str, classification: str, 
              ip: Optional[str] = None, port: Optional[int] = None,
              service: Optional[str] = None, suggestion: Optional[str] = None,
-             additional_data: Optional[Dict[str, Any]] = None):
+             additional_data: Optional[Dict[str, Any]] = None,
+             aggregate: bool = False):
         """Método interno para gerar logs formatados"""
         
         log_entry = {
@@ -51,9 +173,45 @@ class JSONLogger:
         # Remove campos vazios para economizar espaço
         log_entry = {k: v for k, v in log_entry.items() if v is not None and v != {}}
         
+        entries = [log_entry]
+        if aggregate:
+            # Eventos repetitivos: emite a primeira ocorrência e depois só os agregados
+            emit, rollups = self.suppressor.register((event_name, ip, port), log_entry)
+            entries = ([log_entry] if emit else []) + rollups
+        
+        self._write(entries)
+    
+    def flush(self, force: bool = False):
+        """Grava os registros agregados pendentes"""
+        self._write(self.suppressor.flush(force=force))
+    
+    def start_periodic_flush(self):
+        """Grava os agregados a cada janela, mesmo sem novos eventos (fim de um flood)"""
+        timer = threading.Timer(self.suppressor.window, self._periodic_flush)
+        timer.daemon = True
+        self._flush_timer = timer
+        timer.start()
+    
+    def stop_periodic_flush(self):
+        timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+    
+    def _periodic_flush(self):
+        try:
+            self.flush()
+        finally:
+            if self._flush_timer is not None:
+                self.start_periodic_flush()
+    
+    def _write(self, entries):
+        """Grava as entradas no arquivo de log em uma única abertura"""
+        if not entries:
+            return
+            
         try:
             with open(self.log_file, 'a') as f:
-                f.write(json.dumps(log_entry) + '\n')
+                f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
         except Exception as e:
             print(f"Falha ao escrever no log: {str(e)}")
 
@@ -77,72 +235,231 @@ class JSONLogger:
         """Log de atividade suspeita"""
         self._log(event_name, "Suspeito", **kwargs)
         
+def is_grease(value):
+    """Valores GREASE (RFC 8701): 0x0a0a, 0x1a1a, ..., 0xfafa"""
+    return (value & 0x0f0f) == 0x0a0a and (value >> 8) == (value & 0xff)
+
+class ClientHello:
+    """ClientHello TLS extraído diretamente dos bytes do registro, em uma passagem"""
+    
+    __slots__ = ('version', 'ciphers', 'extensions', 'curves', 'point_formats',
+                 'server_name', 'alpn', 'signature_algorithms',
+                 'supported_versions', 'complete')
+    
+    def __init__(self):
+        self.version = 0
+        self.ciphers = []
+        self.extensions = []
+        self.curves = []
+        self.point_formats = []
+        self.server_name = None
+        self.alpn = []
+        self.signature_algorithms = []
+        self.supported_versions = []
+        self.complete = False
+    
+    @classmethod
+    def parse(cls, data):
+        """
+        Extrai o ClientHello de um payload TCP.
+        
+        Pacotes que não são handshake TLS (0x16) com ClientHello (tipo 1)
+        são rejeitados após duas comparações de byte.
+        """
+        if len(data) < 44 or data[0] != 0x16 or data[5] != 0x01:
+            return None
+            
+        hello = cls()
+        hello.version = int.from_bytes(data[9:11], 'big')
+        
+        # random (32 bytes) e session id
+        pos = 43
+        pos += 1 + data[pos]
+        if pos + 2 > len(data):
+            return None
+            
+        cipher_len = int.from_bytes(data[pos:pos + 2], 'big')
+        pos += 2
+        if pos + cipher_len > len(data):
+            return None
+        for i in range(pos, pos + cipher_len - 1, 2):
+            cipher = (data[i] << 8) | data[i + 1]
+            if not is_grease(cipher):
+                hello.ciphers.append(cipher)
+        pos += cipher_len
+        
+        # métodos de compressão
+        if pos >= len(data):
+            return None
+        pos += 1 + data[pos]
+        
+        if pos + 2 > len(data):
+            # ClientHello sem extensões (SSLv3/TLS antigos)
+            hello.complete = pos == len(data)
+            return hello
+            
+        ext_end = min(pos + 2 + int.from_bytes(data[pos:pos + 2], 'big'), len(data))
+        pos += 2
+        while pos + 4 <= ext_end:
+            ext_type = (data[pos] << 8) | data[pos + 1]
+            ext_len = (data[pos + 2] << 8) | data[pos + 3]
+            pos += 4
+            if pos + ext_len > ext_end:
+                break  # registro fragmentado em mais de um segmento
+            if not is_grease(ext_type):
+                hello.extensions.append(ext_type)
+                hello._parse_extension(ext_type, data[pos:pos + ext_len])
+            pos += ext_len
+            
+        hello.complete = pos == ext_end and ext_end <= len(data)
+        return hello
+    
+    def _parse_extension(self, ext_type, body):
+        """Extrai os campos das extensões usadas nos fingerprints"""
+        if ext_type == 0x000a and len(body) >= 2:  # supported_groups
+            self.curves = self._u16_list(body[2:2 + int.from_bytes(body[:2], 'big')])
+        elif ext_type == 0x000b and len(body) >= 1:  # ec_point_formats
+            self.point_formats = list(body[1:1 + body[0]])
+        elif ext_type == 0x000d and len(body) >= 2:  # signature_algorithms
+            self.signature_algorithms = self._u16_list(body[2:2 + int.from_bytes(body[:2], 'big')])
+        elif ext_type == 0x002b and len(body) >= 1:  # supported_versions
+            self.supported_versions = self._u16_list(body[1:1 + body[0]])
+        elif ext_type == 0x0000 and len(body) >= 5:  # server_name
+            name_len = int.from_bytes(body[3:5], 'big')
+            self.server_name = bytes(body[5:5 + name_len]).decode('ascii', errors='ignore')
+        elif ext_type == 0x0010 and len(body) >= 2:  # ALPN
+            pos, end = 2, min(2 + int.from_bytes(body[:2], 'big'), len(body))
+            while pos < end:
+                size = body[pos]
+                self.alpn.append(bytes(body[pos + 1:pos + 1 + size]).decode('ascii', errors='ignore'))
+                pos += 1 + size
+    
+    @staticmethod
+    def _u16_list(body):
+        values = ((body[i] << 8) | body[i + 1] for i in range(0, len(body) - 1, 2))
+        return [v for v in values if not is_grease(v)]
+
+class ServerHello:
+    """ServerHello TLS extraído dos bytes do registro (base do JA3S)"""
+    
+    __slots__ = ('version', 'cipher', 'extensions', 'selected_version')
+    
+    def __init__(self):
+        self.version = 0
+        self.cipher = 0
+        self.extensions = []
+        self.selected_version = None
+    
+    @classmethod
+    def parse(cls, data):
+        """Extrai o ServerHello (registro 0x16, handshake tipo 2) de um payload TCP"""
+        if len(data) < 44 or data[0] != 0x16 or data[5] != 0x02:
+            return None
+            
+        hello = cls()
+        hello.version = int.from_bytes(data[9:11], 'big')
+        pos = 43
+        pos += 1 + data[pos]
+        if pos + 3 > len(data):
+            return None
+        hello.cipher = int.from_bytes(data[pos:pos + 2], 'big')
+        pos += 3  # cifra + método de compressão
+        
+        if pos + 2 <= len(data):
+            ext_end = min(pos + 2 + int.from_bytes(data[pos:pos + 2], 'big'), len(data))
+            pos += 2
+            while pos + 4 <= ext_end:
+                ext_type = (data[pos] << 8) | data[pos + 1]
+                ext_len = (data[pos + 2] << 8) | data[pos + 3]
+                pos += 4
+                if not is_grease(ext_type):
+                    hello.extensions.append(ext_type)
+                if ext_type == 0x002b and ext_len == 2 and pos + 2 <= ext_end:
+                    hello.selected_version = int.from_bytes(data[pos:pos + 2], 'big')
+                pos += ext_len
+        return hello
+
+JA4_VERSIONS = {
+    0x0304: '13', 0x0303: '12', 0x0302: '11', 0x0301: '10',
+    0x0300: 's3', 0x0002: 's2', 0xfeff: 'd1', 0xfefd: 'd2', 0xfefc: 'd3'
+}
+
+def ja3_string(hello):
+    """String JA3 completa: versão,cifras,extensões,curvas,formatos de ponto"""
+    return ",".join((
+        str(hello.version),
+        "-".join(map(str, hello.ciphers)),
+        "-".join(map(str, hello.extensions)),
+        "-".join(map(str, hello.curves)),
+        "-".join(map(str, hello.point_formats))
+    ))
+
+def ja3s_string(server_hello):
+    """String JA3S: versão,cifra,extensões do ServerHello"""
+    return ",".join((
+        str(server_hello.version),
+        str(server_hello.cipher),
+        "-".join(map(str, server_hello.extensions))
+    ))
+
+def ja4_fingerprint(hello, transport='t'):
+    """Fingerprint JA4 (cliente) no formato a_b_c"""
+    version = max(hello.supported_versions) if hello.supported_versions else hello.version
+    
+    alpn = '00'
+    if hello.alpn and hello.alpn[0]:
+        first = hello.alpn[0]
+        if first[0].isascii() and first[0].isalnum() and first[-1].isascii() and first[-1].isalnum():
+            alpn = first[0] + first[-1]
+        else:
+            hex_value = first.encode('latin-1', errors='replace').hex()
+            alpn = hex_value[0] + hex_value[-1]
+            
+    part_a = (
+        f"{transport}{JA4_VERSIONS.get(version, '00')}"
+        f"{'d' if hello.server_name else 'i'}"
+        f"{min(len(hello.ciphers), 99):02d}{min(len(hello.extensions), 99):02d}{alpn}"
+    )
+    
+    def truncated_sha256(text):
+        return hashlib.sha256(text.encode()).hexdigest()[:12] if text else '0' * 12
+    
+    part_b = truncated_sha256(",".join(f"{c:04x}" for c in sorted(hello.ciphers)))
+    
+    # SNI e ALPN ficam fora da parte c; algoritmos de assinatura na ordem original
+    extensions = ",".join(f"{e:04x}" for e in sorted(hello.extensions) if e not in (0x0000, 0x0010))
+    if extensions and hello.signature_algorithms:
+        extensions += "_" + ",".join(f"{s:04x}" for s in hello.signature_algorithms)
+    part_c = truncated_sha256(extensions)
+    
+    return f"{part_a}_{part_b}_{part_c}"
+
 class JA3Analyzer:
-    """Analisador de fingerprints TLS com JA3"""
+    """Analisador de fingerprints TLS (JA3, JA3S e JA4) por sessão"""
     
-    def __init__(self, firewall):
+    def __init__(self, firewall, max_sessions=65536):
         self.firewall = firewall
         self._signature_cache = {}
         self._cache_lock = threading.Lock()
+        
+        # Fingerprints por sessão TLS: calculados e consultados uma vez por fluxo
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
     
     def analyze(self, pkt):
-        """Análise de fingerprint TLS com JA3"""
-        if not pkt.haslayer(TLS):
+        """Análise de fingerprints TLS do handshake"""
+        payload = self._tcp_payload(pkt)
+        if len(payload) < 44 or payload[0] != 0x16:
             return None
             
         try:
-            ja3_hash = self._calculate_ja3(pkt[TLS])
-            if not ja3_hash:
-                return None
-                
-            # Verifica no banco de dados JA3
-            is_malicious = self.firewall.ja3_db.is_malicious(ja3_hash)
-            if is_malicious:
-                self.firewall.stats['ja3_matches'] += 1
-                
-                src_ip = pkt[IP].src if pkt.haslayer(IP) else None
-                self.firewall.logger.attack(
-                    "Fingerprint JA3 malicioso detectado",
-                    ip=src_ip,
-                    service="TLS Inspection",
-                    suggestion="Bloquear IP imediatamente",
-                    additional_data={'ja3_hash': ja3_hash}
-                )
-                
-                return {
-                    'block': True,
-                    'reason': f"Fingerprint JA3 malicioso: {ja3_hash}",
-                    'score': 90,
-                    'details': {'ja3': ja3_hash}
-                }
-                
-            # Verifica em cache local de anomalias
-            with self._cache_lock:
-                if ja3_hash in self._signature_cache:
-                    cached_result = self._signature_cache[ja3_hash]
-                    if cached_result['expire'] > time.time():
-                        return cached_result['result']
-            
-            # Verificação adicional para anomalias
-            anomaly_result = self._check_ja3_anomalies(pkt[TLS], ja3_hash)
-            if anomaly_result:
-                # Log de anomalia
-                src_ip = pkt[IP].src if pkt.haslayer(IP) else None
-                self.firewall.logger.suspicious(
-                    "Anomalia TLS detectada",
-                    ip=src_ip,
-                    service="TLS Inspection",
-                    suggestion="Investigar conexão",
-                    additional_data=anomaly_result['details']
-                )
+            hello = ClientHello.parse(payload)
+            if hello is not None:
+                return self._analyze_client_hello(pkt, hello)
                 
-                # Cache resultado por 1 hora
-                with self._cache_lock:
-                    self._signature_cache[ja3_hash] = {
-                        'result': anomaly_result,
-                        'expire': time.time() + 3600
-                    }
-                return anomaly_result
+            server_hello = ServerHello.parse(payload)
+            if server_hello is not None:
+                return self._analyze_server_hello(pkt, server_hello)
                 
         except Exception as e:
             self.firewall.logger.error(
@@ -154,47 +471,140 @@ class JA3Analyzer:
             
         return None
     
-    def _calculate_ja3(self, tls_layer):
-        """Cálculo JA3 com tratamento completo de erros"""
-        try:
-            # Verificação da estrutura TLS
-            if not tls_layer or not hasattr(tls_layer, 'msg'):
-                return None
-
-            # Encontra o Client Hello
-            client_hello = next(
-                (msg for msg in tls_layer.msg 
-                if hasattr(msg, 'msgtype') and msg.msgtype == 1),
-                None
+    def get_session(self, client_ip, client_port, server_ip, server_port):
+        """Fingerprints registrados para a sessão TLS (ou None)"""
+        with self._cache_lock:
+            session = self._sessions.get((client_ip, client_port, server_ip, server_port))
+            return dict(session) if session else None
+    
+    def _session(self, key):
+        """Obtém/cria o registro da sessão (chamado com o lock adquirido)"""
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = {}
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+    
+    def _fingerprints(self, session):
+        return {k: session[k] for k in ('ja3', 'ja3s', 'ja4', 'sni') if session.get(k)}
+    
+    def _analyze_client_hello(self, pkt, hello):
+        """ClientHello: JA3 e JA4 calculados e consultados uma vez por sessão"""
+        key = (pkt[IP].src, pkt[TCP].sport, pkt[IP].dst, pkt[TCP].dport)
+        with self._cache_lock:
+            session = self._session(key)
+            if 'client_result' in session:
+                return session['client_result']
+        
+        ja3_hash = self._calculate_ja3(hello)
+        if not ja3_hash:
+            return None
+        ja4 = ja4_fingerprint(hello)
+        
+        with self._cache_lock:
+            session.update({'ja3': ja3_hash, 'ja4': ja4, 'sni': hello.server_name})
+            fingerprints = self._fingerprints(session)
+            
+        result = self._check_feeds(pkt[IP].src, fingerprints, ('ja3', 'ja4'))
+        if result is None:
+            result = self._check_cached_anomalies(pkt, hello, ja3_hash, fingerprints)
+            
+        with self._cache_lock:
+            session['client_result'] = result
+        return result
+    
+    def _analyze_server_hello(self, pkt, server_hello):
+        """ServerHello: JA3S calculado e consultado uma vez por sessão"""
+        key = (pkt[IP].dst, pkt[TCP].dport, pkt[IP].src, pkt[TCP].sport)
+        with self._cache_lock:
+            session = self._session(key)
+            if 'server_result' in session:
+                return session['server_result']
+            session['ja3s'] = hashlib.md5(ja3s_string(server_hello).encode()).hexdigest()
+            fingerprints = self._fingerprints(session)
+        
+        # O JA3S identifica o servidor (ex.: C2): ele é logado, pontuado e bloqueado
+        result = self._check_feeds(pkt[IP].src, fingerprints, ('ja3s',))
+        with self._cache_lock:
+            session['server_result'] = result
+        return result
+    
+    def _check_feeds(self, src_ip, fingerprints, kinds):
+        """Consulta os feeds de fingerprints maliciosos (src_ip é o alvo logado e bloqueado)"""
+        for kind in kinds:
+            fingerprint = fingerprints.get(kind)
+            if not fingerprint or not self.firewall.ja3_db.is_malicious(fingerprint, kind=kind):
+                continue
+                
+            self.firewall.stats['ja3_matches'] += 1
+            label = kind.upper()
+            self.firewall.logger.attack(
+                f"Fingerprint {label} malicioso detectado",
+                ip=src_ip,
+                service="TLS Inspection",
+                suggestion="Bloquear IP imediatamente",
+                additional_data=fingerprints
             )
-            if not client_hello:
-                return None
-
-            # Obtém versão TLS com fallback seguro
-            version = getattr(client_hello, 'version', '769')  # 769 = TLS 1.0 como fallback
             
-            # Processa cifras válidas
-            ciphers = []
-            if hasattr(client_hello, 'ciphers'):
-                ciphers = [
-                    str(c) for c in client_hello.ciphers 
-                    if isinstance(c, int) and 0x0000 < c <= 0xFFFF
-                ]
-
-            # Processa extensões
-            extensions = []
-            if hasattr(client_hello, 'extensions'):
-                extensions = [
-                    str(e.type) for e in client_hello.extensions 
-                    if hasattr(e, 'type')
-                ]
-
-            # Constrói string JA3
-            ja3_str = f"{version}," \
-                    f"{'-'.join(ciphers) if ciphers else ''}," \
-                    f"{'-'.join(extensions) if extensions else ''}"
-
-            return hashlib.md5(ja3_str.encode()).hexdigest()
+            return {
+                'block': True,
+                'conclusive': True,
+                'ip': src_ip,
+                'reason': f"Fingerprint {label} malicioso: {fingerprint}",
+                'score': 90,
+                'details': fingerprints
+            }
+        return None
+    
+    def _check_cached_anomalies(self, pkt, hello, ja3_hash, fingerprints):
+        """Anomalias do ClientHello, com cache por hash JA3"""
+        # Verifica em cache local de anomalias
+        with self._cache_lock:
+            if ja3_hash in self._signature_cache:
+                cached_result = self._signature_cache[ja3_hash]
+                if cached_result['expire'] > time.time():
+                    return cached_result['result']
+        
+        # Verificação adicional para anomalias
+        anomaly_result = self._check_ja3_anomalies(hello, ja3_hash)
+        if anomaly_result:
+            anomaly_result['details'].update(fingerprints)
+            # Log de anomalia
+            self.firewall.logger.suspicious(
+                "Anomalia TLS detectada",
+                ip=pkt[IP].src,
+                service="TLS Inspection",
+                suggestion="Investigar conexão",
+                additional_data=anomaly_result['details']
+            )
+            
+            # Cache resultado por 1 hora
+            with self._cache_lock:
+                self._signature_cache[ja3_hash] = {
+                    'result': anomaly_result,
+                    'expire': time.time() + 3600
+                }
+        return anomaly_result
+    
+    @staticmethod
+    def _tcp_payload(pkt):
+        """Bytes do payload TCP sem dissecar camadas de aplicação"""
+        if not pkt.haslayer(TCP):
+            return b''
+        payload = pkt[TCP].payload
+        if isinstance(payload, Raw):
+            return payload.load
+        return bytes(payload)
+    
+    def _calculate_ja3(self, hello):
+        """Cálculo JA3 a partir do ClientHello extraído"""
+        try:
+            # Fragmentado em vários segmentos: lista de extensões incompleta
+            if not hello.complete:
+                return None
+                
+            return hashlib.md5(ja3_string(hello).encode()).hexdigest()
 
         except Exception as e:
             self.firewall.logger.error(
@@ -205,57 +615,47 @@ class JA3Analyzer:
             )
             return None
     
-    def _check_ja3_anomalies(self, tls_layer, ja3_hash):
+    def _check_ja3_anomalies(self, hello, ja3_hash):
         """Verifica anomalias em fingerprints JA3"""
         try:
-            client_hello = next(
-                (msg for msg in tls_layer.msg 
-                if hasattr(msg, 'msgtype') and msg.msgtype == 1),
-                None
-            )
-            if not client_hello:
-                return None
-                
             # Verifica versões TLS obsoletas
-            if hasattr(client_hello, 'version'):
-                tls_version = client_hello.version
-                if tls_version < 0x0303:  # Antes do TLS 1.2
-                    return {
-                        'block': False,
-                        'reason': f"Versão TLS obsoleta: {tls_version}",
-                        'score': 40,
-                        'details': {
-                            'ja3': ja3_hash,
-                            'tls_version': tls_version
-                        }
+            tls_version = hello.version
+            if tls_version < 0x0303:  # Antes do TLS 1.2
+                return {
+                    'block': False,
+                    'reason': f"Versão TLS obsoleta: {tls_version}",
+                    'score': 40,
+                    'details': {
+                        'ja3': ja3_hash,
+                        'tls_version': tls_version
                     }
+                }
             
             # Verifica cifras inseguras
-            if hasattr(client_hello, 'ciphers'):
-                weak_ciphers = {
-                    0x0000: 'NULL',
-                    0x0005: 'RC4',
-                    0x000A: 'DES',
-                    0x002F: 'AES-CBC',
-                    0x0030: 'AES-GCM',
-                    0x0004: 'RC4-40'
-                }
-                
-                weak_in_use = [
-                    weak_ciphers[c] for c in client_hello.ciphers 
-                    if c in weak_ciphers
-                ]
-                
-                if weak_in_use:
-                    return {
-                        'block': False,
-                        'reason': f"Cifras fracas detectadas: {', '.join(weak_in_use)}",
-                        'score': 60,
-                        'details': {
-                            'ja3': ja3_hash,
-                            'weak_ciphers': weak_in_use
-                        }
+            weak_ciphers = {
+                0x0000: 'NULL',
+                0x0005: 'RC4',
+                0x000A: 'DES',
+                0x002F: 'AES-CBC',
+                0x0030: 'AES-GCM',
+                0x0004: 'RC4-40'
+            }
+            
+            weak_in_use = [
+                weak_ciphers[c] for c in hello.ciphers 
+                if c in weak_ciphers
+            ]
+            
+            if weak_in_use:
+                return {
+                    'block': False,
+                    'reason': f"Cifras fracas detectadas: {', '.join(weak_in_use)}",
+                    'score': 60,
+                    'details': {
+                        'ja3': ja3_hash,
+                        'weak_ciphers': weak_in_use
                     }
+                }
                     
         except Exception as e:
             self.firewall.logger.error(
@@ -267,6 +667,451 @@ class JA3Analyzer:
             
         return None
 
+class ConnectionTracker:
+    """Rastreamento compacto de conexões TCP com estados empacotados em arrays"""
+    
+    # Estados da conexão
+    SYN_SENT = 1
+    SYN_RECV = 2
+    ESTABLISHED = 3
+    FIN_WAIT = 4
+    CLOSED = 5
+    
+    # Flags TCP
+    FIN = 0x01
+    SYN = 0x02
+    RST = 0x04
+    ACK = 0x10
+    
+    def __init__(self, capacity: int = 262144, max_destinations: int = 4096,
+                 wheel_size: int = 512):
+        self.capacity = capacity
+        self.max_destinations = max_destinations
+        self.timeouts = {
+            self.SYN_SENT: 30,
+            self.SYN_RECV: 30,
+            self.ESTABLISHED: 300,
+            self.FIN_WAIT: 60,
+            self.CLOSED: 5
+        }
+        # Fluxo visto só no meio (sem SYN) e ainda sem resposta: curto, para que um
+        # flood de ACK não ocupe a tabela por 300 s
+        self.midstream_timeout = 10
+        self.slow_params = {
+            'min_duration': 30.0,   # segundos
+            'max_rate': 50.0        # bytes/s
+        }
+        
+        # Estado por fluxo (um slot por conexão)
+        self._state = np.zeros(capacity, dtype=np.uint8)
+        self._fins = np.zeros(capacity, dtype=np.uint8)        # bit 0: originador, bit 1: resposta
+        self._orig_is_a = np.zeros(capacity, dtype=np.bool_)
+        self._midstream = np.zeros(capacity, dtype=np.bool_)
+        self._dst = np.full(capacity, -1, dtype=np.int32)
+        self._created = np.zeros(capacity, dtype=np.float64)
+        self._last = np.zeros(capacity, dtype=np.float64)
+        self._bytes = np.zeros(capacity, dtype=np.uint64)
+        self._keys = [None] * capacity
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        
+        # Contadores por destino
+        self._dst_ids = {}
+        self._dst_ips = []
+        self._dst_free = []                                      # ids liberados para reuso
+        self._dst_refs = np.zeros(max_destinations, dtype=np.int64)  # fluxos vivos por destino
+        self._half_open = np.zeros(max_destinations, dtype=np.int64)
+        self._total = np.zeros(max_destinations, dtype=np.int64)
+        self._resets = np.zeros(max_destinations, dtype=np.int64)
+        self._slow = np.zeros(max_destinations, dtype=np.int64)
+        
+        # Timer wheel de 1 segundo por posição para expiração de ociosos
+        self._wheel = [[] for _ in range(wheel_size)]
+        self._wheel_pos = None
+        
+        self.stats = {'tracked': 0, 'expired': 0, 'dropped': 0}
+        self.lock = threading.Lock()
+    
+    def update(self, src, dst, sport, dport, flags, payload_len=0, now=None):
+        """Atualiza a máquina de estados com um segmento TCP e retorna o estado"""
+        now = time.time() if now is None else now
+        flags = int(flags)
+        
+        # Chave canônica: as duas direções caem no mesmo fluxo
+        if (src, sport) <= (dst, dport):
+            key, from_a = (src, sport, dst, dport), True
+        else:
+            key, from_a = (dst, dport, src, sport), False
+            
+        with self.lock:
+            self._advance(now)
+            
+            slot = self._slots.get(key)
+            if slot is None:
+                if flags & self.RST:
+                    return None
+                slot = self._open(key, dst, from_a, flags, now)
+                if slot is None:
+                    return None
+            else:
+                self._transition(slot, from_a == self._orig_is_a[slot], flags)
+                
+            self._last[slot] = now
+            self._bytes[slot] += payload_len
+            return int(self._state[slot])
+    
+    def half_open(self, dst):
+        """Conexões semiabertas (SYN sem handshake completo) para o destino"""
+        dst_id = self._dst_ids.get(dst)
+        return int(self._half_open[dst_id]) if dst_id is not None else 0
+    
+    def rst_ratio(self, dst):
+        """Fração das conexões para o destino encerradas por RST"""
+        dst_id = self._dst_ids.get(dst)
+        if dst_id is None or self._total[dst_id] == 0:
+            return 0.0
+        return float(self._resets[dst_id] / self._total[dst_id])
+    
+    def slow_connections(self, dst):
+        """Conexões longas com taxa muito baixa (indicador Slowloris)"""
+        dst_id = self._dst_ids.get(dst)
+        return int(self._slow[dst_id]) if dst_id is not None else 0
+    
+    def destination_stats(self, dst):
+        """Resumo dos indicadores de um destino"""
+        dst_id = self._dst_ids.get(dst)
+        return {
+            'half_open': self.half_open(dst),
+            'connections': int(self._total[dst_id]) if dst_id is not None else 0,
+            'rst_ratio': round(self.rst_ratio(dst), 3),
+            'slow_connections': self.slow_connections(dst)
+        }
+    
+    def __len__(self):
+        return len(self._slots)
+    
+    def _open(self, key, dst, from_a, flags, now):
+        """Cria o registro de um novo fluxo"""
+        if not self._free:
+            self.stats['dropped'] += 1
+            return None
+            
+        slot = self._free.pop()
+        self._slots[key] = slot
+        self._keys[slot] = key
+        self._orig_is_a[slot] = from_a
+        self._created[slot] = now
+        self._bytes[slot] = 0
+        self._fins[slot] = 0
+        
+        dst_id = self._dst_ids.get(dst)
+        if dst_id is None:
+            dst_id = self._new_destination(dst)
+        self._dst[slot] = -1 if dst_id is None else dst_id
+        
+        if flags & self.SYN and not flags & self.ACK:
+            self._state[slot] = self.SYN_SENT
+            self._midstream[slot] = False
+            if dst_id is not None:
+                self._half_open[dst_id] += 1
+        else:
+            # Conexão já em andamento quando a captura começou
+            self._state[slot] = self.ESTABLISHED
+            self._midstream[slot] = True
+        if dst_id is not None:
+            self._total[dst_id] += 1
+            self._dst_refs[dst_id] += 1
+            
+        self._schedule(slot, now)
+        self.stats['tracked'] += 1
+        return slot
+    
+    def _new_destination(self, dst):
+        """Reserva um id de destino (reaproveita os liberados); None se todos estão em uso"""
+        if self._dst_free:
+            dst_id = self._dst_free.pop()
+            self._dst_ips[dst_id] = dst
+        elif len(self._dst_ips) < self.max_destinations:
+            dst_id = len(self._dst_ips)
+            self._dst_ips.append(dst)
+        else:
+            return None
+        self._dst_ids[dst] = dst_id
+        return dst_id
+    
+    def _release_destination(self, dst_id):
+        """Último fluxo do destino expirou: zera os contadores e devolve o id"""
+        del self._dst_ids[self._dst_ips[dst_id]]
+        self._dst_ips[dst_id] = None
+        self._half_open[dst_id] = 0
+        self._total[dst_id] = 0
+        self._resets[dst_id] = 0
+        self._slow[dst_id] = 0
+        self._dst_free.append(dst_id)
+    
+    def _timeout(self, slot):
+        if self._midstream[slot]:
+            return self.midstream_timeout
+        return self.timeouts[int(self._state[slot])]
+    
+    def _transition(self, slot, from_orig, flags):
+        """Transições SYN / SYN-ACK / ACK / FIN / RST"""
+        if not from_orig:
+            self._midstream[slot] = False  # Houve resposta: conexão real
+        state = self._state[slot]
+        dst_id = self._dst[slot]
+        half_open = state in (self.SYN_SENT, self.SYN_RECV)
+        
+        if flags & self.RST:
+            if half_open and dst_id >= 0:
+                self._half_open[dst_id] -= 1
+            if state != self.CLOSED and dst_id >= 0:
+                self._resets[dst_id] += 1
+            self._state[slot] = self.CLOSED
+            return
+            
+        if state == self.SYN_SENT:
+            if not from_orig and flags & self.SYN and flags & self.ACK:
+                self._state[slot] = self.SYN_RECV
+            elif from_orig and flags & self.ACK and not flags & self.SYN:
+                self._established(slot, dst_id)
+        elif state == self.SYN_RECV:
+            if from_orig and flags & self.ACK and not flags & self.SYN:
+                self._established(slot, dst_id)
+                
+        if flags & self.FIN and self._state[slot] in (self.ESTABLISHED, self.FIN_WAIT):
+            self._fins[slot] |= 1 if from_orig else 2
+            self._state[slot] = self.CLOSED if self._fins[slot] == 3 else self.FIN_WAIT
+    
+    def _established(self, slot, dst_id):
+        self._state[slot] = self.ESTABLISHED
+        if dst_id >= 0:
+            self._half_open[dst_id] -= 1
+    
+    def _schedule(self, slot, now):
+        """Agenda a verificação de ociosidade do slot na timer wheel"""
+        timeout = self._timeout(slot)
+        delay = min(int(timeout), len(self._wheel) - 1)
+        self._wheel[(int(now) + max(delay, 1)) % len(self._wheel)].append(slot)
+    
+    def _advance(self, now):
+        """Avança a timer wheel até o segundo atual, expirando fluxos ociosos"""
+        tick = int(now)
+        if self._wheel_pos is None:
+            self._wheel_pos = tick
+            return
+        if tick <= self._wheel_pos:
+            return
+            
+        # Se passou mais de uma volta, cada posição é visitada uma única vez
+        start = max(self._wheel_pos + 1, tick - len(self._wheel) + 1)
+        for t in range(start, tick + 1):
+            bucket = self._wheel[t % len(self._wheel)]
+            if not bucket:
+                continue
+            self._wheel[t % len(self._wheel)] = []
+            for slot in bucket:
+                if self._keys[slot] is None:
+                    continue
+                timeout = self._timeout(slot)
+                if now - self._last[slot] >= timeout:
+                    self._expire(slot)
+                else:
+                    # Houve atividade: reagenda para o tempo restante
+                    remaining = timeout - (now - self._last[slot])
+                    delay = min(max(int(remaining) + 1, 1), len(self._wheel) - 1)
+                    self._wheel[(tick + delay) % len(self._wheel)].append(slot)
+        self._wheel_pos = tick
+        self._update_slow(now)
+    
+    def _expire(self, slot):
+        """Libera o slot de um fluxo expirado"""
+        dst_id = self._dst[slot]
+        if self._state[slot] in (self.SYN_SENT, self.SYN_RECV) and dst_id >= 0:
+            self._half_open[dst_id] -= 1
+        del self._slots[self._keys[slot]]
+        self._keys[slot] = None
+        self._state[slot] = 0
+        self._midstream[slot] = False
+        self._dst[slot] = -1
+        self._free.append(slot)
+        if dst_id >= 0:
+            self._dst_refs[dst_id] -= 1
+            if self._dst_refs[dst_id] == 0:
+                self._release_destination(dst_id)
+        self.stats['expired'] += 1
+    
+    def _update_slow(self, now):
+        """Recalcula (uma vez por segundo) as conexões lentas por destino"""
+        duration = now - self._created
+        active = (self._state == self.ESTABLISHED) & (self._dst >= 0)
+        slow = active & (duration >= self.slow_params['min_duration'])
+        slow &= self._bytes < duration * self.slow_params['max_rate']
+        self._slow = np.bincount(self._dst[slow], minlength=self.max_destinations)
+
+class HTTPRequest:
+    """Requisição HTTP/1.x indexada em uma única passagem sobre um memoryview"""
+    
+    METHODS = frozenset((
+        b'GET', b'POST', b'PUT', b'DELETE', b'HEAD',
+        b'OPTIONS', b'PATCH', b'CONNECT', b'TRACE'
+    ))
+    
+    __slots__ = ('data', 'method', 'version', 'uri_span', 'header_spans',
+                 'body_start', '_headers', '_uri', '_traversal')
+    
+    def __init__(self, data, method, version, uri_span, header_spans, body_start):
+        self.data = data
+        self.method = method
+        self.version = version
+        self.uri_span = uri_span
+        self.header_spans = header_spans  # [(nome_ini, nome_fim, valor_ini, valor_fim)]
+        self.body_start = body_start      # None se os cabeçalhos estão incompletos
+        self._headers = None
+        self._uri = None
+        self._traversal = False
+    
+    @classmethod
+    def parse(cls, raw):
+        """Indexa método, URI, cabeçalhos e início do corpo; None se não for requisição"""
+        # Rejeição rápida: método começa com letra maiúscula e termina em espaço
+        if not raw or not 65 <= raw[0] <= 90:
+            return None
+        sp = raw.find(b' ', 0, 8)
+        if sp < 0 or raw[:sp] not in cls.METHODS:
+            return None
+            
+        line_end = raw.find(b'\r\n', sp)
+        if line_end < 0:
+            return None
+        uri_end = raw.rfind(b' ', sp + 1, line_end)
+        if uri_end <= sp + 1 or not raw.startswith(b'HTTP/1.', uri_end + 1):
+            return None
+        
+        # Cabeçalhos: apenas offsets, sem cópias
+        header_spans = []
+        body_start = None
+        pos = line_end + 2
+        while True:
+            end = raw.find(b'\r\n', pos)
+            if end < 0:
+                break
+            if end == pos:
+                body_start = end + 2
+                break
+            colon = raw.find(b':', pos, end)
+            if colon > pos:
+                value_start = colon + 1
+                while value_start < end and raw[value_start] in (32, 9):
+                    value_start += 1
+                value_end = end
+                while value_end > value_start and raw[value_end - 1] in (32, 9):
+                    value_end -= 1
+                header_spans.append((pos, colon, value_start, value_end))
+            pos = end + 2
+            
+        return cls(
+            memoryview(raw),
+            raw[:sp].decode('ascii'),
+            raw[uri_end + 1:line_end].decode('ascii', errors='ignore'),
+            (sp + 1, uri_end),
+            header_spans,
+            body_start
+        )
+    
+    @property
+    def raw_uri(self):
+        """URI original, sem normalização"""
+        start, end = self.uri_span
+        return bytes(self.data[start:end]).decode('latin-1')
+    
+    @property
+    def uri(self):
+        """URI decodificada e normalizada (calculada uma única vez)"""
+        if self._uri is None:
+            self._uri, self._traversal = normalize_uri(self.raw_uri)
+        return self._uri
+    
+    @property
+    def path(self):
+        return self.uri.split('?', 1)[0]
+    
+    @property
+    def traversal(self):
+        """True se a URI tenta sair da raiz com segmentos '..'"""
+        self.uri
+        return self._traversal
+    
+    @property
+    def headers(self):
+        """Cabeçalhos como {nome em minúsculas: valor} (decodificados uma única vez)"""
+        if self._headers is None:
+            headers = {}
+            for name_start, name_end, value_start, value_end in self.header_spans:
+                name = bytes(self.data[name_start:name_end]).decode('latin-1').strip().lower()
+                headers[name] = bytes(self.data[value_start:value_end]).decode('latin-1')
+            self._headers = headers
+        return self._headers
+    
+    def header(self, name, default=None):
+        return self.headers.get(name, default)
+    
+    @property
+    def body(self):
+        """Corpo da requisição como memoryview (sem cópia)"""
+        if self.body_start is None:
+            return memoryview(b'')
+        return self.data[self.body_start:]
+    
+    def inspection_text(self):
+        """Texto normalizado usado pelos detectores de padrões"""
+        parts = [self.uri]
+        parts.extend(self.headers.values())
+        body = self.body
+        if len(body):
+            parts.append(unquote_plus(bytes(body).decode('utf-8', errors='ignore')))
+        return '\n'.join(parts)
+
+def normalize_uri(raw_uri):
+    """
+    Decodifica percent-encoding (inclusive dupla), padroniza separadores e caixa,
+    e resolve segmentos '.' e '..'.
+    
+    Returns:
+        tuple: (uri normalizada, houve tentativa de path traversal)
+    """
+    uri = raw_uri
+    for _ in range(2):
+        if '%' not in uri:
+            break
+        decoded = unquote(uri, errors='replace')
+        if decoded == uri:
+            break
+        uri = decoded
+        
+    uri = uri.replace('\\', '/').lower()
+    path, sep, query = uri.partition('?')
+    
+    segments = []
+    traversal = False
+    for segment in path.split('/'):
+        if segment in ('', '.'):
+            continue
+        if segment == '..':
+            if segments:
+                segments.pop()
+            else:
+                traversal = True
+            continue
+        segments.append(segment)
+        
+    # '..' que efetivamente aparece após a decodificação também é suspeito
+    traversal = traversal or '/../' in f"/{path}/"
+    normalized = '/' + '/'.join(segments)
+    if path.endswith('/') and segments:
+        normalized += '/'
+    return normalized + sep + query, traversal
+
 class StatisticalAnalyzer:
     """Analisador estatístico de tráfego"""
     
@@ -277,6 +1122,10 @@ class StatisticalAnalyzer:
             "xss": re.compile(r"<script.*?>|javascript:", re.IGNORECASE),
             "webshell": re.compile(r"cmd\.exe|/bin/sh|wget\s+http", re.IGNORECASE)
         }
+        self.suspicious_paths = (
+            '/admin', '/wp-admin', '/console',
+            '/.env', '/phpmyadmin', '/.git'
+        )
     
     def analyze(self, pkt):
         """Análise de metadados para detecção de padrões suspeitos"""
@@ -307,6 +1156,12 @@ class StatisticalAnalyzer:
                 else:
                     result['reason'] = ddos_result.get('reason', '')
         
+        # 2b. Rastreamento de conexões TCP (SYN flood distribuído, Slowloris)
+        conn_result = self._check_connections(pkt, src_ip)
+        if conn_result:
+            result['score'] += conn_result.get('score', 0)
+            result['details'].update(conn_result.get('details', {}))
+        
         # 3. Verificação de protocolos incomuns
         proto_result = self._check_unusual_protocols(pkt)
         if proto_result:
@@ -327,27 +1182,196 @@ class StatisticalAnalyzer:
         
         return result if result['score'] > 0 else None
     
-    def _check_portscan(self, pkt, src_ip):
-        """Detecção de portscan com estado"""
-        if not pkt.haslayer(TCP):
-            return None
-            
-        dst_port = pkt[TCP].dport
-        conn_key = (src_ip, pkt[IP].dst)
+    def analyze_batch(self, batch):
+        """
+        Análise vetorizada de cabeçalhos para replay de pcap e ingestão em lote
         
-        with self.firewall.flow_lock:
-            # Atualiza estatísticas de conexão
-            if conn_key not in self.firewall.flow_cache:
-                self.firewall.flow_cache[conn_key] = {
-                    'ports': set(),
-                    'count': 0,
-                    'start_time': time.time()
-                }
+        Args:
+            batch: dict com arrays colunares de mesmo tamanho:
+                ts, src, dst, proto, sport, dport, len, flags
                 
-            conn = self.firewall.flow_cache[conn_key]
-            conn['count'] += 1
-            conn['ports'].add(dst_port)
-            
+        Returns:
+            dict com veredictos por pacote ('score', 'block', 'portscan',
+            'ddos', 'unusual') e por origem ('sources', 'source_packets',
+            'source_score', 'source_block')
+        """
+        ts = np.asarray(batch['ts'], dtype=np.float64)
+        n = len(ts)
+        if n == 0:
+            src = np.asarray(batch['src'])
+            empty = np.zeros(0, dtype=np.bool_)
+            return {
+                'score': np.zeros(0, dtype=np.int32),
+                'block': empty,
+                'portscan': empty.copy(),
+                'ddos': empty.copy(),
+                'unusual': empty.copy(),
+                'sources': src if src.dtype.kind in 'USO' else np.zeros(0, dtype=str),
+                'source_packets': np.zeros(0, dtype=np.intp),
+                'source_score': np.zeros(0, dtype=np.int32),
+                'source_block': empty.copy()
+            }
+            
+        proto = np.asarray(batch['proto'], dtype=np.int64)
+        dport = np.asarray(batch['dport'], dtype=np.int64)
+        length = np.asarray(batch['len'], dtype=np.int64)
+        flags = np.asarray(batch['flags'], dtype=np.int64)
+        sources, src_id = np.unique(np.asarray(batch['src']), return_inverse=True)
+        _, dst_id = np.unique(np.asarray(batch['dst']), return_inverse=True)
+        
+        portscan = self._batch_portscan(ts, src_id, dst_id, proto, dport)
+        ddos_score = self._batch_ddos(ts, src_id, length, flags, proto)
+        unusual_score = self._batch_unusual(proto, dport, length)
+        
+        score = np.where(portscan, 80, 0) + ddos_score + unusual_score
+        block = portscan | (ddos_score >= 80)
+        
+        # Veredictos por origem
+        source_score = np.zeros(len(sources), dtype=np.int64)
+        np.maximum.at(source_score, src_id, score)
+        source_block = np.zeros(len(sources), dtype=np.bool_)
+        np.logical_or.at(source_block, src_id, block)
+        
+        return {
+            'score': score.astype(np.int32),
+            'block': block,
+            'portscan': portscan,
+            'ddos': ddos_score > 0,
+            'unusual': unusual_score > 0,
+            'sources': sources,
+            'source_packets': np.bincount(src_id, minlength=len(sources)),
+            'source_score': source_score.astype(np.int32),
+            'source_block': source_block
+        }
+    
+    @staticmethod
+    def columns_from_packets(packets):
+        """Converte pacotes scapy (ex.: rdpcap) para o formato colunar de analyze_batch"""
+        cols = {k: [] for k in ('ts', 'src', 'dst', 'proto', 'sport', 'dport', 'len', 'flags')}
+        for pkt in packets:
+            if not pkt.haslayer(IP):
+                continue
+            layer = pkt[TCP] if pkt.haslayer(TCP) else pkt[UDP] if pkt.haslayer(UDP) else None
+            cols['ts'].append(float(pkt.time))
+            cols['src'].append(pkt[IP].src)
+            cols['dst'].append(pkt[IP].dst)
+            cols['proto'].append(pkt[IP].proto)
+            cols['sport'].append(layer.sport if layer is not None else 0)
+            cols['dport'].append(layer.dport if layer is not None else 0)
+            cols['len'].append(len(pkt))
+            cols['flags'].append(int(pkt[TCP].flags) if pkt.haslayer(TCP) else 0)
+        return {k: np.asarray(v) for k, v in cols.items()}
+    
+    @staticmethod
+    def _segments(group, ts):
+        """Ordena por (grupo, tempo) e retorna ordem, início de cada segmento e rank"""
+        order = np.lexsort((ts, group))
+        g = group[order]
+        idx = np.arange(len(g))
+        is_start = np.ones(len(g), dtype=np.bool_)
+        is_start[1:] = g[1:] != g[:-1]
+        start_idx = np.maximum.accumulate(np.where(is_start, idx, 0))
+        return order, start_idx, idx - start_idx
+    
+    @staticmethod
+    def _segment_cumsum(values, start_idx):
+        """Soma acumulada reiniciada no início de cada segmento"""
+        c = np.cumsum(values)
+        return c - (c[start_idx] - values[start_idx])
+    
+    def _batch_portscan(self, ts, src_id, dst_id, proto, dport):
+        """Equivalente vetorizado de _check_portscan (somente TCP)"""
+        result = np.zeros(len(ts), dtype=np.bool_)
+        tcp = np.flatnonzero(proto == 6)
+        if len(tcp) == 0:
+            return result
+            
+        pair = src_id[tcp].astype(np.int64) * (int(dst_id.max()) + 1) + dst_id[tcp]
+        order, start_idx, rank = self._segments(pair, ts[tcp])
+        t = ts[tcp][order]
+        
+        # Portas distintas acumuladas: primeira ocorrência de (par, porta)
+        pair_port = pair[order] * 65536 + dport[tcp][order]
+        first = np.zeros(len(order), dtype=np.int64)
+        first[np.unique(pair_port, return_index=True)[1]] = 1
+        ports = self._segment_cumsum(first, start_idx)
+        
+        elapsed = t - t[start_idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(elapsed > 0, ports / elapsed, 0.0)
+        hit = (ports > 5) & (rank + 1 > 10) & (rate > 2)
+        result[tcp[order]] = hit
+        return result
+    
+    def _batch_ddos(self, ts, src_id, length, flags, proto):
+        """Equivalente vetorizado de _check_ddos com as janelas de 1 segundo"""
+        thresholds = self.firewall.ddos_thresholds
+        order, start_idx, _ = self._segments(src_id, ts)
+        t = ts[order]
+        n = len(t)
+        
+        # Início das janelas: primeiro pacote com t > início anterior + 1s.
+        # A chave composta permite o searchsorted em todos os grupos de uma vez
+        span = float(t.max() - t.min()) + 2.0
+        key = src_id[order] * span + (t - t.min())
+        seg_starts = np.unique(start_idx)
+        group_end = np.append(seg_starts[1:], n)
+        window_start = np.zeros(n, dtype=np.bool_)
+        window_start[seg_starts] = True
+        current, end = seg_starts, group_end
+        while len(current):
+            nxt = np.searchsorted(key, key[current] + 1.0, side='right')
+            active = nxt < end
+            current, end = nxt[active], end[active]
+            window_start[current] = True
+            
+        win_idx = np.maximum.accumulate(np.where(window_start, np.arange(n), 0))
+        elapsed = t - t[win_idx] + 0.001
+        count = self._segment_cumsum(np.ones(n, dtype=np.int64), win_idx)
+        size = self._segment_cumsum(length[order], win_idx)
+        # O contador de SYN não é reiniciado a cada janela no caminho escalar
+        syn = ((proto[order] == 6) & (flags[order] == ConnectionTracker.SYN)).astype(np.int64)
+        syn_count = self._segment_cumsum(syn, start_idx)
+        
+        score = np.zeros(n, dtype=np.int64)
+        score += np.where(count / elapsed > thresholds['packet_rate'], 60, 0)
+        score += np.where(size / elapsed > thresholds['bandwidth'], 70, 0)
+        score += np.where((syn > 0) & (syn_count / elapsed > thresholds['syn_rate']), 90, 0)
+        
+        result = np.zeros(n, dtype=np.int64)
+        result[order] = score
+        return result
+    
+    def _batch_unusual(self, proto, dport, length):
+        """Equivalente vetorizado de _check_unusual_protocols"""
+        score = np.where((proto != 6) & (proto != 17), 30, 0)
+        score += np.where((proto == 6) & np.isin(dport, [4444, 31337, 6667]), 50, 0)
+        amplification = (proto == 17) & np.isin(dport, [53, 123, 161, 1900]) & (length > 500)
+        score += np.where(amplification, 60, 0)
+        return score
+    
+    def _check_portscan(self, pkt, src_ip):
+        """Detecção de portscan com estado"""
+        if not pkt.haslayer(TCP):
+            return None
+            
+        dst_port = pkt[TCP].dport
+        conn_key = (src_ip, pkt[IP].dst)
+        
+        with self.firewall.flow_lock:
+            # Atualiza estatísticas de conexão
+            if conn_key not in self.firewall.flow_cache:
+                self.firewall.flow_cache[conn_key] = {
+                    'ports': set(),
+                    'count': 0,
+                    'start_time': time.time(),
+                    'first_port': dst_port
+                }
+                
+            conn = self.firewall.flow_cache[conn_key]
+            conn['count'] += 1
+            conn['ports'].add(dst_port)
+            
             # Critérios para portscan
             if len(conn['ports']) > 5 and conn['count'] > 10:
                 current_time = time.time()
@@ -358,14 +1382,15 @@ class StatisticalAnalyzer:
                     self.firewall.logger.suspicious(
                         "Port scan detectado",
                         ip=src_ip,
-                        port=list(conn['ports'])[0],  # Mostra a primeira porta
+                        port=conn['first_port'],  # Mostra a primeira porta
                         service="Network",
                         suggestion="Investigar origem e considerar bloqueio",
                         additional_data={
                             'port_count': len(conn['ports']),
                             'scan_rate': f"{scan_rate:.2f} ports/sec",
                             'target_ip': pkt[IP].dst
-                        }
+                        },
+                        aggregate=True
                     )
                     
                     return {
@@ -445,7 +1470,8 @@ class StatisticalAnalyzer:
                         'pkt_rate': pkt_rate,
                         'bandwidth': bandwidth,
                         'flags': str(pkt[TCP].flags) if pkt.haslayer(TCP) else None
-                    }
+                    },
+                    aggregate=True
                 )
                 
                 return {
@@ -461,6 +1487,53 @@ class StatisticalAnalyzer:
         
         return None
     
+    def _check_connections(self, pkt, src_ip):
+        """Detecção de SYN flood e conexões lentas por destino via conntrack"""
+        if not pkt.haslayer(TCP):
+            return None
+            
+        tcp = pkt[TCP]
+        dst_ip = pkt[IP].dst
+        payload_len = len(tcp.payload) if tcp.payload else 0
+        conntrack = self.firewall.conntrack
+        state = conntrack.update(src_ip, dst_ip, tcp.sport, tcp.dport, tcp.flags, payload_len)
+        
+        thresholds = self.firewall.ddos_thresholds
+        half_open = conntrack.half_open(dst_ip)
+        slow = conntrack.slow_connections(dst_ip)
+        reasons = []
+        score = 0
+        
+        # Pontua apenas quem contribui com conexões semiabertas
+        if half_open > thresholds['half_open'] and state == ConnectionTracker.SYN_SENT:
+            score += 40
+            reasons.append(f"SYN flood no destino ({half_open} conexões semiabertas)")
+            
+        if slow > thresholds['slow_connections'] and state == ConnectionTracker.ESTABLISHED:
+            score += 30
+            reasons.append(f"Conexões lentas no destino ({slow} conexões)")
+            
+        if score == 0:
+            return None
+            
+        details = conntrack.destination_stats(dst_ip)
+        self.firewall.logger.attack(
+            "Possível ataque de exaustão de conexões",
+            ip=dst_ip,
+            port=tcp.dport,
+            service="Network",
+            suggestion="Ativar SYN cookies e limitar conexões por destino",
+            additional_data=details,
+            aggregate=True
+        )
+        
+        return {
+            'block': False,
+            'reason': "; ".join(reasons),
+            'score': score,
+            'details': {'conntrack': details}
+        }
+    
     def _check_unusual_protocols(self, pkt):
         """Detecta protocolos incomuns ou configurações suspeitas"""
         if not pkt.haslayer(IP):
@@ -514,9 +1587,10 @@ class StatisticalAnalyzer:
             if not raw_data:
                 return None
                 
-            # Verifica protocolo HTTP
-            if b"HTTP/" in raw_data or b"GET " in raw_data or b"POST " in raw_data:
-                return self._analyze_http(pkt, raw_data)
+            # Verifica protocolo HTTP (requisição indexada uma única vez)
+            request = HTTPRequest.parse(raw_data)
+            if request is not None:
+                return self._analyze_http(pkt, request)
                 
             # Verifica protocolo DNS
             if pkt.haslayer(UDP) and pkt[UDP].dport == 53:
@@ -532,45 +1606,44 @@ class StatisticalAnalyzer:
             
         return None
     
-    def _analyze_http(self, pkt, raw_data):
-        """Análise profunda de tráfego HTTP"""
+    def _analyze_http(self, pkt, request):
+        """Análise profunda de tráfego HTTP sobre a requisição já indexada"""
         try:
-            payload_str = raw_data.decode(errors='ignore')
             result = {'score': 0, 'details': {}}
+            reasons = []
             
             # Verifica User-Agent suspeitos
-            if "User-Agent:" in payload_str:
-                user_agent = payload_str.split("User-Agent:")[1].split("\r\n")[0].strip()
-                if self._is_malicious_user_agent(user_agent):
-                    result['score'] += 70
-                    result['details']['malicious_ua'] = user_agent
-                    result['reason'] = f"User-Agent malicioso: {user_agent}"
-            
-            # Verifica padrões de ataque
+            user_agent = request.header('user-agent')
+            if user_agent and self._is_malicious_user_agent(user_agent):
+                result['score'] += 70
+                result['details']['malicious_ua'] = user_agent
+                reasons.append(f"User-Agent malicioso: {user_agent}")
+            
+            # Verifica padrões de ataque sobre URI, cabeçalhos e corpo decodificados
+            inspection_text = request.inspection_text()
             for threat_type, pattern in self.http_patterns.items():
-                if pattern.search(payload_str):
+                if pattern.search(inspection_text):
                     result['score'] += 80
-                    if 'reason' in result:
-                        result['reason'] += f"; Ataque {threat_type.upper()} detectado"
-                    else:
-                        result['reason'] = f"Ataque {threat_type.upper()} detectado"
+                    reasons.append(f"Ataque {threat_type.upper()} detectado")
                     result['details'][threat_type] = True
                     result['block'] = True
             
-            # Verifica caminhos suspeitos
-            suspicious_paths = [
-                r'/admin', r'/wp-admin', r'/console', 
-                r'/\.env', r'/phpmyadmin', r'/\.git'
-            ]
+            # Verifica path traversal (inclusive codificado, ex.: %2e%2e)
+            if request.traversal:
+                result['score'] += 70
+                reasons.append("Tentativa de path traversal")
+                result['details']['path_traversal'] = request.raw_uri
             
-            for path in suspicious_paths:
-                if re.search(rf'GET\s+{path}', payload_str, re.I):
+            # Verifica caminhos suspeitos na URI normalizada
+            path = request.path
+            for suspicious_path in self.suspicious_paths:
+                if path.startswith(suspicious_path):
                     result['score'] += 50
-                    if 'reason' in result:
-                        result['reason'] += f"; Acesso a caminho suspeito: {path}"
-                    else:
-                        result['reason'] = f"Acesso a caminho suspeito: {path}"
-                    result['details']['suspicious_path'] = path
+                    reasons.append(f"Acesso a caminho suspeito: {suspicious_path}")
+                    result['details']['suspicious_path'] = suspicious_path
+            
+            if reasons:
+                result['reason'] = "; ".join(reasons)
             
             if result['score'] > 0:
                 # Log de ataque HTTP
@@ -654,6 +1727,98 @@ class StatisticalAnalyzer:
         ]
         return any(agent in user_agent.lower() for agent in malicious_agents)
 
+class ReputationTable:
+    """Reputação por IP de origem com decaimento exponencial e memória limitada"""
+    
+    def __init__(self, capacity: int = 65536, half_life: float = 300.0):
+        self.capacity = capacity
+        self.half_life = half_life
+        
+        # Armazenamento em arrays: cada IP ocupa um slot fixo
+        self._scores = np.zeros(capacity, dtype=np.float64)
+        self._updated = np.zeros(capacity, dtype=np.float64)
+        self._ips = [None] * capacity
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self.lock = threading.Lock()
+    
+    def add(self, ip: str, evidence: float, now: Optional[float] = None) -> float:
+        """Soma evidência à reputação do IP e retorna o valor acumulado"""
+        now = time.time() if now is None else now
+        with self.lock:
+            slot = self._slots.get(ip)
+            if slot is None:
+                slot = self._allocate(ip, now)
+                self._scores[slot] = evidence
+            else:
+                self._scores[slot] = self._decayed(slot, now) + evidence
+            self._updated[slot] = now
+            return float(self._scores[slot])
+    
+    def score(self, ip: str, now: Optional[float] = None) -> float:
+        """Reputação atual (com decaimento) de um IP"""
+        now = time.time() if now is None else now
+        with self.lock:
+            slot = self._slots.get(ip)
+            return self._decayed(slot, now) if slot is not None else 0.0
+    
+    def reset(self, ip: str):
+        """Remove o IP da tabela (ex.: após desbloqueio manual)"""
+        with self.lock:
+            slot = self._slots.pop(ip, None)
+            if slot is not None:
+                self._release(slot)
+    
+    def top(self, n: int = 10, now: Optional[float] = None):
+        """Lista os n IPs de maior risco como [(ip, score), ...]"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self._slots or n <= 0:
+                return []
+                
+            occupied = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            scores = self._scores[occupied] * np.exp2((self._updated[occupied] - now) / self.half_life)
+            
+            if n < len(occupied):
+                best = np.argpartition(scores, -n)[-n:]
+            else:
+                best = np.arange(len(occupied))
+            best = best[np.argsort(scores[best])[::-1]]
+            
+            return [(self._ips[occupied[i]], float(scores[i])) for i in best]
+    
+    def __len__(self):
+        return len(self._slots)
+    
+    def _decayed(self, slot, now):
+        elapsed = max(now - self._updated[slot], 0.0)
+        return float(self._scores[slot] * 2.0 ** (-elapsed / self.half_life))
+    
+    def _allocate(self, ip, now):
+        """Obtém um slot livre, despejando os IPs de menor reputação se necessário"""
+        if not self._free:
+            self._evict(now)
+        slot = self._free.pop()
+        self._slots[ip] = slot
+        self._ips[slot] = ip
+        return slot
+    
+    def _evict(self, now):
+        """Libera em lote 1/16 da capacidade com as menores reputações"""
+        count = max(self.capacity // 16, 1)
+        scores = self._scores * np.exp2((self._updated - now) / self.half_life)
+        for slot in np.argpartition(scores, count - 1)[:count]:
+            ip = self._ips[slot]
+            if ip is not None:
+                del self._slots[ip]
+                self._release(int(slot))
+    
+    def _release(self, slot):
+        self._ips[slot] = None
+        self._scores[slot] = 0.0
+        self._updated[slot] = 0.0
+        self._free.append(slot)
+
 class AnalysisPipeline:
     """Pipeline de análise com early termination e priorização de etapas"""
     
@@ -690,7 +1855,8 @@ class AnalysisPipeline:
             'critical': 100,
             'high': 80,
             'medium': 50,
-            'low': 30
+            'low': 30,
+            'reputation': 150
         }
         
         # Cache para otimização
@@ -702,6 +1868,7 @@ class AnalysisPipeline:
         """Processa o pacote através do pipeline com early termination"""
         result = {
             'block': False,
+            'ip': None,  # Alvo da reputação e do bloqueio (padrão: origem do pacote)
             'reason': [],
             'score': 0,
             'details': {}
@@ -713,8 +1880,12 @@ class AnalysisPipeline:
                 if step_result:
                     # Atualiza resultado com informações da etapa
                     result['score'] += step_result.get('score', 0)
-                    if step_result.get('block', False):
+                    # Apenas evidências conclusivas bloqueiam de imediato;
+                    # as demais passam pela reputação acumulada da origem
+                    if step_result.get('conclusive', False):
                         result['block'] = True
+                    if step_result.get('ip') and result['ip'] is None:
+                        result['ip'] = step_result['ip']
                     if 'reason' in step_result:
                         result['reason'].append(step_result['reason'])
                     if 'details' in step_result:
@@ -735,10 +1906,16 @@ class AnalysisPipeline:
                     }
                 )
         
-        # Toma decisão baseada no score acumulado
-        if not result['block'] and result['score'] >= self.thresholds['high']:
-            result['block'] = True
-            result['reason'].append(f"Score acumulado alto: {result['score']}")
+        # Toma decisão baseada na reputação acumulada da origem
+        if result['ip'] is None and pkt.haslayer(IP):
+            result['ip'] = pkt[IP].src
+        if result['score'] > 0 and result['ip'] is not None:
+            reputation = self.firewall.reputation.add(result['ip'], result['score'])
+            result['details']['reputation'] = round(reputation, 2)
+            
+            if not result['block'] and reputation >= self.thresholds['reputation']:
+                result['block'] = True
+                result['reason'].append(f"Reputação acumulada alta: {reputation:.0f}")
         
         return result
     
@@ -754,10 +1931,12 @@ class AnalysisPipeline:
             self.firewall.logger.info(
                 "Pacote de IP bloqueado descartado",
                 ip=src_ip,
-                service="ACL"
+                service="ACL",
+                aggregate=True
             )
             return {
                 'block': True,
+                'conclusive': True,
                 'reason': 'IP bloqueado via ACL',
                 'score': 100,
                 'details': {'ip': src_ip, 'stage': 'pre-filter'}
@@ -765,13 +1944,346 @@ class AnalysisPipeline:
             
         return None
     
+# Colunas (e ordem) do CSE-CIC-IDS2018 usadas no treino do modelo (treinocgb.py)
+CIC_FLOW_FEATURES = (
+    'Dst Port', 'Protocol', 'Flow Duration', 'Tot Fwd Pkts', 'TotLen Fwd Pkts',
+    'Fwd Pkt Len Max', 'Fwd Pkt Len Min', 'Fwd Pkt Len Mean', 'Fwd Pkt Len Std',
+    'Bwd Pkt Len Max', 'Bwd Pkt Len Min', 'Bwd Pkt Len Mean', 'Bwd Pkt Len Std',
+    'Flow Pkts/s', 'Flow IAT Max', 'Fwd IAT Tot', 'Fwd IAT Max', 'Bwd IAT Tot',
+    'Bwd IAT Mean', 'Bwd IAT Std', 'Bwd IAT Max', 'Bwd IAT Min', 'Fwd Header Len',
+    'Fwd Pkts/s', 'Bwd Pkts/s', 'Pkt Len Min', 'Pkt Len Max', 'Pkt Len Mean',
+    'Pkt Len Std', 'RST Flag Cnt', 'PSH Flag Cnt', 'ACK Flag Cnt', 'URG Flag Cnt',
+    'ECE Flag Cnt', 'Down/Up Ratio', 'Pkt Size Avg', 'Fwd Seg Size Avg',
+    'Bwd Seg Size Avg', 'Subflow Fwd Pkts', 'Subflow Fwd Byts', 'Init Fwd Win Byts',
+    'Init Bwd Win Byts', 'Fwd Act Data Pkts', 'Fwd Seg Size Min', 'Active Mean',
+    'Active Std', 'Active Max', 'Active Min', 'Idle Max', 'Idle Min'
+)
+
+class RunningStats:
+    """Estatísticas incrementais (Welford) com custo O(1) por amostra"""
+    
+    __slots__ = ('n', 'total', 'mean', 'm2', 'low', 'high')
+    
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.low = 0.0
+        self.high = 0.0
+    
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        if self.n == 1 or value < self.low:
+            self.low = value
+        if self.n == 1 or value > self.high:
+            self.high = value
+    
+    def copy(self):
+        clone = RunningStats()
+        clone.n, clone.total, clone.mean = self.n, self.total, self.mean
+        clone.m2, clone.low, clone.high = self.m2, self.low, self.high
+        return clone
+    
+    @property
+    def std(self):
+        # Desvio padrão amostral, como o SummaryStatistics usado pelo CICFlowMeter
+        return (self.m2 / (self.n - 1)) ** 0.5 if self.n > 1 else 0.0
+
+class RunningTotal:
+    """Só contagem e soma: para features que usam apenas n ou total"""
+    
+    __slots__ = ('n', 'total')
+    low = high = std = 0.0
+    
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+    
+    def add(self, value):
+        self.n += 1
+        self.total += value
+    
+    def copy(self):
+        clone = RunningTotal()
+        clone.n, clone.total = self.n, self.total
+        return clone
+    
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+class NullStats:
+    """Acumulador descartado: nenhuma feature do modelo o utiliza"""
+    
+    __slots__ = ()
+    n = 0
+    total = mean = low = high = std = 0.0
+    
+    def add(self, value):
+        pass
+    
+    def copy(self):
+        return self
+
+NULL_STATS = NullStats()
+
+# Acumuladores de CICFlow exigidos por feature: 'total' (n/soma) ou 'stats' (média, min/máx/desvio).
+# Médias usam 'stats': a média de Welford difere de soma/n nos últimos bits
+FEATURE_ACCUMULATORS = {
+    'Tot Fwd Pkts': {'fwd_len': 'total'},
+    'TotLen Fwd Pkts': {'fwd_len': 'total'},
+    'Fwd Pkt Len Max': {'fwd_len': 'stats'},
+    'Fwd Pkt Len Min': {'fwd_len': 'stats'},
+    'Fwd Pkt Len Mean': {'fwd_len': 'stats'},
+    'Fwd Pkt Len Std': {'fwd_len': 'stats'},
+    'Bwd Pkt Len Max': {'bwd_len': 'stats'},
+    'Bwd Pkt Len Min': {'bwd_len': 'stats'},
+    'Bwd Pkt Len Mean': {'bwd_len': 'stats'},
+    'Bwd Pkt Len Std': {'bwd_len': 'stats'},
+    'Flow IAT Max': {'flow_iat': 'stats'},
+    'Fwd IAT Tot': {'fwd_iat': 'total'},
+    'Fwd IAT Max': {'fwd_iat': 'stats'},
+    'Bwd IAT Tot': {'bwd_iat': 'total'},
+    'Bwd IAT Mean': {'bwd_iat': 'stats'},
+    'Bwd IAT Std': {'bwd_iat': 'stats'},
+    'Bwd IAT Max': {'bwd_iat': 'stats'},
+    'Bwd IAT Min': {'bwd_iat': 'stats'},
+    'Fwd Pkts/s': {'fwd_len': 'total'},
+    'Bwd Pkts/s': {'bwd_len': 'total'},
+    'Pkt Len Min': {'all_len': 'stats'},
+    'Pkt Len Max': {'all_len': 'stats'},
+    'Pkt Len Mean': {'all_len': 'stats'},
+    'Pkt Len Std': {'all_len': 'stats'},
+    'Down/Up Ratio': {'fwd_len': 'total', 'bwd_len': 'total'},
+    'Fwd Seg Size Avg': {'fwd_len': 'stats'},
+    'Bwd Seg Size Avg': {'bwd_len': 'stats'},
+    'Subflow Fwd Pkts': {'fwd_len': 'total'},
+    'Subflow Fwd Byts': {'fwd_len': 'total'},
+    'Active Mean': {'active': 'stats'},
+    'Active Std': {'active': 'stats'},
+    'Active Max': {'active': 'stats'},
+    'Active Min': {'active': 'stats'},
+    'Idle Max': {'idle': 'stats'},
+    'Idle Min': {'idle': 'stats'}
+}
+
+def flow_accumulators(columns=None):
+    """Classe de cada acumulador de CICFlow para calcular as colunas pedidas (None = todas)"""
+    if columns is None:
+        columns = CIC_FLOW_FEATURES
+    # all_len conta os pacotes do fluxo (gatilho antecipado): nunca é descartado
+    levels = {'all_len': 'total'}
+    for name in columns:
+        for group, level in FEATURE_ACCUMULATORS.get(name, {}).items():
+            if levels.get(group) != 'stats':
+                levels[group] = level
+    kinds = {'total': RunningTotal, 'stats': RunningStats}
+    return {
+        group: kinds[levels[group]] if group in levels else None
+        for group in ('fwd_len', 'bwd_len', 'all_len', 'flow_iat', 'fwd_iat', 'bwd_iat', 'active', 'idle')
+    }
+
+class CICFlow:
+    """Fluxo bidirecional com as features do CICFlowMeter mantidas incrementalmente"""
+    
+    ACTIVITY_TIMEOUT = 5e6  # µs sem pacotes para encerrar um período ativo
+    SUBFLOW_GAP = 1e6       # µs sem pacotes para iniciar um novo subfluxo
+    
+    TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG, TCP_ECE = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40
+    
+    __slots__ = (
+        'src', 'dst', 'sport', 'dport', 'proto',
+        'start', 'last', 'last_fwd', 'last_bwd',
+        'fwd_len', 'bwd_len', 'all_len', 'flow_iat', 'fwd_iat', 'bwd_iat',
+        'active', 'idle', 'start_active', 'end_active',
+        'fwd_header', 'fwd_header_min', 'fwd_data_pkts', 'subflows',
+        'init_fwd_win', 'init_bwd_win', 'rst', 'psh', 'ack', 'urg', 'ece', 'fin'
+    )
+    
+    def __init__(self, src, dst, sport, dport, proto, ts, accumulators=None):
+        # O sentido "forward" é o do primeiro pacote visto
+        self.src, self.dst, self.sport, self.dport, self.proto = src, dst, sport, dport, proto
+        self.start = self.last = ts
+        self.last_fwd = self.last_bwd = None
+        if accumulators is None:
+            self.fwd_len, self.bwd_len, self.all_len = RunningStats(), RunningStats(), RunningStats()
+            self.flow_iat, self.fwd_iat, self.bwd_iat = RunningStats(), RunningStats(), RunningStats()
+            self.active, self.idle = RunningStats(), RunningStats()
+        else:
+            # Só o que o modelo usa (flow_accumulators); o resto sai zerado em features()
+            for group, kind in accumulators.items():
+                setattr(self, group, kind() if kind is not None else NULL_STATS)
+        self.start_active = self.end_active = ts
+        self.fwd_header = 0
+        self.fwd_header_min = 0
+        self.fwd_data_pkts = 0
+        self.subflows = 1
+        self.init_fwd_win = self.init_bwd_win = -1
+        self.rst = self.psh = self.ack = self.urg = self.ece = self.fin = 0
+    
+    def add_packet(self, forward, ts, payload_len, header_len, flags=0, window=None):
+        """Atualiza o fluxo com um pacote (ts em µs, comprimentos em bytes de payload)"""
+        if self.all_len.n:
+            gap = ts - self.last
+            self.flow_iat.add(gap)
+            if gap > self.SUBFLOW_GAP:
+                self.subflows += 1
+            # Períodos ativos/ociosos (updateActiveIdleTime do CICFlowMeter)
+            if ts - self.end_active > self.ACTIVITY_TIMEOUT:
+                if self.end_active - self.start_active > 0:
+                    self.active.add(self.end_active - self.start_active)
+                self.idle.add(ts - self.end_active)
+                self.start_active = ts
+            self.end_active = ts
+        self.last = ts
+        self.all_len.add(payload_len)
+        
+        if forward:
+            if self.last_fwd is not None:
+                self.fwd_iat.add(ts - self.last_fwd)
+            else:
+                self.fwd_header_min = header_len
+                if window is not None:
+                    self.init_fwd_win = window
+            self.last_fwd = ts
+            self.fwd_len.add(payload_len)
+            self.fwd_header += header_len
+            self.fwd_header_min = min(self.fwd_header_min, header_len)
+            if payload_len > 0:
+                self.fwd_data_pkts += 1
+        else:
+            if self.last_bwd is not None:
+                self.bwd_iat.add(ts - self.last_bwd)
+            elif window is not None:
+                self.init_bwd_win = window
+            self.last_bwd = ts
+            self.bwd_len.add(payload_len)
+            
+        if flags:
+            self.fin += bool(flags & self.TCP_FIN)
+            self.rst += bool(flags & self.TCP_RST)
+            self.psh += bool(flags & self.TCP_PSH)
+            self.ack += bool(flags & self.TCP_ACK)
+            self.urg += bool(flags & self.TCP_URG)
+            self.ece += bool(flags & self.TCP_ECE)
+    
+    @property
+    def packets(self):
+        return self.all_len.n
+    
+    def features(self):
+        """Vetor float32 na ordem de CIC_FLOW_FEATURES (sem alterar o estado do fluxo)"""
+        duration = self.last - self.start
+        seconds = duration / 1e6
+        fwd, bwd, total = self.fwd_len, self.bwd_len, self.all_len
+        
+        # O período ativo corrente conta como encerrado no momento da extração
+        active = self.active
+        if self.end_active - self.start_active > 0:
+            active = active.copy()
+            active.add(self.end_active - self.start_active)
+            
+        return np.array((
+            self.dport, self.proto, duration, fwd.n, fwd.total,
+            fwd.high, fwd.low, fwd.mean, fwd.std,
+            bwd.high, bwd.low, bwd.mean, bwd.std,
+            total.n / seconds if seconds > 0 else 0.0,
+            self.flow_iat.high, self.fwd_iat.total, self.fwd_iat.high, self.bwd_iat.total,
+            self.bwd_iat.mean, self.bwd_iat.std, self.bwd_iat.high, self.bwd_iat.low, self.fwd_header,
+            fwd.n / seconds if seconds > 0 else 0.0,
+            bwd.n / seconds if seconds > 0 else 0.0,
+            total.low, total.high, total.mean,
+            total.std, self.rst, self.psh, self.ack, self.urg,
+            self.ece, bwd.n // fwd.n if fwd.n else 0, total.total / total.n if total.n else 0.0, fwd.mean,
+            bwd.mean, fwd.n / self.subflows, fwd.total / self.subflows, self.init_fwd_win,
+            self.init_bwd_win, self.fwd_data_pkts, self.fwd_header_min, active.mean,
+            active.std, active.high, active.low, self.idle.high, self.idle.low
+        ), dtype=np.float32)
+
+class FlowTable:
+    """Fluxos ativos em formato colunar: features numéricas num array NumPy e
+    identificadores em arrays paralelos, uma linha por fluxo.
+    
+    A última coluna de features é sempre 0 (destino das colunas do modelo que o
+    extrator não conhece). Só o job em lote escreve na tabela.
+    """
+    
+    def __init__(self, n_features=len(CIC_FLOW_FEATURES), capacity=1024):
+        self.n_features = n_features
+        self.rows = {}    # chave do fluxo -> linha
+        self._free = []   # Linhas de fluxos encerrados, reaproveitadas
+        self._used = 0
+        self.features = np.zeros((capacity, n_features + 1), dtype=np.float32)
+        self.src = np.empty(capacity, dtype=object)
+        self.dst = np.empty(capacity, dtype=object)
+        self.sport = np.zeros(capacity, dtype=np.int32)
+        self.dport = np.zeros(capacity, dtype=np.int32)
+        self.proto = np.zeros(capacity, dtype=np.int32)
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def _grow(self):
+        """Dobra a capacidade de todas as colunas"""
+        for name in ('features', 'src', 'dst', 'sport', 'dport', 'proto'):
+            column = getattr(self, name)
+            grown = np.zeros((len(column) * 2,) + column.shape[1:], dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+    
+    def upsert(self, key, flow, features):
+        """Grava o vetor do fluxo (inserindo se for novo) e retorna a linha"""
+        row = self.rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._used == len(self.features):
+                    self._grow()
+                row = self._used
+                self._used += 1
+            self.rows[key] = row
+        # Após um active_timeout a mesma chave pode ter outro sentido "forward"
+        self.src[row], self.dst[row] = flow.src, flow.dst
+        self.sport[row], self.dport[row], self.proto[row] = flow.sport, flow.dport, flow.proto
+        self.features[row, :-1] = features
+        return row
+    
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.features[row] = 0
+            self.src[row] = self.dst[row] = None
+            self._free.append(row)
+
 class NetworkFeatureExtractor:
-    """Extrator aprimorado de features de rede"""
+    """Extrator de features de fluxo compatível com o CICFlowMeter (modelo treinado)"""
     
-    def __init__(self, window_size=10):
-        self.window_size = window_size
-        self.flows = {}
+    def __init__(self, idle_timeout=60.0, active_timeout=120.0, early_packets=10):
+        # Ordenado pela última atividade: os ociosos ficam no início
+        self.flows = OrderedDict()
         self.lock = threading.Lock()
+        self.idle_timeout = idle_timeout * 1e6      # µs sem pacotes para encerrar o fluxo
+        self.active_timeout = active_timeout * 1e6  # µs de duração máxima (flow timeout do CICFlowMeter)
+        self.early_packets = early_packets          # pacotes até a checagem antecipada
+        self.accumulators = None                    # None = todas as features de CIC_FLOW_FEATURES
+        self.table = FlowTable()                    # Visão colunar para o job em lote
+        self._changed = set()                       # Fluxos alterados desde a última sincronização
+        self.track_changes = False                  # Só registra alterações com o job em lote agendado
+        self._last_ts = 0.0
+        self._next_sweep = 0.0
+    
+    def use_features(self, columns):
+        """Restringe os acumuladores dos novos fluxos às colunas usadas pelo modelo.
+        
+        Fluxos já abertos mantêm os acumuladores com que foram criados.
+        """
+        self.accumulators = flow_accumulators(columns) if columns is not None else None
         
     def packet_to_features(self, pkt):
         """Extrai features de um único pacote"""
@@ -806,102 +2318,119 @@ class NetworkFeatureExtractor:
         return features
     
     def update_flow_stats(self, pkt):
-        """Atualiza estatísticas de fluxo para um pacote"""
+        """Atualiza o fluxo do pacote e retorna (fluxo, evento) para TCP/UDP.
+        
+        Eventos: 'early' (primeiros pacotes), 'fin'/'rst' e 'active_timeout'; fluxos
+        encerrados já saem de self.flows.
+        """
         if not pkt.haslayer(IP):
-            return
+            return None, None
             
-        flow_key = self._get_flow_key(pkt)
-        if not flow_key:
-            return
+        ip = pkt[IP]
+        if ip.haslayer(TCP):
+            layer = ip[TCP]
+            header_len = layer.dataofs * 4 if layer.dataofs else 20
+            flags, window = int(layer.flags), layer.window
+        elif ip.haslayer(UDP):
+            layer = ip[UDP]
+            header_len, flags, window = 8, 0, None
+        else:
+            return None, None
             
+        # CICFlowMeter mede comprimentos pelo payload da camada de transporte;
+        # pelos cabeçalhos evita serializar o payload (e ignora o padding Ethernet)
+        if ip.len is not None and ip.ihl is not None:
+            payload_len = max(ip.len - ip.ihl * 4 - header_len, 0)
+        else:
+            payload_len = len(layer.payload)
+        ts = float(pkt.time) * 1e6
+        if (ip.src, layer.sport) > (ip.dst, layer.dport):
+            flow_key = (ip.dst, ip.src, layer.dport, layer.sport, ip.proto)
+        else:
+            flow_key = (ip.src, ip.dst, layer.sport, layer.dport, ip.proto)
+        
         with self.lock:
-            if flow_key not in self.flows:
-                self.flows[flow_key] = {
-                    'start_time': time.time(),
-                    'packet_count': 0,
-                    'total_bytes': 0,
-                    'packet_lengths': [],
-                    'inter_arrivals': [],
-                    'last_time': time.time(),
-                    'flags': set()
-                }
-                
-            flow = self.flows[flow_key]
-            
-            # Atualiza estatísticas
-            current_time = time.time()
-            pkt_len = len(pkt)
-            
-            flow['packet_count'] += 1
-            flow['total_bytes'] += pkt_len
-            flow['packet_lengths'].append(pkt_len)
-            flow['inter_arrivals'].append(current_time - flow['last_time'])
-            flow['last_time'] = current_time
+            self._last_ts = max(self._last_ts, ts)
+            finished = None
+            flow = self.flows.get(flow_key)
+            if flow is not None and ts - flow.start > self.active_timeout:
+                # Como no CICFlowMeter: o fluxo é emitido e outro começa neste pacote
+                finished = self.flows.pop(flow_key)
+                flow = None
+            if flow is None:
+                flow = CICFlow(ip.src, ip.dst, layer.sport, layer.dport, ip.proto, ts, self.accumulators)
+                self.flows[flow_key] = flow
+            else:
+                self.flows.move_to_end(flow_key)
+            forward = ip.src == flow.src and layer.sport == flow.sport
+            flow.add_packet(forward, ts, payload_len, header_len, flags, window)
+            if self.track_changes:
+                self._changed.add(flow_key)
             
-            if pkt.haslayer(TCP):
-                flow['flags'].add(pkt[TCP].flags)
+            if finished is not None:
+                return finished, 'active_timeout'
+            if flags & (CICFlow.TCP_FIN | CICFlow.TCP_RST):
+                del self.flows[flow_key]
+                return flow, 'rst' if flags & CICFlow.TCP_RST else 'fin'
+            if flow.packets == self.early_packets:
+                return flow, 'early'
                 
-            # Mantém apenas o tamanho da janela
-            if len(flow['packet_lengths']) > self.window_size:
-                flow['packet_lengths'] = flow['packet_lengths'][-self.window_size:]
-                flow['inter_arrivals'] = flow['inter_arrivals'][-self.window_size:]
+        return flow, None
     
-    def get_flow_features(self, flow_key):
-        """Obtém features consolidadas de um fluxo"""
+    def expire_idle(self, force=False):
+        """Remove e retorna os fluxos ociosos (varredura no máximo uma vez por segundo)"""
         with self.lock:
-            if flow_key not in self.flows:
-                return None
-                
-            flow = self.flows[flow_key]
+            if not force and self._last_ts < self._next_sweep:
+                return []
+            self._next_sweep = self._last_ts + 1e6
             
-            # Calcula estatísticas
-            if not flow['packet_lengths']:
-                return None
-                
-            mean_pkt_len = np.mean(flow['packet_lengths'])
-            std_pkt_len = np.std(flow['packet_lengths'])
-            mean_iat = np.mean(flow['inter_arrivals'])
-            std_iat = np.std(flow['inter_arrivals'])
-            duration = flow['last_time'] - flow['start_time']
-            byte_rate = flow['total_bytes'] / duration if duration > 0 else 0
-            pkt_rate = flow['packet_count'] / duration if duration > 0 else 0
-            
-            features = {
-                'flow_duration': duration,
-                'total_packets': flow['packet_count'],
-                'total_bytes': flow['total_bytes'],
-                'mean_pkt_len': mean_pkt_len,
-                'std_pkt_len': std_pkt_len,
-                'mean_iat': mean_iat,
-                'std_iat': std_iat,
-                'byte_rate': byte_rate,
-                'pkt_rate': pkt_rate,
-                'unique_flags': len(flow['flags']),
-                'src_ip': flow_key[0],
-                'dst_ip': flow_key[1],
-                'src_port': flow_key[2],
-                'dst_port': flow_key[3],
-                'protocol': flow_key[4]
-            }
+            expired = []
+            while self.flows:
+                flow_key, flow = next(iter(self.flows.items()))
+                if self._last_ts - flow.last <= self.idle_timeout:
+                    break
+                del self.flows[flow_key]
+                if self.track_changes:
+                    self._changed.add(flow_key)
+                expired.append(flow)
+            return expired
+    
+    def sync_table(self):
+        """Atualiza a tabela colunar com os fluxos alterados desde a última chamada.
+        
+        Retorna as linhas atualizadas; fluxos encerrados saem da tabela. Os vetores são
+        calculados fora do lock para não travar a captura.
+        """
+        with self.lock:
+            changed, self._changed = self._changed, set()
+            live = [(key, self.flows.get(key)) for key in changed]
             
-            return features
+        rows = []
+        for key, flow in live:
+            if flow is None:
+                self.table.remove(key)
+            else:
+                rows.append(self.table.upsert(key, flow, flow.features()))
+        return np.array(rows, dtype=np.intp)
+    
+    def get_flow_features(self, flow_key):
+        """Vetor float32 do fluxo na ordem de CIC_FLOW_FEATURES"""
+        with self.lock:
+            flow = self.flows.get(flow_key)
+            return flow.features() if flow is not None else None
     
     def get_feature_dataframe(self):
         """Consolida os dados dos fluxos em um DataFrame para análise em lote"""
         with self.lock:
-            data = []
-            for flow_key in self.flows:
-                features = self.get_flow_features(flow_key)
-                if features:
-                    data.append(features)
-                
-            if not data:
-                return pd.DataFrame()
+            keys = list(self.flows)
+            rows = [self.flows[key].features() for key in keys]
             
-            return pd.DataFrame(data)
+        if not rows:
+            return pd.DataFrame(columns=list(CIC_FLOW_FEATURES))
+        return pd.DataFrame(np.vstack(rows), columns=list(CIC_FLOW_FEATURES), index=keys)
             
     def _get_flow_key(self, pkt):
-        """Gera uma chave única para o fluxo"""
+        """Gera uma chave única para o fluxo (a mesma nos dois sentidos)"""
         if not pkt.haslayer(IP):
             return None
             
@@ -919,80 +2448,955 @@ class NetworkFeatureExtractor:
             src_port = 0
             dst_port = 0
             
+        if (src_ip, src_port) > (dst_ip, dst_port):
+            return (dst_ip, src_ip, dst_port, src_port, proto)
         return (src_ip, dst_ip, src_port, dst_port, proto)
 
+class CompiledTreeModel:
+    """Ensemble de árvores (XGBoost ou RandomForest) achatado em arrays NumPy contíguos.
+    
+    Todas as árvores compartilham os mesmos arrays de nós; a travessia avança um nível
+    de todas as árvores para todas as linhas do lote por iteração.
+    """
+    
+    def __init__(self, left, right, feature, threshold, default_left, values,
+                 roots, depth, n_features, classes, kind, feature_names=None,
+                 tree_class=None, base_margin=None, objective=None):
+        self.left = left                  # Filho esquerdo (folhas apontam para si mesmas)
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left  # Sentido dos valores ausentes (NaN)
+        self.values = values              # Valor de folha: escalar (XGBoost) ou vetor de classes (RF)
+        self.roots = roots
+        self.depth = depth
+        self.n_features_in_ = n_features
+        self.classes_ = classes
+        self.kind = kind
+        self.tree_class = tree_class
+        self.base_margin = base_margin
+        self.objective = objective
+        # Filhos intercalados (direito, esquerdo): o próximo nó é _children[2 * nó + vai_esquerda]
+        self._children = np.column_stack((right, left)).ravel()
+        if tree_class is not None:
+            # Matriz árvore→classe: a soma por classe vira um único produto matricial
+            self._class_matrix = np.zeros((len(tree_class), len(base_margin)))
+            self._class_matrix[np.arange(len(tree_class)), tree_class] = 1.0
+        if feature_names:
+            self.feature_names_in_ = np.array(feature_names, dtype=object)
+    
+    @classmethod
+    def compile(cls, model):
+        """Compila um Booster/XGBClassifier, um RandomForestClassifier ou um arquivo de modelo"""
+        if isinstance(model, str):
+            return cls.load(model)
+        if hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+            return cls.from_sklearn(model)
+        return cls.from_xgboost(model)
+    
+    @classmethod
+    def load(cls, path):
+        if path.endswith(('.pkl', '.joblib')):
+            import joblib
+            return cls.from_sklearn(joblib.load(path))
+        return cls.from_xgboost(path)
+    
+    @classmethod
+    def from_xgboost(cls, source):
+        """Lê o dump JSON do booster (arquivo .json ou modelo carregado pelo xgboost)"""
+        if isinstance(source, str) and source.endswith('.json'):
+            with open(source, 'r') as f:
+                dump = json.load(f)
+        else:
+            import xgboost as xgb
+            booster = source
+            if isinstance(source, str):
+                booster = xgb.Booster()
+                booster.load_model(source)
+            elif hasattr(source, 'get_booster'):
+                booster = source.get_booster()
+            dump = json.loads(booster.save_raw('json'))
+            
+        learner = dump['learner']
+        objective = learner['objective']['name']
+        params = learner['learner_model_param']
+        booster = learner['gradient_booster']
+        weights = None
+        if booster['name'] == 'dart':
+            weights = booster['weight_drop']
+            booster = booster['gbtree']
+        elif booster['name'] != 'gbtree':
+            raise ValueError(f"Booster não suportado: {booster['name']}")
+        trees = booster['model']['trees']
+        tree_info = booster['model']['tree_info']
+        
+        if objective in ('multi:softprob', 'multi:softmax'):
+            n_outputs = int(params['num_class'])
+        elif objective in ('binary:logistic', 'reg:logistic'):
+            n_outputs = 1
+        else:
+            raise ValueError(f"Objetivo não suportado: {objective}")
+            
+        # Early stopping: o XGBClassifier prevê só até best_iteration
+        best_iteration = learner.get('attributes', {}).get('best_iteration')
+        if best_iteration is not None:
+            parallel = int(booster['model']['gbtree_model_param'].get('num_parallel_tree', 1))
+            n_trees = (int(best_iteration) + 1) * n_outputs * parallel
+            trees, tree_info = trees[:n_trees], tree_info[:n_trees]
+            
+        base_score = np.array(json.loads(params['base_score']) if params['base_score'].startswith('[')
+                              else [float(params['base_score'])], dtype=np.float64)
+        if n_outputs == 1:
+            # No JSON o base_score da logística está no espaço de probabilidade
+            base_score = np.log(base_score / (1 - base_score))
+            
+        nodes = []
+        for i, tree in enumerate(trees):
+            if any(tree.get('split_type', [])):
+                raise ValueError("Splits categóricos não são suportados")
+            scale = weights[i] if weights else 1.0
+            nodes.append((
+                tree['left_children'], tree['right_children'], tree['split_indices'],
+                tree['split_conditions'], tree['default_left'],
+                [value * scale for value in tree['split_conditions']]
+            ))
+            
+        compiled = cls._flatten(nodes, np.float32)
+        return cls(
+            *compiled,
+            n_features=int(params['num_feature']),
+            classes=np.arange(max(n_outputs, 2)),
+            kind='xgboost',
+            feature_names=learner.get('feature_names') or None,
+            tree_class=np.array(tree_info, dtype=np.intp),
+            base_margin=base_score if len(base_score) == n_outputs else np.full(n_outputs, base_score[0]),
+            objective=objective
+        )
+    
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compila um RandomForestClassifier ou DecisionTreeClassifier (média das folhas)"""
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None and hasattr(model, 'tree_'):
+            estimators = [model]  # Árvore única (1º estágio da cascata)
+        if estimators is None or not hasattr(model, 'classes_'):
+            raise ValueError("Apenas RandomForestClassifier e DecisionTreeClassifier são suportados")
+            
+        nodes = []
+        for estimator in estimators:
+            tree = estimator.tree_
+            value = tree.value[:, 0, :]
+            # Versões antigas guardam contagens; normaliza para frações por folha
+            value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+            missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+            nodes.append((
+                tree.children_left, tree.children_right, tree.feature,
+                tree.threshold, missing_left, value
+            ))
+            
+        compiled = cls._flatten(nodes, np.float64)
+        names = getattr(model, 'feature_names_in_', None)
+        return cls(
+            *compiled,
+            n_features=model.n_features_in_,
+            classes=model.classes_,
+            kind='sklearn',
+            feature_names=list(names) if names is not None else None
+        )
+    
+    @staticmethod
+    def _flatten(trees, threshold_dtype):
+        """Concatena as árvores em arrays únicos com índices globais"""
+        left, right, feature, threshold, default_left, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree_left, tree_right, tree_feature, tree_threshold, tree_default, tree_values in trees:
+            tree_left = np.asarray(tree_left, dtype=np.intp)
+            tree_right = np.asarray(tree_right, dtype=np.intp)
+            n_nodes = len(tree_left)
+            index = np.arange(n_nodes)
+            leaf = tree_left < 0
+            left.append(np.where(leaf, index, tree_left) + offset)
+            right.append(np.where(leaf, index, tree_right) + offset)
+            feature.append(np.where(leaf, 0, tree_feature))
+            threshold.append(np.asarray(tree_threshold, dtype=threshold_dtype))
+            default_left.append(np.asarray(tree_default, dtype=bool))
+            values.append(np.asarray(tree_values, dtype=np.float64))
+            roots.append(offset)
+            
+            # Profundidade máxima = iterações necessárias para todas as linhas chegarem às folhas
+            level = np.zeros(n_nodes, dtype=np.intp)
+            for node in range(n_nodes):
+                if not leaf[node]:
+                    level[tree_left[node]] = level[tree_right[node]] = level[node] + 1
+            depth = max(depth, int(level.max()))
+            offset += n_nodes
+            
+        return (
+            np.concatenate(left), np.concatenate(right), np.concatenate(feature),
+            np.concatenate(threshold), np.concatenate(default_left), np.concatenate(values),
+            np.array(roots, dtype=np.intp), depth
+        )
+    
+    def leaves(self, X):
+        """Índice da folha alcançada em cada árvore: matriz (linhas, árvores)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        flat = X.ravel()
+        offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        has_missing = bool(np.isnan(flat).any())
+        inclusive = self.kind == 'sklearn'  # sklearn: x <= limiar; XGBoost: x < limiar
+        
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.depth):
+            x = flat.take(offsets + self.feature.take(nodes))
+            threshold = self.threshold.take(nodes)
+            go_left = x <= threshold if inclusive else x < threshold
+            if has_missing:
+                go_left |= np.isnan(x) & self.default_left.take(nodes)
+            nodes = self._children.take(2 * nodes + go_left)
+        return nodes
+    
+    def predict_proba(self, X):
+        values = self.values[self.leaves(X)]
+        if self.kind == 'sklearn':
+            return values.mean(axis=1)
+            
+        # Soma das folhas por classe (tree_info) mais a margem base
+        margins = values @ self._class_matrix + self.base_margin
+        
+        if len(self.base_margin) == 1:
+            positive = 1.0 / (1.0 + np.exp(-margins[:, 0]))
+            return np.column_stack((1.0 - positive, positive))
+        margins -= margins.max(axis=1, keepdims=True)
+        proba = np.exp(margins)
+        return proba / proba.sum(axis=1, keepdims=True)
+    
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def _inference_worker_main(model, n_features, max_batch, slots, input_name, output_name, conn):
+    """Processo de inferência: lê lotes da memória compartilhada e devolve os vereditos"""
+    from multiprocessing import shared_memory
+    
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    rows = np.ndarray((slots, max_batch, n_features), dtype=np.float32, buffer=input_shm.buf)
+    labels = np.ndarray((slots, max_batch), dtype=np.int32, buffer=output_shm.buf)
+    confidences = np.ndarray((slots, max_batch), dtype=np.float32, buffer=output_shm.buf,
+                             offset=slots * max_batch * 4)
+    
+    # Lotes pequenos no avaliador NumPy, como no InferenceBatcher
+    try:
+        compiled = CompiledTreeModel.compile(model)
+    except Exception:
+        compiled = None
+        
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            slot, n = request
+            started = time.process_time()
+            try:
+                batch = rows[slot, :n]
+                if compiled is not None and n <= 16:
+                    proba = compiled.predict_proba(batch)
+                else:
+                    proba = model.predict_proba(batch)
+                labels[slot, :n] = proba.argmax(axis=1)
+                confidences[slot, :n] = proba[np.arange(n), labels[slot, :n]]
+                error = None
+            except Exception as e:
+                error = str(e)
+            conn.send((slot, n, time.process_time() - started, error))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del rows, labels, confidences
+        input_shm.close()
+        output_shm.close()
+
+class InferenceWorkerPool:
+    """Hospeda o modelo em processos dedicados, fora do GIL da captura.
+    
+    Cada worker tem buffers de entrada/saída em memória compartilhada divididos em
+    slots; o processo principal copia o lote para um slot livre, envia apenas
+    (slot, linhas) pelo pipe e recebe os vereditos em uma thread por worker.
+    Workers que caem são reiniciados e os lotes em andamento recebem veredito vazio.
+    """
+    
+    def __init__(self, model, n_features, workers=1, max_batch=256, slots=2):
+        import multiprocessing
+        from multiprocessing import shared_memory
+        
+        self.model = model
+        self.n_features = n_features
+        self.max_batch = max_batch
+        self.slots = slots
+        self._context = multiprocessing.get_context('spawn')
+        self._cond = threading.Condition()
+        self._running = True
+        self._next = 0
+        
+        self.stats = {
+            'workers': workers,
+            'restarts': 0,
+            'batches': 0,
+            'rows': 0,
+            'errors': 0,
+            'queue_depth': 0,       # Linhas enviadas aos workers ainda sem veredito
+            'inference_cpu_s': 0.0  # CPU gasta nos workers (separada da captura)
+        }
+        
+        self._workers = []
+        for _ in range(workers):
+            input_shm = shared_memory.SharedMemory(create=True, size=slots * max_batch * n_features * 4)
+            output_shm = shared_memory.SharedMemory(create=True, size=slots * max_batch * 8)
+            worker = {
+                'input_shm': input_shm,
+                'output_shm': output_shm,
+                'rows': np.ndarray((slots, max_batch, n_features), dtype=np.float32, buffer=input_shm.buf),
+                'labels': np.ndarray((slots, max_batch), dtype=np.int32, buffer=output_shm.buf),
+                'confidences': np.ndarray((slots, max_batch), dtype=np.float32, buffer=output_shm.buf,
+                                          offset=slots * max_batch * 4),
+                'free': list(range(slots)),
+                'pending': {},  # slot -> callbacks
+                'process': None,
+                'conn': None,
+                'send_lock': threading.Lock(),
+                'started': 0.0,
+                'failures': 0,
+                'disabled': False
+            }
+            self._workers.append(worker)
+            self._start_worker(worker)
+            worker['receiver'] = threading.Thread(target=self._receiver, args=(worker,), daemon=True)
+            worker['receiver'].start()
+    
+    def _start_worker(self, worker):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_inference_worker_main,
+            args=(self.model, self.n_features, self.max_batch, self.slots,
+                  worker['input_shm'].name, worker['output_shm'].name, child_conn),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        worker['process'] = process
+        worker['conn'] = parent_conn
+        worker['started'] = time.monotonic()
+    
+    def submit_batch(self, rows, callbacks):
+        """Envia um lote a um worker com slot livre; os callbacks recebem (classe, confiança).
+        
+        Retorna False se o pool está parado ou sem workers funcionais.
+        """
+        n = len(rows)
+        with self._cond:
+            while True:
+                if not self.available:
+                    return False
+                worker = self._pick_worker()
+                if worker is not None:
+                    break
+                self._cond.wait()  # Todos os slots ocupados: contrapressão
+            slot = worker['free'].pop()
+            worker['pending'][slot] = callbacks
+            conn = worker['conn']
+            self.stats['queue_depth'] += n
+            
+        worker['rows'][slot, :n] = rows
+        try:
+            with worker['send_lock']:
+                conn.send((slot, n))
+        except (OSError, ValueError):
+            # Worker caiu entre a escolha e o envio: devolve o slot sem veredito
+            with self._cond:
+                if worker['pending'].get(slot) is callbacks:
+                    del worker['pending'][slot]
+                    worker['free'].append(slot)
+                    self.stats['queue_depth'] -= n
+                    self._cond.notify_all()
+            self._deliver(callbacks, None, None)
+        return True
+    
+    @property
+    def available(self):
+        return self._running and not all(worker['disabled'] for worker in self._workers)
+    
+    def _pick_worker(self):
+        """Rodízio entre os workers com slot livre"""
+        for i in range(len(self._workers)):
+            worker = self._workers[(self._next + i) % len(self._workers)]
+            if worker['free']:
+                self._next = (self._next + i + 1) % len(self._workers)
+                return worker
+        return None
+    
+    def _receiver(self, worker):
+        """Entrega os vereditos do worker e o reinicia se o processo cair"""
+        while True:
+            self._receive(worker, worker['conn'])
+            if not self._handle_worker_exit(worker):
+                return
+                
+            print("[IA] Worker de inferência encerrado inesperadamente, reiniciando...")
+            self._start_worker(worker)
+            with self._cond:
+                if self._running:
+                    # Slots só voltam a ser usados com o novo processo no ar
+                    worker['free'] = list(range(self.slots))
+                    self.stats['restarts'] += 1
+                    self._cond.notify_all()
+                    continue
+            # Pool parado durante o reinício
+            self._shutdown_worker(worker)
+            return
+    
+    def _receive(self, worker, conn):
+        """Lê os resultados até a conexão com o processo cair"""
+        while True:
+            try:
+                slot, n, cpu, error = conn.recv()
+            except (EOFError, OSError):
+                return
+                
+            labels = worker['labels'][slot, :n].copy()
+            confidences = worker['confidences'][slot, :n].copy()
+            with self._cond:
+                callbacks = worker['pending'].pop(slot, [])
+                worker['free'].append(slot)
+                self.stats['queue_depth'] -= n
+                self.stats['batches'] += 1
+                self.stats['rows'] += n
+                self.stats['inference_cpu_s'] += cpu
+                if error is not None:
+                    self.stats['errors'] += 1
+                self._cond.notify_all()
+                
+            if error is not None:
+                print(f"[IA] Erro na inferência do worker: {error}")
+            self._deliver(callbacks, None if error is not None else labels, confidences)
+    
+    def _handle_worker_exit(self, worker):
+        """Descarta os lotes em andamento; retorna True se o worker deve ser reiniciado"""
+        with self._cond:
+            lost = list(worker['pending'].values())
+            worker['pending'] = {}
+            worker['free'] = []
+            self.stats['queue_depth'] -= sum(len(callbacks) for callbacks in lost)
+            restart = self._running
+            if restart:
+                # Quedas seguidas logo após iniciar (ex.: modelo não carrega) desativam o worker
+                quick = time.monotonic() - worker['started'] < 10
+                worker['failures'] = worker['failures'] + 1 if quick else 0
+                if worker['failures'] >= 3:
+                    worker['disabled'] = True
+                    restart = False
+                    print("[IA] Worker de inferência desativado após falhas seguidas")
+            self._cond.notify_all()
+        for callbacks in lost:
+            self._deliver(callbacks, None, None)
+            
+        self._shutdown_worker(worker)
+        return restart
+    
+    def _shutdown_worker(self, worker):
+        """Pede o encerramento do processo e o força se não responder"""
+        try:
+            with worker['send_lock']:
+                worker['conn'].send(None)
+        except (OSError, ValueError):
+            pass
+        worker['process'].join(timeout=2)
+        if worker['process'].is_alive():
+            worker['process'].terminate()
+            worker['process'].join(timeout=1)
+        worker['conn'].close()
+    
+    @staticmethod
+    def _deliver(callbacks, labels, confidences):
+        for i, callback in enumerate(callbacks):
+            try:
+                if labels is None:
+                    callback(None, 0.0)
+                else:
+                    callback(int(labels[i]), float(confidences[i]))
+            except Exception as e:
+                print(f"[IA] Erro ao entregar veredito: {str(e)}")
+    
+    def stop(self):
+        """Encerra os workers e libera a memória compartilhada (chamadas repetidas são ignoradas)"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            self._shutdown_worker(worker)
+        for worker in self._workers:
+            worker['receiver'].join(timeout=10)
+        for worker in self._workers:
+            del worker['rows'], worker['labels'], worker['confidences']
+            worker['input_shm'].close()
+            worker['input_shm'].unlink()
+            worker['output_shm'].close()
+            worker['output_shm'].unlink()
+
+class InferenceCache:
+    """Cache LRU de vereditos indexado pelo vetor de features quantizado.
+    
+    Largura de bucket por feature: 0 = valor exato, > 0 = bucket absoluto; sem
+    largura configurada o bucket é relativo (escala log, relative_width por degrau).
+    """
+    
+    # Campos categóricos: fluxos só compartilham veredito com o mesmo valor
+    DEFAULT_BUCKET_WIDTHS = {
+        'Dst Port': 0,
+        'Protocol': 0,
+        'Init Fwd Win Byts': 0,
+        'Init Bwd Win Byts': 0,
+        'Fwd Seg Size Min': 0
+    }
+    
+    def __init__(self, columns, capacity=65536, bucket_widths=None, relative_width=0.05):
+        self.capacity = capacity
+        widths = dict(self.DEFAULT_BUCKET_WIDTHS)
+        widths.update(bucket_widths or {})
+        width = np.array([widths.get(name, -1) for name in columns], dtype=np.float64)
+        self._exact = width == 0
+        self._absolute = width > 0
+        self._relative = width < 0
+        self._width = width[self._absolute]
+        self._log_step = np.log1p(relative_width)
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def key(self, row):
+        """Hash do vetor quantizado"""
+        x = np.asarray(row, dtype=np.float64)
+        q = np.empty(len(x), dtype=np.float64)
+        q[self._exact] = x[self._exact]
+        q[self._absolute] = np.floor(x[self._absolute] / self._width)
+        relative = x[self._relative]
+        q[self._relative] = np.sign(relative) * np.floor(np.log1p(np.abs(relative)) / self._log_step)
+        return hashlib.blake2b(q.tobytes(), digest_size=16).digest()
+    
+    def get(self, key):
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return verdict
+    
+    def put(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def wrap(self, key, callback):
+        """Callback que guarda o veredito do modelo antes de repassá-lo"""
+        def cached_callback(label, confidence):
+            if label is not None:
+                self.put(key, (label, confidence))
+            callback(label, confidence)
+        return cached_callback
+    
+    @property
+    def hit_rate(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+    
+    def snapshot(self):
+        """Métricas para relatório"""
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), hit_rate=round(self.hit_rate, 4))
+
+class ModelCascade:
+    """1º estágio da cascata: árvore rasa sobre features baratas (treinocgb.train_cascade).
+    
+    Probabilidade de ataque abaixo de low = normal; a partir de high = ataque;
+    na faixa [low, high) o fluxo é escalonado para o modelo completo.
+    """
+    
+    SUFFIX = '.cascade.pkl'
+    
+    def __init__(self, model, features, low, high, benign_class=0, metadata=None):
+        self.model = CompiledTreeModel.compile(model)
+        self.features = list(features)
+        self.low = low
+        self.high = high
+        self.benign_class = benign_class
+        self.metadata = metadata or {}
+        positions = {name: i for i, name in enumerate(CIC_FLOW_FEATURES)}
+        missing = [name for name in self.features if name not in positions]
+        if missing:
+            raise ValueError(f"Features do 1º estágio desconhecidas pelo extrator: {missing}")
+        self._columns = np.array([positions[name] for name in self.features])
+        self._lock = threading.Lock()
+        self.stats = {'flows': 0, 'normal': 0, 'attack': 0, 'escalated': 0}
+    
+    @classmethod
+    def path_for(cls, model_path):
+        """Arquivo do 1º estágio gerado junto ao modelo completo"""
+        return os.path.splitext(model_path)[0] + cls.SUFFIX
+    
+    @classmethod
+    def load(cls, path):
+        import joblib
+        return cls.from_dict(joblib.load(path))
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Cascata no formato salvo por treinocgb.train_cascade"""
+        return cls(
+            data['model'], data['features'], data['low'], data['high'],
+            benign_class=data.get('benign_class', 0),
+            metadata={key: data[key] for key in ('target_recall', 'calibration', 'validation') if key in data}
+        )
+    
+    def route(self, features):
+        """Classifica o vetor do extrator: ('normal'|'attack'|'escalate', classe, confiança)"""
+        proba = self.model.predict_proba(features[self._columns][None, :])[0]
+        p_attack = 1.0 - proba[self.benign_class]
+        if p_attack < self.low:
+            decision, label, confidence = 'normal', self.benign_class, 1.0 - p_attack
+        elif p_attack >= self.high:
+            proba[self.benign_class] = -1.0
+            decision, label, confidence = 'attack', int(self.model.classes_[proba.argmax()]), p_attack
+        else:
+            decision, label, confidence = 'escalate', None, p_attack
+        with self._lock:
+            self.stats['flows'] += 1
+            self.stats[decision if decision != 'escalate' else 'escalated'] += 1
+        return decision, label, confidence
+    
+    def route_batch(self, features):
+        """Versão vetorizada de route: (normal, ataque, escalonar, classes, probabilidade de ataque)"""
+        proba = self.model.predict_proba(features[:, self._columns])
+        p_attack = 1.0 - proba[:, self.benign_class]
+        normal = p_attack < self.low
+        attack = p_attack >= self.high
+        escalate = ~(normal | attack)
+        proba[:, self.benign_class] = -1.0
+        labels = self.model.classes_[proba.argmax(axis=1)].astype(np.intp)
+        with self._lock:
+            self.stats['flows'] += len(features)
+            self.stats['normal'] += int(normal.sum())
+            self.stats['attack'] += int(attack.sum())
+            self.stats['escalated'] += int(escalate.sum())
+        return normal, attack, escalate, labels, p_attack
+    
+    def snapshot(self):
+        """Métricas para relatório, incluindo a fração de fluxos escalonados"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['escalation_rate'] = round(stats['escalated'] / stats['flows'], 4) if stats['flows'] else 0.0
+        stats['band'] = (self.low, self.high)
+        stats['calibrated_escalation_rate'] = self.metadata.get('calibration', {}).get('escalation_rate')
+        return stats
+
+class InferenceBatcher:
+    """Agrupa linhas de features em micro-lotes e executa um único predict_proba por lote"""
+    
+    def __init__(self, model, n_features, max_batch=256, max_delay=0.005,
+                 compiled=None, compiled_max_rows=16, pool=None, cache=None):
+        self.model = model
+        # Cache por modelo: um novo batcher (troca de modelo) começa com cache vazio
+        self.cache = cache
+        # Com pool, os lotes são avaliados em processos dedicados (InferenceWorkerPool)
+        self.pool = pool
+        # Lotes pequenos vão para o avaliador NumPy, que evita o overhead fixo do modelo
+        self.compiled = compiled
+        self.compiled_max_rows = compiled_max_rows
+        self.n_features = n_features
+        self.max_batch = max_batch
+        self.max_delay = max_delay  # Prazo máximo (s) que a primeira linha espera pelo lote
+        
+        # Dois buffers pré-alocados: um recebe linhas enquanto o outro está no modelo
+        self._buffers = [np.zeros((max_batch, n_features), dtype=np.float32) for _ in range(2)]
+        self._active = 0
+        self._count = 0
+        self._callbacks = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._running = True
+        
+        self.stats = {'batches': 0, 'rows': 0, 'errors': 0, 'last_batch_size': 0, 'last_batch_time': 0.0}
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+    
+    def submit(self, row, callback):
+        """Enfileira uma linha; callback(classe, confiança) é chamado com o veredito do lote"""
+        if self.cache is not None:
+            key = self.cache.key(row)
+            verdict = self.cache.get(key)
+            if verdict is not None:
+                callback(*verdict)
+                return True
+            callback = self.cache.wrap(key, callback)
+            
+        with self._cond:
+            # Buffer cheio: espera o worker trocar de buffer (contrapressão)
+            while self._running and self._count >= self.max_batch:
+                self._cond.wait()
+            if not self._running:
+                return False
+                
+            self._buffers[self._active][self._count] = row
+            self._count += 1
+            self._callbacks.append(callback)
+            if self._count == 1:
+                self._first_at = time.perf_counter()
+                self._cond.notify_all()
+            elif self._count >= self.max_batch:
+                self._cond.notify_all()
+        return True
+    
+    def predict(self, row, timeout=1.0):
+        """Versão síncrona de submit: retorna (classe, confiança) ou None"""
+        done = threading.Event()
+        verdict = []
+        
+        def callback(label, confidence):
+            verdict.append((label, confidence))
+            done.set()
+        
+        if not self.submit(row, callback) or not done.wait(timeout):
+            return None
+        return verdict[0] if verdict[0][0] is not None else None
+    
+    def stop(self):
+        """Processa as linhas pendentes e encerra o worker"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=1)
+        if self.pool is not None:
+            self.pool.stop()
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._count >= self.max_batch or (self._count and not self._running):
+                        break
+                    if self._count:
+                        remaining = self._first_at + self.max_delay - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    elif not self._running:
+                        return
+                    else:
+                        self._cond.wait()
+                        
+                rows = self._buffers[self._active][:self._count]
+                callbacks = self._callbacks
+                self._active ^= 1
+                self._count = 0
+                self._callbacks = []
+                self._first_at = None
+                self._cond.notify_all()
+                
+            self._run_batch(rows, callbacks)
+    
+    def _run_batch(self, rows, callbacks):
+        """Uma chamada ao modelo por lote; a classe sai do argmax das probabilidades"""
+        if self.pool is not None and self.pool.submit_batch(rows, callbacks):
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(rows)
+            self.stats['last_batch_size'] = len(rows)
+            return
+            
+        started = time.perf_counter()
+        labels = confidences = None
+        try:
+            if self.compiled is not None and len(rows) <= self.compiled_max_rows:
+                proba = self.compiled.predict_proba(rows)
+            else:
+                proba = self.model.predict_proba(rows)
+            labels = proba.argmax(axis=1)
+            confidences = proba[np.arange(len(rows)), labels]
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"[IA] Erro na inferência em lote: {str(e)}")
+            
+        self.stats['batches'] += 1
+        self.stats['rows'] += len(rows)
+        self.stats['last_batch_size'] = len(rows)
+        self.stats['last_batch_time'] = time.perf_counter() - started
+        
+        for i, callback in enumerate(callbacks):
+            try:
+                if labels is None:
+                    callback(None, 0.0)
+                else:
+                    callback(int(labels[i]), float(confidences[i]))
+            except Exception as e:
+                print(f"[IA] Erro ao entregar veredito: {str(e)}")
+
+MODEL_BUNDLE_FORMAT = 'tecguard-model-bundle'
+MODEL_BUNDLE_VERSION = 1
+
+def load_model_bundle(path):
+    """Lê um pacote de modelo gerado por treinocgb.save_model_bundle.
+    
+    Retorna (modelo, info); info traz features, dtypes, classes, metadados e a cascata.
+    """
+    import joblib
+    bundle = joblib.load(path)
+    if not isinstance(bundle, dict) or bundle.get('format') != MODEL_BUNDLE_FORMAT:
+        raise ValueError("arquivo não é um pacote de modelo")
+    if bundle.get('version', 1) > MODEL_BUNDLE_VERSION:
+        raise ValueError(f"versão do pacote não suportada: {bundle['version']}")
+        
+    features = [str(name) for name in bundle['features']]
+    if bundle['model_type'] == 'xgboost':
+        import xgboost as xgb
+        model = xgb.XGBClassifier()
+        model.load_model(bytearray(bundle['model']))
+        model.get_booster().feature_names = features
+    else:
+        model = bundle['model']
+        model.feature_names_in_ = np.array(features, dtype=object)
+        
+    info = {
+        'features': features,
+        'dtypes': dict(bundle.get('dtypes') or {}),
+        'classes': [str(name) for name in bundle.get('classes') or []],
+        'metadata': dict(bundle.get('metadata') or {}),
+        'cascade': bundle.get('cascade')
+    }
+    return model, info
+
+def load_model_file(path):
+    """Carrega um pacote (.bundle), um modelo XGBoost ou um estimador serializado: (modelo, info)"""
+    if path.endswith(AIChooser.BUNDLE_SUFFIX):
+        return load_model_bundle(path)
+    if path.endswith(('.json', '.ubj', '.model')):
+        import xgboost as xgb
+        model = xgb.XGBClassifier()
+        model.load_model(path)
+        return model, None
+    import joblib
+    return joblib.load(path), None
+
+def model_feature_names(model):
+    """Ordem das colunas esperada pelo modelo (treino sem nomes segue a ordem do CSV)"""
+    names = getattr(model, 'feature_names_in_', None)
+    if names is not None:
+        return [str(name) for name in names]
+    n_features = getattr(model, 'n_features_in_', None) or len(CIC_FLOW_FEATURES)
+    return (list(CIC_FLOW_FEATURES) + [None] * n_features)[:n_features]
+
+def validate_model(model, batch_size=256):
+    """Checa interface, esquema de features e faz o warm-up.
+    
+    Retorna (problema, warmup_ms); problema é None ou (evento, sugestão, dados).
+    """
+    if model is None:
+        return ("Modelo de IA não disponível", "Carregar modelo válido", None), None
+        
+    # Testa se o modelo tem os métodos necessários
+    if not (hasattr(model, 'predict') and hasattr(model, 'predict_proba')):
+        return ("Modelo de IA incompatível", "Verificar implementação do modelo", None), None
+        
+    # Esquema declarado pelo modelo contra as colunas do extrator
+    try:
+        names = getattr(model, 'feature_names_in_', None)
+        n_features = getattr(model, 'n_features_in_', None)
+    except Exception:
+        names = n_features = None
+    if names is not None:
+        unknown = [str(name) for name in names if str(name) not in CIC_FLOW_FEATURES]
+        if unknown:
+            return (
+                "Modelo usa features não extraídas do tráfego",
+                "Treinar com as colunas do CICFlowMeter",
+                {'features': unknown}
+            ), None
+    elif n_features is not None and n_features != len(CIC_FLOW_FEATURES):
+        return (
+            "Quantidade de features do modelo incompatível",
+            "Treinar com as colunas do CICFlowMeter",
+            {'esperado': len(CIC_FLOW_FEATURES), 'modelo': int(n_features)}
+        ), None
+        
+    # Warm-up com um lote do tamanho usado em produção
+    try:
+        batch = np.zeros((batch_size, len(model_feature_names(model))), dtype=np.float32)
+        started = time.perf_counter()
+        proba = np.asarray(model.predict_proba(batch))
+        warmup_ms = round((time.perf_counter() - started) * 1000, 2)
+        if proba.shape[0] != len(batch) or not np.isfinite(proba).all():
+            raise ValueError(f"saída inválida com formato {proba.shape}")
+    except Exception as e:
+        return ("Falha na validação do modelo", "Verificar modelo corrompido", {'error': str(e)}), None
+        
+    return None, warmup_ms
+
 class AIAnalyzer:
     """Realiza análises de pacotes usando o modelo de IA selecionado"""
     
-    def __init__(self, firewall, ai_chooser):
+    def __init__(self, firewall, ai_chooser, max_batch=256, max_delay=0.005, inference_workers=None,
+                 cache_size=65536, cache_bucket_widths=None, batch_interval=30.0):
         self.firewall = firewall
         self.extractor = NetworkFeatureExtractor()
         self.ai_chooser = ai_chooser
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # 0 = inferência no próprio processo; com um único núcleo o worker só disputaria a CPU
+        if inference_workers is None:
+            inference_workers = 1 if (os.cpu_count() or 1) > 1 else 0
+        self.inference_workers = inference_workers
+        self.cache_size = cache_size  # 0 desativa o cache de vereditos
+        self.cache_bucket_widths = cache_bucket_widths
+        self.inference = None  # Serviço preparado pelo AIChooser para o modelo ativo
+        self.cascade = None
+        self.inference_stats = defaultdict(int)  # Inferências por evento de fluxo
+        self.batch_interval = batch_interval     # Segundos entre análises em lote (0 = desativada)
+        self._batch_timer = None
+        self.batch_stats = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration': None,
+            'last_status': None,
+            'next_run': None,
+            'flows_scored': 0,
+            'suspicious': 0
+        }
         self.model_status = {
             'loaded': False,
             'last_check': None,
             'error_count': 0
         }
+        # Lote, workers e cache de cada modelo são montados na thread de carga do AIChooser
+        self.ai_chooser.set_preparer(self.prepare_inference)
 
-    def _verify_model_loaded(self):
-        """Verifica e valida se o modelo está carregado corretamente"""
-        try:
-            # Atualiza status
-            self.model_status['last_check'] = datetime.now()
-            
+    def _verify_model_loaded(self, model=None):
+        """Estado do modelo ativo; a validação (com warm-up) já foi feita na carga pelo AIChooser"""
+        if model is None:
             model = self.ai_chooser.get_current_model()
-            if model is None:
-                self.model_status['loaded'] = False
-                self.model_status['error_count'] += 1
-                self.firewall.logger.error(
-                    "Modelo de IA não disponível",
-                    service="AIAnalyzer",
-                    suggestion="Carregar modelo válido"
-                )
-                return False
-                
-            # Testa se o modelo tem os métodos necessários
-            if not (hasattr(model, 'predict') and hasattr(model, 'predict_proba')):
-                self.model_status['loaded'] = False
-                self.model_status['error_count'] += 1
-                self.firewall.logger.error(
-                    "Modelo de IA incompatível",
-                    service="AIAnalyzer",
-                    suggestion="Verificar implementação do modelo"
-                )
-                return False
-                
-            # Verificação adicional para modelos específicos
-            try:
-                # Teste de predição vazia para validação
-                dummy_data = np.zeros((1, 10))  # Tamanho arbitrário para teste
-                model.predict(dummy_data)
-                
-                self.model_status['loaded'] = True
-                return True
-                
-            except Exception as test_error:
-                self.model_status['loaded'] = False
-                self.model_status['error_count'] += 1
-                self.firewall.logger.error(
-                    "Falha na validação do modelo",
-                    service="AIAnalyzer",
-                    suggestion="Verificar modelo corrompido",
-                    additional_data={'error': str(test_error)}
-                )
-                return False
-                
-        except Exception as e:
-            self.model_status['loaded'] = False
-            self.model_status['error_count'] += 1
-            self.firewall.logger.error(
-                "Erro na verificação do modelo",
-                service="AIAnalyzer",
-                suggestion="Verificar dependências",
-                additional_data={'error': str(e)}
-            )
-            return False
-        
+        self.model_status['last_check'] = datetime.now()
+        self.model_status['loaded'] = model is not None
+        warmup_ms = self.ai_chooser.model_entry(model).get('warmup_ms')
+        if warmup_ms is not None:
+            self.model_status['warmup_ms'] = warmup_ms
+        else:
+            self.model_status.pop('warmup_ms', None)
+        return self.model_status['loaded']
+    
     def get_model_status(self):
         """Retorna o status atual do modelo e verifica seu estado"""
         # Atualiza o status verificando o modelo
@@ -1009,112 +3413,295 @@ class AIAnalyzer:
         
         return status
     
-    def analyze(self, pkt):
-        """Análise usando modelo de IA"""
+    def analyze(self, pkt):
+        """Análise usando modelo de IA (veredito assíncrono, em micro-lotes)"""
+        try:
+            # Atualiza o fluxo do pacote (features no formato do CICFlowMeter)
+            flow, event = self.extractor.update_flow_stats(pkt)
+            
+            # O modelo foi treinado com fluxos inteiros: só infere em eventos do fluxo
+            if event is not None:
+                self._infer(flow, event)
+            for expired in self.extractor.expire_idle():
+                self._infer(expired, 'idle_timeout')
+                
+        except Exception as e:
+            self.firewall.logger.error(
+                "Erro na análise por IA",
+                service="AIAnalyzer",
+                suggestion="Verificar dados de entrada",
+                additional_data={'error': str(e)}
+            )
+            
+        return None
+    
+    def _infer(self, flow, trigger):
+        """Envia o vetor do fluxo para o próximo lote; o veredito chega em _on_verdict"""
+        model, cascade, inference = self.ai_chooser.get_current_inference()
+        if model is None:
+            self.firewall.logger.error(
+                "Nenhum modelo de IA carregado",
+                service="AIAnalyzer",
+                suggestion="Selecionar modelo válido",
+                aggregate=True
+            )
+            return
+            
+        if self._use_inference(inference) is None:  # Serviço não pôde ser preparado
+            return
+        features = flow.features()
+        context = {
+            'src_ip': flow.src,
+            'dst_ip': flow.dst,
+            'src_port': flow.sport,
+            'dst_port': flow.dport,
+            'protocol': flow.proto,
+            'packets': flow.packets,
+            'trigger': trigger
+        }
+        self.inference_stats[trigger] += 1
+        
+        # Cascata: só a faixa de incerteza do 1º estágio paga pelo modelo completo
+        self.cascade = cascade
+        if cascade is not None:
+            decision, label, confidence = cascade.route(features)
+            if decision != 'escalate':
+                self._on_verdict(context, label, confidence)
+                return
+                
+        row = np.append(features, np.float32(0))[inference['columns']]
+        inference['batcher'].submit(
+            row, lambda label, confidence: self._on_verdict(context, label, confidence)
+        )
+    
+    def _on_verdict(self, flow, label, confidence):
+        """Aplica o veredito do lote: classe 0 é tráfego normal"""
+        if label is None or label == 0:
+            return
+            
+        score = int(confidence * 100)
+        if score < 70:  # Limiar para considerar como ameaça
+            return
+            
+        src_ip = flow['src_ip']
+        inference = self.inference
+        names = inference['class_names'] if inference else None
+        class_name = names[label] if names and 0 <= label < len(names) else str(label)
+        self.firewall.logger.attack(
+            "Ameaça detectada por IA",
+            ip=src_ip,
+            port=flow['dst_port'],
+            service="AI Analysis",
+            suggestion="Investigar tráfego",
+            additional_data={
+                'prediction': label,
+                'class_name': class_name,
+                'confidence': confidence,
+                'flow': flow
+            }
+        )
+        
+        # O veredito chega depois do pacote: entra na reputação da origem
+        reputation = self.firewall.reputation.add(src_ip, score)
+        if reputation >= self.firewall.pipeline.thresholds['reputation']:
+            # A regra é aplicada na thread da fila, não na de inferência
+            self.firewall.enforcement.submit(
+                src_ip,
+                f"Modelo de IA detectou ameaça (classe {class_name}, confiança {confidence:.2f})"
+            )
+    
+    def _use_inference(self, inference):
+        """Adota o serviço do modelo ativo: na thread de captura só troca a referência"""
+        if inference is not self.inference:
+            self.inference = inference
+            if inference is not None:
+                # Novos fluxos só acumulam o que o modelo (e o 1º estágio) usam
+                self.extractor.use_features(inference['features'])
+        return inference
+    
+    def prepare_inference(self, model, cascade=None, info=None):
+        """Monta o serviço de inferência em lote de um modelo já validado.
+        
+        Chamado pelo AIChooser na thread de carga: compilação, processos de
+        inferência e cache ficam prontos antes da troca do modelo ativo.
+        """
+        feature_names = model_feature_names(model)
+        used = set(feature_names) | set(cascade.features if cascade else ())
+        # Posição de cada coluna do modelo no vetor do extrator (desconhecidas = 0)
+        positions = {name: i for i, name in enumerate(CIC_FLOW_FEATURES)}
+        return {
+            'features': [name for name in CIC_FLOW_FEATURES if name in used],
+            'columns': np.array([
+                positions.get(name, len(CIC_FLOW_FEATURES)) for name in feature_names
+            ]),
+            'class_names': (info or {}).get('classes') or None,
+            'batcher': InferenceBatcher(
+                model,
+                len(feature_names),
+                max_batch=self.max_batch,
+                max_delay=self.max_delay,
+                compiled=self._compile_model(model),
+                pool=self._start_worker_pool(model, len(feature_names)),
+                cache=InferenceCache(
+                    feature_names,
+                    capacity=self.cache_size,
+                    bucket_widths=self.cache_bucket_widths
+                ) if self.cache_size else None
+            )
+        }
+    
+    def _start_worker_pool(self, model, n_features):
+        """Processos de inferência fora do GIL da captura (None = no próprio processo)"""
+        if self.inference_workers <= 0:
+            return None
+        try:
+            return InferenceWorkerPool(
+                model,
+                n_features,
+                workers=self.inference_workers,
+                max_batch=self.max_batch
+            )
+        except Exception as e:
+            self.firewall.logger.warning(
+                "Falha ao iniciar workers de inferência",
+                service="AIAnalyzer",
+                suggestion="Inferência seguirá no processo principal",
+                additional_data={'error': str(e)}
+            )
+            return None
+    
+    def get_inference_stats(self):
+        """Métricas da inferência, separadas das da captura"""
+        inference = self.inference
+        batcher = inference['batcher'] if inference else None
+        return {
+            'triggers': dict(self.inference_stats),
+            'batcher': dict(batcher.stats) if batcher else None,
+            'workers': dict(batcher.pool.stats) if batcher and batcher.pool else None,
+            'cache': batcher.cache.snapshot() if batcher and batcher.cache else None,
+            'cascade': self.cascade.snapshot() if self.cascade else None,
+            'batch': dict(self.batch_stats)
+        }
+    
+    def _compile_model(self, model):
+        """Versão em arrays NumPy do modelo para lotes pequenos (None se não suportado)"""
+        try:
+            return CompiledTreeModel.compile(model)
+        except Exception as e:
+            self.firewall.logger.warning(
+                "Modelo não pôde ser compilado para avaliação NumPy",
+                service="AIAnalyzer",
+                suggestion="Lotes pequenos usarão o modelo original",
+                additional_data={'error': str(e)}
+            )
+            return None
+    
+    def stop(self):
+        """Entrega os vereditos pendentes e encerra o serviço de inferência"""
+        self.stop_batch_analysis()
+        inference = self.inference
+        if inference is not None:
+            inference['batcher'].stop()
+    
+    def start_batch_analysis(self):
+        """Agenda a análise periódica dos fluxos ativos (0 desativa)"""
+        if self.batch_interval > 0 and self._batch_timer is None:
+            self.extractor.track_changes = True
+            self._schedule_batch(self.batch_interval)
+    
+    def stop_batch_analysis(self):
+        """Cancela a próxima execução agendada da análise em lote"""
+        timer, self._batch_timer = self._batch_timer, None
+        if timer is not None:
+            timer.cancel()
+        self.batch_stats['next_run'] = None
+        with self.extractor.lock:
+            self.extractor.track_changes = False
+            self.extractor._changed.clear()
+        self.extractor.table = FlowTable()  # Sem sincronização, a tabela ficaria defasada
+    
+    def _schedule_batch(self, delay):
+        timer = threading.Timer(delay, self._run_batch_job)
+        timer.daemon = True
+        self._batch_timer = timer
+        self.batch_stats['next_run'] = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        timer.start()
+    
+    def _run_batch_job(self):
+        """Job agendado: analisa os fluxos alterados, registra duração e agenda o próximo"""
+        started = time.perf_counter()
         try:
-            # Extrai features do pacote
-            features = self.extractor.packet_to_features(pkt)
-            if not features:
-                return None
-                
-            # Converte para DataFrame
-            df = pd.DataFrame([features])
-            
-            # Obtém o modelo atual do AIChooser
-            model = self.ai_chooser.get_current_model()
-            if model is None:
-                self.firewall.logger.error(
-                    "Nenhum modelo de IA carregado",
-                    service="AIAnalyzer",
-                    suggestion="Selecionar modelo válido"
-                )
-                return None
-            
-            # Faz predição
-            prediction = model.predict(df)
-            probability = model.predict_proba(df)
-            
-            # Calcula score baseado na probabilidade
-            max_prob = np.max(probability[0])
-            score = int(max_prob * 100)
-            
-            if score >= 70:  # Limiar para considerar como ameaça
-                # Log da detecção
-                self.firewall.logger.attack(
-                    "Ameaça detectada por IA",
-                    ip=features.get('src_ip'),
-                    port=features.get('dst_port'),
-                    service="AI Analysis",
-                    suggestion="Investigar tráfego",
-                    additional_data={
-                        'prediction': int(prediction[0]),
-                        'confidence': float(max_prob),
-                        'features': features
-                    }
-                )
-                
-                return {
-                    'block': score >= 85,
-                    'reason': f"Modelo de IA detectou ameaça (classe {prediction[0]}, confiança {max_prob:.2f})",
-                    'score': score,
-                    'details': {
-                        'ai_prediction': int(prediction[0]),
-                        'confidence': float(max_prob),
-                        'features': features
-                    }
-                }
-                
+            summary = self.analyze_traffic()
+            status = 'ok' if summary is not None else 'sem modelo'
         except Exception as e:
+            summary, status = None, f"erro: {str(e)}"
             self.firewall.logger.error(
-                "Erro na análise por IA",
+                "Erro na análise em lote",
                 service="AIAnalyzer",
-                suggestion="Verificar dados de entrada",
+                suggestion="Verificar modelo e dados dos fluxos",
                 additional_data={'error': str(e)}
             )
             
-        return None
+        self.batch_stats['runs'] += 1
+        self.batch_stats['last_run'] = datetime.now().isoformat()
+        self.batch_stats['last_duration'] = round(time.perf_counter() - started, 3)
+        self.batch_stats['last_status'] = status
+        if summary is not None:
+            self.batch_stats['flows_scored'] += summary['flows']
+            self.batch_stats['suspicious'] += summary['suspicious']
+            
+        if self._batch_timer is not None:
+            self._schedule_batch(self.batch_interval)
     
     def analyze_traffic(self):
-        """Análise em lote do tráfego acumulado"""
-        model = self.ai_chooser.get_current_model()
-        if not model:
+        """Análise em lote dos fluxos ativos que mudaram desde a última execução.
+        
+        Retorna um resumo ({'flows', 'escalated', 'suspicious'}) ou None sem modelo válido.
+        """
+        # Sincroniza mesmo sem modelo: o conjunto de alterações não pode crescer sem limite
+        rows = self.extractor.sync_table()
+        model, cascade, inference = self.ai_chooser.get_current_inference()
+        if model is None:
             self.ai_chooser.log_event("Nenhum modelo carregado.", error=True)
-            return
-
-        df = self.extractor.get_feature_dataframe()
-
-        if df.empty:
-            self.ai_chooser.log_event("Nenhum dado de tráfego disponível para análise.")
-            return
-
-        try:
-            # Converte para float64 se necessário
-            df = df.astype('float64')
-
-            predictions = model.predict(df)
-
-            for idx, pred in enumerate(predictions):
-                if pred != 0:
-                    ip = df.iloc[idx].get("src_ip", "IP_DESCONHECIDO")
-                    classe = str(pred)
-
-                    self.ai_chooser.log_event(f"⚠️ Alerta: Padrão suspeito detectado no fluxo #{idx} (Classe: {classe}, IP: {ip})")
-
-                    if self.firewall.acl_manager and ip != "IP_DESCONHECIDO":
-                        success = self.firewall.acl_manager.block_ip(
-                            ip=ip,
-                            reason=f"Ataque Classe {classe}",
-                            source="AIAnalyzer"
-                        )
-                        if success:
-                            self.ai_chooser.log_event(f"IP {ip} bloqueado com sucesso.")
-                        else:
-                            self.ai_chooser.log_event(f"Falha ao bloquear IP {ip}.", error=True)
-
-        except Exception as e:
-            self.ai_chooser.log_event(f"Erro durante análise de tráfego: {e}", error=True)
-
-        self.extractor.reset()
+            return None
+        if self._use_inference(inference) is None:  # Serviço não pôde ser preparado
+            return None
+        columns = inference['columns']
+        
+        summary = {'flows': len(rows), 'escalated': 0, 'suspicious': 0}
+        if not len(rows):
+            return summary
+            
+        table = self.extractor.table
+        features = table.features[rows]
+        labels = np.zeros(len(rows), dtype=np.intp)
+        confidence = np.zeros(len(rows))
+        escalate = np.ones(len(rows), dtype=bool)
+        if cascade is not None:
+            _, attack, escalate, cascade_labels, p_attack = cascade.route_batch(features)
+            labels[attack] = cascade_labels[attack]
+            confidence[attack] = p_attack[attack]
+        if escalate.any():
+            proba = np.asarray(model.predict_proba(features[escalate][:, columns]))
+            labels[escalate] = proba.argmax(axis=1)
+            confidence[escalate] = proba.max(axis=1)
+        self.inference_stats['batch'] += len(rows)
+        summary['escalated'] = int(escalate.sum())
+        
+        # Vereditos de ataque seguem o caminho normal: reputação e fila de bloqueio
+        for i in np.flatnonzero(labels != 0):
+            row = rows[i]
+            context = {
+                'src_ip': table.src[row],
+                'dst_ip': table.dst[row],
+                'src_port': int(table.sport[row]),
+                'dst_port': int(table.dport[row]),
+                'protocol': int(table.proto[row]),
+                'trigger': 'batch'
+            }
+            self._on_verdict(context, int(labels[i]), float(confidence[i]))
+        summary['suspicious'] = int((labels != 0).sum())
+        return summary
 
     def test_ai_analysis(self, features):
         """Método para testar a IA com features específicas"""
@@ -1138,70 +3725,246 @@ class AIAnalyzer:
             return None
 
 class AIChooser:
-    """Seleciona e carrega o modelo de IA a ser utilizado"""
+    """Registro de modelos de IA: carrega em segundo plano e troca o modelo ativo atomicamente"""
+    
+    MODEL_EXTENSIONS = ('.bundle', '.json', '.ubj', '.model', '.pkl', '.joblib')
+    BUNDLE_SUFFIX = '.bundle'  # Pacote de treinocgb.py: modelo + features + classes + metadados
+    DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Models")
+    # Índice do comboBox -> arquivo dentro de model_dir
+    DEFAULT_MODEL_PATHS = {
+        0: 'xgboost_model.model',
+        1: 'random_forest_model.pkl'
+    }
     
-    def __init__(self, ui, model_paths=None):
+    def __init__(self, ui, model_paths=None, model_dir=None):
         self.ui = ui
-        self.model_paths = model_paths or {
-            0: 'Models\\xgboost_model.model',
-            1: 'Models\\random_forest_model.pkl'
-        }
+        self.model_dir = model_dir or self.DEFAULT_MODEL_DIR
+        self.model_paths = model_paths or dict(self.DEFAULT_MODEL_PATHS)
         self.model = None
+        self.cascade = None  # 1º estágio do modelo ativo (None = todo fluxo vai ao modelo)
+        self.inference = None  # Serviço de inferência preparado para o modelo ativo
         self.current_model_name = None
+        
+        # caminho -> {'model', 'cascade', 'inference', 'info', 'status', 'load_s', 'memory_mb', 'error'}
+        self.registry = {}
+        self._preparer = None  # preparer(modelo, cascata, info) -> serviço de inferência
+        self._lock = threading.Lock()
+        self._queue = []
+        self._pending = threading.Condition(self._lock)
+        self._selected = None
+        self._loader = None
+        self._idle = threading.Event()
+        self._idle.set()
 
         # Conecta a UI à função de carregamento
-        self.ui.comboBox_ModeloIA.currentIndexChanged.connect(self.load_selected_model)
-        self.ui.comboBox_ModeloIA.setCurrentIndex(1)
+        if self.ui is not None:
+            self.ui.comboBox_ModeloIA.currentIndexChanged.connect(self.load_selected_model)
+            self.ui.comboBox_ModeloIA.setCurrentIndex(1)
         self.load_selected_model()
+        self.refresh()
+    
+    def refresh(self):
+        """Agenda a carga dos modelos do diretório ainda não registrados"""
+        if not os.path.isdir(self.model_dir):
+            self.log_event(f"Diretório de modelos não encontrado: {self.model_dir}", error=True)
+            return
+        for name in sorted(os.listdir(self.model_dir)):
+            if name.endswith(self.MODEL_EXTENSIONS) and not name.endswith(ModelCascade.SUFFIX):
+                path = os.path.join(self.model_dir, name)
+                if self._bundle_for(path) == path:  # Arquivo solto com pacote ao lado: só o pacote
+                    self._enqueue(path)
     
     def load_selected_model(self):
-        """Carrega o modelo selecionado na UI"""
-
-        if hasattr(self.ui, 'comboBox_ModoGamer'):
+        """Seleciona o modelo da UI; a carga ocorre em segundo plano e não trava a interface"""
+        if self.ui is not None and hasattr(self.ui, 'comboBox_ModoGamer'):
             if self.ui.comboBox_ModoGamer.currentIndex() == 0:  # Modo gamer ativado
                 self.log_event("Modo Gamer ativado - Modelo de IA não será carregado")
                 return None
 
-        model_index = self.ui.comboBox_ModeloIA.currentIndex()
+        model_index = self.ui.comboBox_ModeloIA.currentIndex() if self.ui is not None else 1
 
         if model_index not in self.model_paths:
             self.log_event(f"Índice de modelo '{model_index}' não encontrado.", error=True)
             return None
 
-        model_path = self.model_paths[model_index]
+        model_path = self._bundle_for(os.path.join(self.model_dir, self.model_paths[model_index]))
+        with self._lock:
+            self._selected = model_path
+            entry = self.registry.get(model_path)
+            
+        if entry is None:
+            # O modelo atual segue ativo até o novo estar carregado e validado
+            self._enqueue(model_path, first=True)
+        elif entry['status'] == 'ok':
+            # A troca (e a preparação da inferência) acontece na thread de carga
+            self._enqueue(model_path, first=True, activate=True)
+        else:
+            self.log_event(f"Modelo '{model_path}' indisponível: {entry['error']}", error=True)
+        return None
+    
+    def wait_until_loaded(self, timeout=None):
+        """Aguarda a fila de carga esvaziar (útil em testes e scripts)"""
+        return self._idle.wait(timeout)
 
+    def get_current_model(self):
+        """Retorna o modelo atualmente carregado"""
+        return self.model
+    
+    def model_info(self, model):
+        """Features, classes e metadados do pacote de onde o modelo veio ({} se arquivo solto)"""
+        return self.model_entry(model).get('info') or {}
+    
+    def model_entry(self, model):
+        """Entrada do registro do modelo ({} se não veio do registro)"""
+        with self._lock:
+            for entry in self.registry.values():
+                if model is not None and entry['model'] is model:
+                    return entry
+        return {}
+    
+    def get_current_inference(self):
+        """Retorna o modelo ativo, seu 1º estágio e seu serviço de inferência de forma consistente"""
+        with self._lock:
+            return self.model, self.cascade, self.inference
+    
+    def set_preparer(self, preparer):
+        """Registra quem monta o serviço de inferência; o modelo já ativo é preparado na carga"""
+        with self._lock:
+            self._preparer = preparer
+            current = self.current_model_name
+        if current is not None:
+            self._enqueue(current, first=True, activate=True)
+    
+    def _enqueue(self, path, first=False, activate=False):
+        with self._lock:
+            if path in self._queue or (path in self.registry and not activate):
+                return
+            if first:
+                self._queue.insert(0, path)
+            else:
+                self._queue.append(path)
+            self._idle.clear()
+            self._pending.notify()
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._load_worker, daemon=True)
+                self._loader.start()
+    
+    def _load_worker(self):
+        """Thread de carga: um modelo por vez, fora da thread do Qt"""
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._idle.set()
+                    self._pending.wait()
+                path = self._queue.pop(0)
+                entry = self.registry.get(path)
+                
+            if entry is None:
+                entry = self._load(path)
+                with self._lock:
+                    self.registry[path] = entry
+            with self._lock:
+                selected = path == self._selected
+            if selected and entry['status'] == 'ok':
+                self._activate(path)
+    
+    def _load(self, path):
+        """Carrega e valida um modelo, medindo tempo e memória"""
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        started = time.perf_counter()
+        entry = {'model': None, 'cascade': None, 'inference': None, 'info': None, 'status': 'erro',
+                 'load_s': None, 'memory_mb': None, 'error': None}
+        
         try:
-            if model_path.endswith(".model"):
-                import xgboost as xgb
-                self.model = xgb.XGBClassifier()
-                self.model.load_model(model_path)
-            elif model_path.endswith(".pkl"):
-                import joblib
-                self.model = joblib.load(model_path)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"arquivo não encontrado: {path}")
+            model, entry['info'] = load_model_file(path)
+            problem, warmup_ms = validate_model(model)
+            entry['load_s'] = round(time.perf_counter() - started, 3)
+            entry['memory_mb'] = round((process.memory_info().rss - rss_before) / 2**20, 1)
+            if problem is not None:
+                event, _, data = problem
+                entry['error'] = f"{event} {data or ''}".strip()
             else:
-                self.log_event(f"Formato de modelo não suportado: {model_path}", error=True)
-                return None
-
-            self.current_model_name = model_path
-            self.log_event(f"Modelo '{model_path}' carregado com sucesso.")
-            return self.model
+                entry['model'] = model
+                entry['status'] = 'ok'
+                entry['warmup_ms'] = warmup_ms
+                entry['cascade'] = self._load_cascade(path, entry['info'])
+        except Exception as e:
+            # Erros do xgboost trazem o stack trace nativo: só a primeira linha interessa
+            entry['error'] = (str(e).strip().splitlines() or [type(e).__name__])[0]
             
+        if entry['status'] == 'ok':
+            self.log_event(
+                f"Modelo '{path}' carregado em {entry['load_s']:.2f}s "
+                f"(~{entry['memory_mb']:.1f} MB, warm-up {entry['warmup_ms']:.1f} ms)"
+            )
+        else:
+            self.log_event(f"Erro ao carregar modelo '{path}': {entry['error']}", error=True)
+        return entry
+    
+    @classmethod
+    def _bundle_for(cls, path):
+        """Prefere o pacote gerado junto a um arquivo de modelo solto"""
+        bundle = os.path.splitext(path)[0] + cls.BUNDLE_SUFFIX
+        return bundle if os.path.exists(bundle) else path
+    
+    def _load_cascade(self, path, info=None):
+        """1º estágio opcional: dentro do pacote ou gerado pelo treino junto ao modelo"""
+        cascade_path = ModelCascade.path_for(path)
+        if info and info.get('cascade'):
+            cascade_path = path
+        elif not os.path.exists(cascade_path):
+            return None
+        try:
+            if cascade_path == path:
+                cascade = ModelCascade.from_dict(info['cascade'])
+            else:
+                cascade = ModelCascade.load(cascade_path)
         except Exception as e:
-            self.log_event(f"Erro ao carregar modelo '{model_path}': {e}", error=True)
+            self.log_event(f"Cascata '{cascade_path}' ignorada: {e}", error=True)
             return None
-
-    def get_current_model(self):
-        """Retorna o modelo atualmente carregado"""
-        return self.model
+        self.log_event(
+            f"Cascata '{cascade_path}' carregada (faixa [{cascade.low:.3f}, {cascade.high:.3f}))"
+        )
+        return cascade
+    
+    def _activate(self, path):
+        """Troca atômica: inferências em andamento terminam com o modelo anterior.
+        
+        Só roda na thread de carga: a preparação da inferência e o encerramento do
+        serviço anterior não passam pela thread de captura.
+        """
+        with self._lock:
+            entry = self.registry[path]
+            preparer = self._preparer
+            if self.current_model_name == path and (preparer is None or entry['inference'] is not None):
+                return
+                
+        if preparer is not None and entry['inference'] is None:
+            try:
+                entry['inference'] = preparer(entry['model'], entry['cascade'], entry['info'])
+            except Exception as e:
+                self.log_event(f"Falha ao preparar a inferência de '{path}': {e}", error=True)
+                
+        with self._lock:
+            previous = self.registry.get(self.current_model_name) if self.current_model_name != path else None
+            self.model = entry['model']
+            self.cascade = entry['cascade']
+            self.inference = entry['inference']
+            self.current_model_name = path
+            
+        # Lotes pendentes do modelo anterior são entregues antes de encerrar seus workers
+        if previous is not None and previous['inference'] is not None:
+            inference, previous['inference'] = previous['inference'], None
+            inference['batcher'].stop()
+        self.log_event(f"Modelo ativo: '{path}'")
     
     def log_event(self, message, error=False):
-        """Registra eventos e mostra na UI"""
+        """Registra eventos (sem diálogos modais: pode ser chamado fora da thread do Qt)"""
         prefix = "[ERRO]" if error else "[INFO]"
         print(f"{prefix} {message}")
-        if error:
-            QMessageBox.critical(None, "Erro", message)
-        else:
-            QMessageBox.information(None, "Info", message)
 
 class ACLManager:
     """Gerenciador de ACL (Access Control List) para bloquear IPs maliciosos"""
@@ -1301,6 +4064,69 @@ class ACLManager:
         with self.lock:
             return ip in self.blocked_ips
 
+class EnforcementQueue:
+    """Fila de bloqueios: as regras (netsh/iptables) são aplicadas numa thread própria,
+    fora da captura e da inferência; um IP pendente não é enfileirado de novo."""
+    
+    def __init__(self, firewall, maxsize=4096):
+        self.firewall = firewall
+        self._queue = queue.Queue(maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {'queued': 0, 'blocked': 0, 'failed': 0, 'duplicates': 0, 'dropped': 0}
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+    
+    def submit(self, ip, reason):
+        """Enfileira o bloqueio; False se o IP já está bloqueado, pendente ou a fila encheu"""
+        if self.firewall.acl_manager.is_blocked(ip):
+            return False
+        with self._lock:
+            if ip in self._pending:
+                self.stats['duplicates'] += 1
+                return False
+            try:
+                self._queue.put_nowait((ip, reason))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                return False
+            self._pending.add(ip)
+            self.stats['queued'] += 1
+        return True
+    
+    @property
+    def depth(self):
+        return self._queue.qsize()
+    
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            ip, reason = item
+            try:
+                blocked = self.firewall._block_ip(ip, reason)
+            except Exception as e:
+                blocked = False
+                self.firewall.logger.error(
+                    "Falha ao aplicar bloqueio",
+                    ip=ip,
+                    service="ACL",
+                    suggestion="Verificar permissões do firewall do sistema",
+                    additional_data={'error': str(e), 'reason': reason}
+                )
+            with self._lock:
+                self._pending.discard(ip)
+                self.stats['blocked' if blocked else 'failed'] += 1
+    
+    def stop(self, timeout=5.0):
+        """Aplica os bloqueios já enfileirados e encerra a thread"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
 class WindowsInterfaceManager:
 
     @staticmethod
@@ -1329,113 +4155,454 @@ class WindowsInterfaceManager:
             print(f"[!] Erro ao detectar interfaces: {str(e)}")
             return None
 
+class FingerprintStore:
+    """Conjunto exato de digests de 16 bytes, ordenado em disco e mapeado em memória"""
+    
+    RECORD_SIZE = 16
+    
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+        self.count = 0
+        self.open()
+    
+    @staticmethod
+    def digest(fingerprint, kind='ja3'):
+        """Digest de 16 bytes: o próprio MD5 (JA3/JA3S) ou MD5 da string (JA4)"""
+        if kind in ('ja3', 'ja3s'):
+            return bytes.fromhex(fingerprint)
+        return hashlib.md5(fingerprint.encode()).digest()
+    
+    @classmethod
+    def build(cls, path, digests):
+        """Grava os digests ordenados e sem duplicatas (escrita atômica) e abre o store"""
+        records = sorted(set(digests))
+        with open(path + ".tmp", 'wb') as f:
+            f.write(b''.join(records))
+        os.replace(path + ".tmp", path)
+        return cls(path)
+    
+    def open(self):
+        """Mapeia o arquivo em O(1): nada é lido ou reconstruído na abertura"""
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        size = os.path.getsize(self.path)
+        if size % self.RECORD_SIZE:
+            print(f"[JA3] Arquivo de fingerprints corrompido: {self.path}")
+            return
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = size // self.RECORD_SIZE
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+        self.count = 0
+    
+    def __contains__(self, digest):
+        """Busca binária sobre os registros mapeados"""
+        mm, size = self._map, self.RECORD_SIZE
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = mm[mid * size:(mid + 1) * size]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                return True
+        return False
+    
+    def __len__(self):
+        return self.count
+    
+    def __del__(self):
+        # Snapshots antigos liberam o mapeamento quando o último leitor os solta
+        self.close()
+
+class FingerprintSnapshot:
+    """Visão imutável do banco de fingerprints, trocada inteira a cada atualização"""
+    
+    __slots__ = ('generations', 'blooms', 'stores')
+    
+    def __init__(self, generations, blooms, stores):
+        self.generations = generations  # {tipo: geração dos arquivos em disco}
+        self.blooms = blooms
+        self.stores = stores
+
 class JA3DatabaseManager:
-    def __init__(self):
-        self.ja3_bloom = ScalableBloomFilter(
-            initial_capacity=10000, 
-            error_rate=0.001
-        )
-        self.last_update = None
+    # Formato esperado de cada tipo de fingerprint
+    FINGERPRINT_FORMATS = {
+        'ja3': re.compile(r'^[0-9a-f]{32}$'),
+        'ja3s': re.compile(r'^[0-9a-f]{32}$'),
+        'ja4': re.compile(r'^[tq][0-9a-z]{2}[di]\d{4}[0-9a-z]{2}_[0-9a-f]{12}_[0-9a-f]{12}$')
+    }
+
+    def __init__(self, data_dir="ja3_db", feeds=None):
+        self.data_dir = data_dir
+        self.feeds_dir = os.path.join(self.data_dir, "feeds")
+        os.makedirs(self.feeds_dir, exist_ok=True)
+        
         self.update_interval = timedelta(hours=24)
-        self.lock = threading.Lock()
+        self.retry_interval = timedelta(minutes=15)
+        self.request_timeout = 15
+        self._update_lock = threading.Lock()
+        self._timer = None
+        self.stats = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration': None,
+            'last_status': None,
+            'next_run': None
+        }
         
-        # Fontes alternativas confiáveis
-        self.data_sources = [
-            self._fetch_sslblacklist,
-            self._fetch_emergingthreats
+        # Fontes alternativas confiáveis, por tipo de fingerprint
+        self.feeds = feeds or [
+            {
+                'name': 'sslbl',
+                'kind': 'ja3',
+                'url': "https://sslbl.abuse.ch/downloads/ja3_fingerprints.csv",
+                'parser': self._parse_sslblacklist
+            },
+            {
+                'name': 'emergingthreats',
+                'kind': 'ja3',
+                'url': "https://rules.emergingthreats.net/blockrules/ja3-fingerprints.txt",
+                'parser': self._parse_emergingthreats
+            },
+            {
+                'name': 'ja4db',
+                'kind': 'ja4',
+                'url': "https://ja4db.com/api/read/",
+                'parser': self._parse_ja4db
+            }
         ]
         
-        self._update_database()
+        # Último snapshot bom já está em disco: nenhuma rede na inicialização.
+        # Conjunto exato (mapeado) com o Bloom como pré-filtro; leitores só
+        # enxergam o snapshot corrente, trocado por uma atribuição de referência
+        self.feed_state = self._load_feed_state()
+        last_update = self.feed_state.get('last_update')
+        self.last_update = datetime.fromisoformat(last_update) if last_update else None
+        self._snapshot = self._open_snapshot(self.feed_state.get('generations', {}))
+        self._update_size_stats()
+        
+        self.start_auto_update()
 
-    def _fetch_sslblacklist(self):
-        #Def responsável por buscar fingerprints da JA3
-        try:
-            url = "https://sslbl.abuse.ch/downloads/ja3_fingerprints.csv"
-            response = requests.get(url, timeout=15)
-            return [
-                line.split(",")[0] 
-                for line in response.text.splitlines() 
-                if line and not line.startswith("#")
-            ]
-        except Exception as e:
-            print(f"[JA3] Erro SSL Blacklist: {str(e)}")
-            return []
+    @staticmethod
+    def _parse_sslblacklist(text):
+        #Def responsável por interpretar fingerprints da JA3 (SSL Blacklist)
+        return [
+            line.split(",")[0] 
+            for line in text.splitlines() 
+            if line and not line.startswith("#")
+        ]
 
-    def _fetch_emergingthreats(self):
-        #Def responsável por buscar fingerprints da JA3
+    @staticmethod
+    def _parse_emergingthreats(text):
         """Fonte secundária: Emerging Threats"""
+        return [
+            line.strip() 
+            for line in text.splitlines() 
+            if line and not line.startswith("#")
+        ]
+
+    @staticmethod
+    def _parse_ja4db(text):
+        """Fonte de fingerprints JA4: base pública ja4db.com"""
+        return [
+            record.get('ja4_fingerprint')
+            for record in json.loads(text)
+            if record.get('ja4_fingerprint')
+        ]
+
+    def _fetch_feed(self, feed):
+        """
+        Requisição condicional (ETag/If-Modified-Since) de um feed
+        
+        Returns:
+            tuple: (feed respondeu, set com os fingerprints ou None se não mudou/falhou,
+                    validadores ETag/Last-Modified a gravar depois de publicado)
+        """
+        state = self.feed_state['feeds'].setdefault(feed['name'], {})
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+            
         try:
-            url = "https://rules.emergingthreats.net/blockrules/ja3-fingerprints.txt"
-            response = requests.get(url, timeout=15)
-            return [
-                line.strip() 
-                for line in response.text.splitlines() 
-                if line and not line.startswith("#")
-            ]
+            response = requests.get(feed['url'], headers=headers, timeout=self.request_timeout)
+            if response.status_code == 304:
+                print(f"[JA3] {feed['name']}: sem alterações")
+                return True, None, None
+            response.raise_for_status()
+            
+            valid = self.FINGERPRINT_FORMATS[feed['kind']]
+            hashes = {h.strip().lower() for h in feed['parser'](response.text) if h}
+            hashes = {h for h in hashes if valid.match(h)}
         except Exception as e:
-            print(f"[JA3] Erro Emerging Threats: {str(e)}")
-            return []
+            print(f"[JA3] Erro em {feed['name']}: {str(e)}")
+            return False, None, None
+            
+        # Resposta vazia não substitui o último snapshot bom
+        if not hashes:
+            print(f"[JA3] AVISO: {feed['name']} não retornou hashes válidos")
+            return False, None, None
+            
+        print(f"[JA3] {len(hashes)} hashes de {feed['name']}")
+        return True, hashes, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
 
     def _update_database(self):
         #Def para atualiar o vanco de dados de fingerprints JA3 
-        new_hashes = set()
-        
-        for source in self.data_sources:
-            try:
-                hashes = source()
-                new_hashes.update(hashes)
-                print(f"[JA3] {len(hashes)} hashes de {source.__name__}")
-            except Exception as e:
-                print(f"[JA3] Erro em {source.__name__}: {str(e)}")
+        # Apenas uma reconstrução por vez; as consultas nunca esperam por ela
+        if not self._update_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._rebuild_snapshot()
+        finally:
+            self._update_lock.release()
+
+    def _rebuild_snapshot(self):
+        """Atualiza os feeds e publica um novo snapshot se algo mudou"""
+        # Diferenças por tipo em relação aos snapshots de cada feed
+        # O .txt e o ETag de cada feed só são gravados depois que a nova geração foi
+        # publicada: se a construção falhar, a próxima execução baixa e reconstrói de novo
+        changes = {}
+        fetched = {}   # feed -> (conteúdo novo ou None se igual ao .txt, validadores)
+        reached = 0
+        for feed in self.feeds:
+            ok, hashes, validators = self._fetch_feed(feed)
+            reached += ok
+            if hashes is None:
+                continue
+                
+            previous = self._read_snapshot(feed['name'])
+            added, removed = hashes - previous, previous - hashes
+            fetched[feed['name']] = (hashes if added or removed else None, validators)
+            if added or removed:
+                kind_changes = changes.setdefault(feed['kind'], {'added': set(), 'removed': False})
+                kind_changes['added'] |= added
+                kind_changes['removed'] |= bool(removed)
+                print(f"[JA3] {feed['name']}: +{len(added)} / -{len(removed)}")
         
-        if not new_hashes:
-            print("[JA3] AVISO: Nenhum hash válido obtido das fontes!")
-            return
+        if not reached:
+            # Sem rede: o snapshot atual continua valendo e nova tentativa ocorre depois
+            print("[JA3] AVISO: Nenhuma fonte disponível, mantendo o último snapshot")
+            return False
             
-        with self.lock:
-            # CORREÇÃO: Usar initial_capacity em vez de capacity
-            self.ja3_bloom = ScalableBloomFilter(
-                initial_capacity=max(len(new_hashes)*2, 10000),  # Corrigido aqui
-                error_rate=0.001
-            )
+        current = self._snapshot
+        generations = dict(current.generations)
+        blooms = dict(current.blooms)
+        stores = dict(current.stores)
+        for kind, kind_changes in changes.items():
+            merged = set()
+            for feed in self.feeds:
+                if feed['kind'] == kind:
+                    hashes = fetched.get(feed['name'], (None, None))[0]
+                    merged |= hashes if hashes is not None else self._read_snapshot(feed['name'])
             
-            for ja3_hash in new_hashes:
-                if ja3_hash and len(ja3_hash) == 32:  # Valida formato MD5
-                    self.ja3_bloom.add(ja3_hash)
+            bloom = current.blooms[kind]
+            if bloom is not None and not kind_changes['removed']:
+                # Apenas inclusões: o filtro atual recebe só os novos hashes
+                bloom = copy.deepcopy(bloom)
+                additions = kind_changes['added']
+            else:
+                # CORREÇÃO: Usar initial_capacity em vez de capacity
+                bloom = ScalableBloomFilter(
+                    initial_capacity=max(len(merged)*2, 10000),  # Corrigido aqui
+                    error_rate=0.001
+                )
+                additions = merged
+            for fingerprint in additions:
+                bloom.add(fingerprint)
+                
+            # Arquivos de uma nova geração: os mapeados pelo snapshot atual não são tocados
+            generations[kind] = current.generations.get(kind, 0) + 1
+            self._save_bloom(self._bloom_path(kind, generations[kind]), bloom)
+            blooms[kind] = bloom
+            stores[kind] = FingerprintStore.build(
+                self._store_path(kind, generations[kind]),
+                (FingerprintStore.digest(h, kind) for h in merged)
+            )
             
-            self.last_update = datetime.now()
-            print(f"[JA3] Database atualizada. Hashes únicos: {len(new_hashes)}")
+        # Publicação: uma única atribuição de referência
+        self._snapshot = FingerprintSnapshot(generations, blooms, stores)
+        for name, (hashes, validators) in fetched.items():
+            if hashes is not None:
+                self._write_snapshot(name, hashes)
+            self.feed_state['feeds'].setdefault(name, {}).update(validators)
+        self.last_update = datetime.now()
+        self.feed_state['last_update'] = self.last_update.isoformat()
+        self.feed_state['generations'] = generations
+        self._save_feed_state()
+        self._remove_old_generations(generations)
+        print(f"[JA3] Database atualizada. Hashes únicos: "
+              f"{ {kind: len(store) for kind, store in stores.items()} }")
+        return True
+
+    def _snapshot_path(self, name):
+        return os.path.join(self.feeds_dir, f"{name}.txt")
+
+    def _read_snapshot(self, name):
+        """Último conteúdo bom de um feed"""
+        path = self._snapshot_path(name)
+        if not os.path.exists(path):
+            return set()
+        with open(path, 'r') as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _write_snapshot(self, name, hashes):
+        path = self._snapshot_path(name)
+        with open(path + ".tmp", 'w') as f:
+            f.write('\n'.join(sorted(hashes)) + '\n')
+        os.replace(path + ".tmp", path)
+
+    def _load_feed_state(self):
+        """ETag/Last-Modified de cada feed e data da última atualização"""
+        path = os.path.join(self.data_dir, "feeds.json")
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('feeds', {})
+        return state
+
+    def _save_feed_state(self):
+        path = os.path.join(self.data_dir, "feeds.json")
+        try:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(self.feed_state, f, indent=4)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"[JA3] Erro ao salvar estado dos feeds: {str(e)}")
 
     def start_auto_update(self):
         #Implementa um mecanismo de atualização automática para o banco de dados JA3.
-        def updater():
-            while True:
-                try:
-                    now = datetime.now()
-                    if not self.last_update or (now - self.last_update) >= self.update_interval:
-                        print("[JA3] Iniciando atualização periódica...")
-                        self._update_database()
-                except Exception as e:
-                    print(f"[JA3] Erro no updater: {str(e)}")
-                
-                time.sleep(60)  # Verifica a cada minuto
+        delay = 0.0
+        if self.last_update:
+            due = self.last_update + self.update_interval
+            delay = max((due - datetime.now()).total_seconds(), 0.0)
+        self._schedule_update(delay)
+
+    def stop_auto_update(self):
+        """Cancela o próximo job de atualização agendado"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.stats['next_run'] = None
+
+    def _schedule_update(self, delay):
+        """Agenda o job de atualização (timer único, sem polling)"""
+        timer = threading.Timer(delay, self._run_update_job)
+        timer.daemon = True
+        self._timer = timer
+        self.stats['next_run'] = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        timer.start()
+
+    def _run_update_job(self):
+        """Job agendado: atualiza, registra duração/tamanho e agenda o próximo"""
+        print("[JA3] Iniciando atualização periódica...")
+        started = time.perf_counter()
+        try:
+            status = 'ok' if self._update_database() else 'offline'
+        except Exception as e:
+            status = f"erro: {str(e)}"
+            print(f"[JA3] Erro no updater: {str(e)}")
+            
+        self.stats['runs'] += 1
+        self.stats['last_run'] = datetime.now().isoformat()
+        self.stats['last_duration'] = round(time.perf_counter() - started, 3)
+        self.stats['last_status'] = status
+        self._update_size_stats()
+        
+        if self._timer is not None:
+            interval = self.update_interval if status == 'ok' else self.retry_interval
+            self._schedule_update(interval.total_seconds())
 
-        threading.Thread(target=updater, daemon=True).start()
+    def _update_size_stats(self):
+        """Quantidade de fingerprints e bytes em disco do snapshot corrente"""
+        snapshot = self._snapshot
+        self.stats['fingerprints'] = {kind: len(store) for kind, store in snapshot.stores.items()}
+        self.stats['disk_bytes'] = sum(
+            os.path.getsize(path)
+            for kind, generation in snapshot.generations.items()
+            for path in (self._store_path(kind, generation), self._bloom_path(kind, generation))
+            if os.path.exists(path)
+        )
+        self.stats['generations'] = dict(snapshot.generations)
 
-    def is_malicious(self, ja3_hash):
-        #Verifica se os hashs são maliciosos
-        if not ja3_hash or len(ja3_hash) != 32:
+    def is_malicious(self, ja3_hash, kind='ja3'):
+        #Verifica se os hashs são maliciosos (kind: 'ja3', 'ja3s' ou 'ja4')
+        valid = self.FINGERPRINT_FORMATS.get(kind)
+        if not ja3_hash or valid is None or not valid.match(ja3_hash):
             return False
             
-        with self.lock:
-            if ja3_hash in self.ja3_bloom:  # Verificação rápida
-                return self._double_check(ja3_hash)  # Confirmação
-        return False
+        # Sem lock: o snapshot é imutável e a troca é uma atribuição atômica
+        snapshot = self._snapshot
+        bloom = snapshot.blooms[kind]
+        if bloom is not None and ja3_hash not in bloom:  # Verificação rápida
+            return False
+        return self._double_check(snapshot, ja3_hash, kind)  # Confirmação
         
-    def _double_check(self, ja3_hash):
-        """Verificação secundária contra uma fonte mais precisa"""
-        # Exemplo: consultar um banco de dados exato (não probabilístico)
-        return ja3_hash in self.exact_database  # Supondo que existe uma lista exata
+    def _double_check(self, snapshot, ja3_hash, kind='ja3'):
+        """Verificação secundária contra o conjunto exato (não probabilístico)"""
+        return FingerprintStore.digest(ja3_hash, kind) in snapshot.stores[kind]
+
+    def _store_path(self, kind, generation):
+        return os.path.join(self.data_dir, f"{kind}_exact.{generation}.bin")
+
+    def _bloom_path(self, kind, generation):
+        return os.path.join(self.data_dir, f"{kind}_bloom.{generation}.bin")
+
+    def _open_snapshot(self, generations):
+        """Abre o snapshot persistido (O(1) para os conjuntos exatos)"""
+        generations = {kind: generations.get(kind, 0) for kind in self.FINGERPRINT_FORMATS}
+        return FingerprintSnapshot(
+            generations,
+            {kind: self._load_bloom(self._bloom_path(kind, gen)) for kind, gen in generations.items()},
+            {kind: FingerprintStore(self._store_path(kind, gen)) for kind, gen in generations.items()}
+        )
+
+    def _remove_old_generations(self, generations):
+        """Remove arquivos de gerações anteriores (os ainda mapeados ficam para a próxima)"""
+        pattern = re.compile(r'^(\w+?)_(exact|bloom)\.(\d+)\.bin$')
+        for name in os.listdir(self.data_dir):
+            match = pattern.match(name)
+            if match and int(match.group(3)) < generations.get(match.group(1), 0):
+                try:
+                    os.remove(os.path.join(self.data_dir, name))
+                except OSError:
+                    pass
+
+    def _load_bloom(self, path):
+        """Carrega o pré-filtro salvo; sem ele a consulta vai direto ao conjunto exato"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return ScalableBloomFilter.fromfile(f)
+        except Exception as e:
+            print(f"[JA3] Erro ao carregar filtro Bloom {path}: {str(e)}")
+            return None
+
+    def _save_bloom(self, path, bloom):
+        try:
+            with open(path + ".tmp", 'wb') as f:
+                bloom.tofile(f)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"[JA3] Erro ao salvar filtro Bloom {path}: {str(e)}")
 
 class AdvancedFirewall(QObject):
     alert_triggered = Signal(str)
@@ -1489,6 +4656,9 @@ class AdvancedFirewall(QObject):
         # Gerenciadores
         self.acl_manager = ACLManager()
         self.ja3_db = JA3DatabaseManager()
+        self.reputation = ReputationTable()
+        
+        self.enforcement = EnforcementQueue(self)
         
         # Sistema de IA (opcional)
         self.ai_chooser = AIChooser(self.ui) if self.ui else None
@@ -1509,16 +4679,21 @@ class AdvancedFirewall(QObject):
             'dpi_alerts': 0,
             'ips_blocked': 0,
             'last_alert': None,
-            'ai_detections': 0
+            'ai_detections': 0,
+            'ja3_db': self.ja3_db.stats,  # Atualizado pelo job de atualização
+            'enforcement': self.enforcement.stats
         }
         
         self.flow_cache = {}
         self.ddos_stats = {}
         self.flow_lock = threading.Lock()
+        self.conntrack = ConnectionTracker()
         self.ddos_thresholds = {
             'packet_rate': 1000,
             'bandwidth': 10e6,
-            'syn_rate': 500
+            'syn_rate': 500,
+            'half_open': 256,
+            'slow_connections': 50
         }
 
     def _init_network_interface(self):
@@ -1553,9 +4728,8 @@ class AdvancedFirewall(QObject):
             # Processa o pacote através do pipeline
             result = self.pipeline.process_packet(pkt)
             
-            if result['block']:
-                src_ip = pkt[IP].src
-                self._block_ip(src_ip, result['reason'])
+            if result['block'] and result['ip'] is not None:
+                self._block_ip(result['ip'], result['reason'])
                 
         except Exception as e:
             self.logger.error(
@@ -1581,6 +4755,8 @@ class AdvancedFirewall(QObject):
         )
         
         self.running = True
+        if self.pipeline.ai_analyzer is not None:
+            self.pipeline.ai_analyzer.start_batch_analysis()
         try:
             self.sniff_thread = threading.Thread(
                 target=self._start_sniffing,
@@ -1627,6 +4803,14 @@ class AdvancedFirewall(QObject):
         self.running = False
         if hasattr(self, 'sniff_thread'):
             self.sniff_thread.join(timeout=1)
+        self.ja3_db.stop_auto_update()
+        if self.pipeline.ai_analyzer is not None:
+            self.pipeline.ai_analyzer.stop()
+        self.enforcement.stop()
+            
+        # Grava os agregados de eventos ainda pendentes
+        self.logger.stop_periodic_flush()
+        self.logger.flush(force=True)
 
     def _log_tls_anomaly(self, pkt):
         #Registra anomalias TLS para análise posterior
@@ -1673,6 +4857,13 @@ class AdvancedFirewall(QObject):
                 
         return success
 
+    def get_top_risky_ips(self, n=10):
+        """Retorna os IPs de maior reputação de risco para exibição na UI"""
+        return [
+            {'ip': ip, 'score': round(score, 2), 'blocked': self.acl_manager.is_blocked(ip)}
+            for ip, score in self.reputation.top(n)
+        ]
+
     def _control_interface(self):
         #Interface simples de controle
         while self.running:
@@ -1699,7 +4890,7 @@ def testar_firewall():
     
     # (2) Teste JA3 - Fingerprint malicioso
     pkt_tls = IP(src="192.168.1.100")/TLS()
-    fw.ja3_db.is_malicious = lambda x: True  # Simula como malicioso
+    fw.ja3_db.is_malicious = lambda x, kind='ja3': True  # Simula como malicioso
     resultado = fw.pipeline.ja3_analyzer.analyze(pkt_tls)
     print("🔎 Teste JA3 (TLS):", "✅ Bloqueado!" if resultado else "❌ Falhou!")
     
@@ -1743,7 +4934,300 @@ def testar_ia():
         resultado = fw.pipeline.ai_analyzer.test_ai_analysis(caso['features'])
         print("✅ Classificado corretamente!" if resultado == ("DDoS" in caso['name']) else "❌ Falha na classificação")
 
+def benchmark_inferencia(model=None, n_features=50, n_rows=20000, batch_sizes=(1, 32, 256, 1024)):
+    """Mede vazão e latência p99 do InferenceBatcher para cada tamanho de lote"""
+    rng = np.random.default_rng(42)
+    rows = rng.random((n_rows, n_features), dtype=np.float32)
+    
+    if model is None:
+        # Modelo sintético com a mesma forma do modelo de produção (10 classes)
+        import xgboost as xgb
+        model = xgb.XGBClassifier(n_estimators=100, max_depth=6, tree_method='hist')
+        model.fit(rows[:5000], rng.integers(0, 10, 5000))
+    
+    results = []
+    for batch_size in batch_sizes:
+        batcher = InferenceBatcher(model, n_features, max_batch=batch_size, max_delay=0.005)
+        latencies = np.zeros(n_rows)
+        done = threading.Semaphore(0)
+        
+        def make_callback(i, submitted):
+            def callback(label, confidence):
+                latencies[i] = time.perf_counter() - submitted
+                done.release()
+            return callback
+        
+        started = time.perf_counter()
+        for i in range(n_rows):
+            batcher.submit(rows[i], make_callback(i, time.perf_counter()))
+        for _ in range(n_rows):
+            done.acquire()
+        elapsed = time.perf_counter() - started
+        batcher.stop()
+        
+        results.append({
+            'batch_size': batch_size,
+            'rows_per_s': round(n_rows / elapsed),
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+            'batches': batcher.stats['batches']
+        })
+        print(f"lote={batch_size:5d}  vazão={results[-1]['rows_per_s']:8d} linhas/s  "
+              f"p50={results[-1]['p50_ms']:8.3f} ms  p99={results[-1]['p99_ms']:8.3f} ms")
+    
+    return results
+
+def benchmark_compilador(model=None, n_features=50, batch_sizes=(1, 32, 256, 1024), repeats=50):
+    """Compara a latência de predict_proba do modelo original e do CompiledTreeModel"""
+    rng = np.random.default_rng(42)
+    rows = rng.random((max(batch_sizes), n_features), dtype=np.float32)
+    
+    if model is None:
+        # Modelo sintético com a mesma forma do modelo de produção (10 classes)
+        import xgboost as xgb
+        model = xgb.XGBClassifier(n_estimators=100, max_depth=6, tree_method='hist')
+        model.fit(rng.random((5000, n_features), dtype=np.float32), rng.integers(0, 10, 5000))
+    compiled = CompiledTreeModel.compile(model)
+    
+    results = []
+    for batch_size in batch_sizes:
+        batch = rows[:batch_size]
+        timings = {}
+        for name, candidate in (('original', model), ('compilado', compiled)):
+            candidate.predict_proba(batch)
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                candidate.predict_proba(batch)
+                samples.append(time.perf_counter() - started)
+            timings[name] = float(np.median(samples)) * 1000
+            
+        max_diff = float(np.abs(model.predict_proba(batch) - compiled.predict_proba(batch)).max())
+        results.append({
+            'batch_size': batch_size,
+            'original_ms': round(timings['original'], 3),
+            'compiled_ms': round(timings['compilado'], 3),
+            'speedup': round(timings['original'] / timings['compilado'], 2),
+            'max_abs_diff': max_diff
+        })
+        print(f"lote={batch_size:5d}  original={timings['original']:8.3f} ms  "
+              f"compilado={timings['compilado']:8.3f} ms  diferença máx={max_diff:.2e}")
+    
+    # Modelo com early stopping: o compilado precisa parar no mesmo best_iteration
+    import xgboost as xgb
+    X_fit = rng.random((3000, n_features), dtype=np.float32)
+    y_fit = (X_fit[:, 0] + rng.normal(0, 0.3, 3000) > 0.5).astype(int) + 2 * (X_fit[:, 1] > 0.5)
+    early = xgb.XGBClassifier(n_estimators=500, max_depth=6, learning_rate=0.3, early_stopping_rounds=5)
+    early.fit(X_fit[:2000], y_fit[:2000], eval_set=[(X_fit[2000:], y_fit[2000:])], verbose=False)
+    early_diff = float(np.abs(early.predict_proba(rows) - CompiledTreeModel.compile(early).predict_proba(rows)).max())
+    results.append({
+        'batch_size': len(rows),
+        'case': 'early_stopping',
+        'best_iteration': int(early.best_iteration),
+        'max_abs_diff': early_diff
+    })
+    print(f"early stopping (best_iteration={early.best_iteration}, "
+          f"{early.get_booster().num_boosted_rounds()} rodadas)  diferença máx={early_diff:.2e}")
+    
+    return results
+
+def replay_feature_matrix(pcap=None, n_flows=5000, seed=42):
+    """Vetores de fluxo (ordem de CIC_FLOW_FEATURES) obtidos reproduzindo tráfego no extrator.
+    
+    Sem pcap, reproduz sessões sintéticas (DNS, HTTPS e varredura de portas) direto no CICFlow.
+    """
+    if pcap:
+        from scapy.utils import PcapReader
+        extractor = NetworkFeatureExtractor()
+        rows = []
+        with PcapReader(pcap) as reader:
+            for pkt in reader:
+                flow, event = extractor.update_flow_stats(pkt)
+                if event is not None:
+                    rows.append(flow.features())
+                rows.extend(expired.features() for expired in extractor.expire_idle())
+        rows.extend(flow.features() for flow in extractor.flows.values())
+        return np.vstack(rows) if rows else np.zeros((0, len(CIC_FLOW_FEATURES)), dtype=np.float32)
+        
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_flows):
+        ts = 1.7e15 + i * 1e4
+        kind = rng.choice(('dns', 'https', 'scan'), p=(0.4, 0.5, 0.1))
+        if kind == 'dns':
+            flow = CICFlow('10.0.0.2', '10.0.0.1', int(rng.integers(1024, 65535)), 53, 17, ts)
+            flow.add_packet(True, ts, int(rng.integers(28, 60)), 8)
+            flow.add_packet(False, ts + rng.integers(2000, 40000), int(rng.integers(44, 300)), 8)
+        elif kind == 'https':
+            flow = CICFlow('10.0.0.2', '10.0.0.3', int(rng.integers(1024, 65535)), 443, 6, ts)
+            for n in range(int(rng.integers(4, 120))):
+                ts += rng.exponential(50000)
+                flow.add_packet(n % 2 == 0, ts, int(rng.integers(0, 1460)), 32,
+                                CICFlow.TCP_ACK | CICFlow.TCP_PSH, int(rng.integers(1024, 65535)))
+        else:
+            flow = CICFlow('10.0.0.9', '10.0.0.3', int(rng.integers(1024, 65535)), int(rng.integers(1, 1024)), 6, ts)
+            flow.add_packet(True, ts, 0, 20, CICFlow.TCP_SYN, 1024)
+            if rng.random() < 0.5:
+                flow.add_packet(False, ts + rng.integers(50, 500), 0, 20, CICFlow.TCP_RST | CICFlow.TCP_ACK, 0)
+        rows.append(flow.features())
+    return np.vstack(rows)
+
+def _benchmark_model(path, matrices, single_rows, batch_sizes):
+    """Carga, memória e latência de um modelo em cada matriz, lote e motor de avaliação"""
+    import warnings
+    process = psutil.Process()
+    entry = {'name': os.path.basename(path), 'path': path, 'status': 'erro', 'error': None}
+    try:
+        # Bibliotecas importadas antes: load_s mede só a leitura do modelo
+        started = time.perf_counter()
+        import joblib
+        import xgboost
+        import sklearn.ensemble
+        entry['import_s'] = round(time.perf_counter() - started, 3)
+        
+        rss_before = process.memory_info().rss
+        started = time.perf_counter()
+        model, _ = load_model_file(path)
+        entry['load_s'] = round(time.perf_counter() - started, 3)
+        entry['memory_mb'] = round((process.memory_info().rss - rss_before) / 2**20, 1)
+        entry['baseline_rss_mb'] = round(rss_before / 2**20, 1)  # Processo já com as bibliotecas
+        entry['disk_mb'] = round(os.path.getsize(path) / 2**20, 2)
+        
+        names = model_feature_names(model)
+        positions = {name: i for i, name in enumerate(CIC_FLOW_FEATURES)}
+        columns = np.array([positions.get(name, len(CIC_FLOW_FEATURES)) for name in names])
+        entry['n_features'] = len(names)
+        
+        engines = {'original': model}
+        try:
+            engines['compilado'] = CompiledTreeModel.compile(model)
+        except Exception as e:
+            entry['compile_error'] = (str(e).strip().splitlines() or [type(e).__name__])[0]
+            
+        entry['results'] = []
+        # Modelos do scikit-learn treinados com DataFrame avisam a cada chamada com arrays
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        for matrix_name, matrix in matrices.items():
+            X = np.ascontiguousarray(
+                np.column_stack((matrix, np.zeros(len(matrix), dtype=np.float32)))[:, columns],
+                dtype=np.float32
+            )
+            for engine_name, engine in engines.items():
+                engine.predict_proba(X[:1])  # Warm-up
+                for batch_size in (1,) + tuple(batch_sizes):
+                    limit = single_rows if batch_size == 1 else len(X)
+                    starts = range(0, min(limit, len(X)) - batch_size + 1, batch_size)
+                    if not starts:
+                        continue
+                    latencies = np.empty(len(starts))
+                    for j, start in enumerate(starts):
+                        t0 = time.perf_counter()
+                        engine.predict_proba(X[start:start + batch_size])
+                        latencies[j] = time.perf_counter() - t0
+                    entry['results'].append({
+                        'matrix': matrix_name,
+                        'engine': engine_name,
+                        'batch_size': batch_size,
+                        'rows': len(starts) * batch_size,
+                        'rows_per_s': round(len(starts) * batch_size / latencies.sum()),
+                        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 4),
+                        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 4)
+                    })
+        entry['status'] = 'ok'
+    except Exception as e:
+        entry['error'] = (str(e).strip().splitlines() or [type(e).__name__])[0]
+    entry['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return entry
+
+def _benchmark_model_main(path, matrices, single_rows, batch_sizes, conn):
+    """Processo isolado por modelo: o pico de memória medido é só dele"""
+    conn.send(_benchmark_model(path, matrices, single_rows, batch_sizes))
+    conn.close()
+
+def benchmark_modelos(model_dir=None, model_paths=None, output='benchmark_modelos.json', pcap=None,
+                      n_rows=20000, single_rows=2000, batch_sizes=(32, 256, 1024), isolate=True):
+    """Compara os modelos configurados no AIChooser e grava o relatório em JSON.
+    
+    Cada modelo roda num processo próprio (isolate=True) sobre duas matrizes: 'replay'
+    (pcap ou sessões sintéticas passadas pelo extrator) e 'sintetica' (valores aleatórios
+    dentro da faixa de cada coluna do replay).
+    """
+    import multiprocessing
+    model_dir = model_dir or AIChooser.DEFAULT_MODEL_DIR
+    model_paths = model_paths or AIChooser.DEFAULT_MODEL_PATHS
+    paths = [AIChooser._bundle_for(os.path.join(model_dir, name)) for _, name in sorted(model_paths.items())]
+    
+    replay = replay_feature_matrix(pcap, n_flows=n_rows)
+    rng = np.random.default_rng(42)
+    high = np.maximum(replay.max(axis=0), 1.0) if len(replay) else np.ones(len(CIC_FLOW_FEATURES))
+    matrices = {
+        'replay': replay,
+        'sintetica': (rng.random((n_rows, len(CIC_FLOW_FEATURES))) * high).astype(np.float32)
+    }
+    
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'memory_mb': round(psutil.virtual_memory().total / 2**20)
+        },
+        'matrices': {name: list(matrix.shape) for name, matrix in matrices.items()},
+        'source': pcap or 'sessões sintéticas',
+        'models': []
+    }
+    for path in paths:
+        if not isolate:
+            entry = _benchmark_model(path, matrices, single_rows, batch_sizes)
+        else:
+            context = multiprocessing.get_context('spawn')
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_benchmark_model_main,
+                args=(path, matrices, single_rows, tuple(batch_sizes), sender),
+                daemon=True
+            )
+            process.start()
+            sender.close()
+            try:
+                entry = receiver.recv()
+            except EOFError:
+                entry = {'name': os.path.basename(path), 'path': path, 'status': 'erro',
+                         'error': f"processo encerrado (código {process.exitcode})"}
+            process.join()
+        report['models'].append(entry)
+        
+        if entry['status'] != 'ok':
+            print(f"{entry['name']}: erro - {entry['error']}")
+            continue
+        print(f"{entry['name']}: carga {entry['load_s']:.2f}s, +{entry['memory_mb']:.1f} MB, "
+              f"pico {entry['peak_rss_mb']:.1f} MB, {entry['n_features']} features")
+        for result in entry['results']:
+            print(f"  {result['matrix']:9s} {result['engine']:9s} lote={result['batch_size']:5d}  "
+                  f"vazão={result['rows_per_s']:9d} linhas/s  p50={result['p50_ms']:8.3f} ms  "
+                  f"p99={result['p99_ms']:8.3f} ms")
+                  
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Relatório gravado em {output}")
+    return report
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark-modelos':
+        # Roda em qualquer sistema: não captura tráfego
+        import argparse
+        parser = argparse.ArgumentParser(description="Benchmark de inferência dos modelos de IA")
+        parser.add_argument('--benchmark-modelos', action='store_true')
+        parser.add_argument('--saida', default='benchmark_modelos.json', help="arquivo JSON do relatório")
+        parser.add_argument('--modelos', default=None, help="diretório dos modelos")
+        parser.add_argument('--pcap', default=None, help="captura para a matriz de replay")
+        parser.add_argument('--linhas', type=int, default=20000, help="linhas por matriz")
+        args = parser.parse_args()
+        benchmark_modelos(model_dir=args.modelos, output=args.saida, pcap=args.pcap, n_rows=args.linhas)
+        sys.exit(0)
+        
     if platform.system() != "Windows":
         print("[!] Este software é exclusivo para Windows!")
         sys.exit(1)
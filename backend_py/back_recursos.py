@@ -0,0 +1,12 @@
+import sys
+import psutil
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (MB)"""
+    info = psutil.Process().memory_info()
+    if hasattr(info, 'peak_wset'):  # Windows
+        return info.peak_wset / 2**20
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
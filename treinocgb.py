@@ -5,50 +5,285 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report
 import xgboost as xgb
 from sklearn.feature_selection import SelectKBest, f_classif
-from imblearn.over_sampling import SMOTE
+from sklearn.tree import DecisionTreeClassifier
 import matplotlib.pyplot as plt
 import os
+import sys
+import json
+import time
+import tempfile
 import joblib
+from datetime import datetime
+from collections import defaultdict
+import sklearn
+
+# Utilitários compartilhados com o firewall (backend_py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend_py'))
+from back_recursos import peak_rss_mb
 
 # ========== CONFIGURAÇÕES ==========
 DATASET_DIR = './data'
 NUM_CSVS = 4
-USE_GPU = True
+USE_GPU = False  # As máquinas de treino não têm GPU: 'hist' na CPU
 FEATURE_SELECTION = True
-APPLY_SMOTE = True  # Novo: aplicar oversampling
+BALANCING = 'weights'  # 'weights' (peso por classe), 'smote' (oversampling em memória) ou None
+MAX_BIN = 256
+N_FOLDS = 3
+# Memória externa: o XGBoost lê as partições do cache em lotes, sem montar o dataset na RAM
+EXTERNAL_MEMORY = False
+SAMPLE_ROWS = 1_000_000  # Amostra em memória (seleção de features e cascata) no modo externo
+PROFILE_LOG = 'treino_perfis.json'  # Tempo e pico de memória de cada configuração treinada
+
+# Busca de hiperparâmetros: trials x folds num pool de processos, com poda pela mediana
+TUNING = False
+TUNING_TRIALS = 24
+TUNING_CORES = os.cpu_count() or 1  # Orçamento total de núcleos (processos x threads)
+TUNING_THREADS_PER_JOB = 1
+TUNING_ROUNDS = 500
+PRUNE_EVERY = 25       # Intervalo (rodadas) entre os relatos do mlogloss de validação
+PRUNE_WARMUP = 50      # Nenhum trial é podado antes desta rodada
+PRUNE_MIN_TRIALS = 4   # Relatos de outros trials exigidos para comparar com a mediana
+TUNING_LATENCY_BUDGET_MS = None  # Latência p99 máxima (1 fluxo) do modelo escolhido
+LEADERBOARD_PATH = 'tuning_leaderboard.json'
+# Lista = escolha; (mín, máx) = uniforme; (mín, máx, 'log') = log-uniforme
+SEARCH_SPACE = {
+    'max_depth': [4, 6, 8, 10],
+    'learning_rate': (0.02, 0.3, 'log'),
+    'subsample': (0.6, 1.0),
+    'colsample_bytree': (0.5, 1.0),
+    'min_child_weight': (1.0, 10.0, 'log'),
+    'reg_lambda': (0.01, 10.0, 'log')
+}
+
+# Cascata: árvore rasa sobre features baratas decide os fluxos óbvios;
+# só os da faixa de incerteza vão para o XGBoost completo
+CASCADE = True
+CASCADE_TARGET_RECALL = 0.99      # Recall de ataques exigido da cascata inteira
+CASCADE_TARGET_PRECISION = 0.999  # Precisão exigida para o 1º estágio bloquear sozinho
+TIER1_MAX_DEPTH = 4
+TIER1_FEATURES = [
+    'Dst Port', 'Protocol', 'Flow Duration', 'Tot Fwd Pkts', 'TotLen Fwd Pkts',
+    'Pkt Len Max', 'Init Fwd Win Byts', 'Init Bwd Win Byts', 'Fwd Seg Size Min'
+]
+BENIGN_LABEL = 'Benign'
+
+# Pacote lido pelo firewall (back_firewall.load_model_bundle)
+MODEL_BUNDLE_PATH = 'xgboost_model.bundle'
+MODEL_BUNDLE_FORMAT = 'tecguard-model-bundle'
+MODEL_BUNDLE_VERSION = 1
 
 # ========== CARREGAMENTO DE DADOS ==========
+# Cache binário por CSV: features float32 (memmap), códigos de rótulo e metadados
+CACHE_DIR = os.path.join(DATASET_DIR, '.cache')
+CACHE_VERSION = 2
+CHUNK_ROWS = 500_000
+LABEL_COLUMN = 'Label'
+DROP_COLUMNS = ['Timestamp', 'Flow ID', 'Src IP', 'Dst IP', 'Src Port']  # Identificadores, não features
+# Colunas inteiras do CSE-CIC-IDS2018 (dtype lógico do meta.json e do pacote; o cache é float32)
+INT32_COLUMNS = {
+    'Dst Port', 'Protocol', 'Flow Duration', 'Tot Fwd Pkts', 'Tot Bwd Pkts',
+    'TotLen Fwd Pkts', 'TotLen Bwd Pkts', 'Fwd Pkt Len Max', 'Fwd Pkt Len Min',
+    'Bwd Pkt Len Max', 'Bwd Pkt Len Min', 'Flow IAT Max', 'Flow IAT Min', 'Fwd IAT Tot',
+    'Fwd IAT Max', 'Fwd IAT Min', 'Bwd IAT Tot', 'Bwd IAT Max', 'Bwd IAT Min',
+    'Fwd PSH Flags', 'Bwd PSH Flags', 'Fwd URG Flags', 'Bwd URG Flags', 'Fwd Header Len',
+    'Bwd Header Len', 'Pkt Len Min', 'Pkt Len Max', 'FIN Flag Cnt', 'SYN Flag Cnt',
+    'RST Flag Cnt', 'PSH Flag Cnt', 'ACK Flag Cnt', 'URG Flag Cnt', 'CWE Flag Count',
+    'ECE Flag Cnt', 'Down/Up Ratio', 'Fwd Byts/b Avg', 'Fwd Pkts/b Avg', 'Fwd Blk Rate Avg',
+    'Bwd Byts/b Avg', 'Bwd Pkts/b Avg', 'Bwd Blk Rate Avg', 'Subflow Fwd Pkts',
+    'Subflow Fwd Byts', 'Subflow Bwd Pkts', 'Subflow Bwd Byts', 'Init Fwd Win Byts',
+    'Init Bwd Win Byts', 'Fwd Act Data Pkts', 'Fwd Seg Size Min', 'Active Max', 'Active Min',
+    'Idle Max', 'Idle Min'
+}
+
+def feature_dtypes(columns):
+    """dtype de cada coluna de feature: int32 para contagens/portas/flags, float32 para o resto"""
+    return {col: 'int32' if col in INT32_COLUMNS else 'float32' for col in columns}
+
+class _HeaderFilter:
+    """Arquivo de texto sem as linhas de cabeçalho repetidas no meio do CSV (comum no CIC-IDS)"""
+    
+    def __init__(self, f):
+        self.f = f
+        self.header = f.readline()
+        self._pending = self.header
+    
+    def read(self, size=-1):
+        if self._pending:
+            data, self._pending = self._pending, ''
+            return data
+        lines = self.f.readlines(size if size and size > 0 else -1)
+        return ''.join(line for line in lines if line != self.header)
+
+def _read_chunks(path, columns, dtypes):
+    """
+    Lê o CSV em blocos só com as colunas usadas e os dtypes dados
+    
+    Returns:
+        gerador de (matriz float32 com inf convertido em NaN, rótulos)
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        reader = pd.read_csv(_HeaderFilter(f), usecols=columns + [LABEL_COLUMN],
+                             dtype=dict(dtypes, **{LABEL_COLUMN: str}), chunksize=CHUNK_ROWS)
+        for chunk in reader:
+            if any(dtype is str for dtype in dtypes.values()):
+                X = np.column_stack([
+                    pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=np.float32) for col in columns
+                ])
+            else:
+                X = chunk[columns].to_numpy(dtype=np.float32)
+            X[np.isinf(X)] = np.nan
+            yield X, chunk[LABEL_COLUMN].to_numpy()
+
+def _cache_paths(path):
+    partition = os.path.join(CACHE_DIR, os.path.splitext(os.path.basename(path))[0])
+    return {
+        'dir': partition,
+        'features': os.path.join(partition, 'features.f32'),
+        'labels': os.path.join(partition, 'labels.npy'),
+        'meta': os.path.join(partition, 'meta.json')
+    }
+
+def build_cache(path, columns):
+    """Converte um CSV em partição binária, bloco a bloco (memória ~ um bloco)"""
+    paths = _cache_paths(path)
+    os.makedirs(paths['dir'], exist_ok=True)
+    stat = os.stat(path)
+    
+    # Tudo lido como float32 (o formato do cache): o parser int32 do pandas estoura valores
+    # fora da faixa sem erro. Texto no meio da coluna força a leitura com coerção
+    strategies = [
+        ('float32', {col: np.float32 for col in columns}),
+        ('texto com coerção', {col: str for col in columns})
+    ]
+    for attempt, (name, dtypes) in enumerate(strategies):
+        vocabulary = {}
+        codes = []
+        rows = 0
+        finite_sum = np.zeros(len(columns))
+        finite_count = np.zeros(len(columns), dtype=np.int64)
+        try:
+            with open(paths['features'] + '.tmp', 'wb') as f:
+                for X, labels in _read_chunks(path, columns, dtypes):
+                    # Soma/contagem dos finitos: o NaN é preenchido com a média do dataset inteiro
+                    valid = ~np.isnan(X)
+                    finite_sum += np.where(valid, X, 0).sum(axis=0, dtype=np.float64)
+                    finite_count += valid.sum(axis=0)
+                    f.write(np.ascontiguousarray(X).tobytes())
+                    codes.append(np.array([vocabulary.setdefault(label, len(vocabulary)) for label in labels],
+                                          dtype=np.int16))
+                    rows += len(X)
+            break
+        except ValueError as e:
+            if attempt == len(strategies) - 1:
+                raise
+            print(f"  {os.path.basename(path)}: leitura {name} falhou ({str(e).splitlines()[0]}), "
+                  f"tentando {strategies[attempt + 1][0]}")
+            
+    np.save(paths['labels'], np.concatenate(codes) if codes else np.empty(0, dtype=np.int16))
+    os.replace(paths['features'] + '.tmp', paths['features'])
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.basename(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'rows': rows,
+        'columns': columns,
+        'read_as': name,
+        'dtypes': feature_dtypes(columns),  # dtype lógico; o arquivo é sempre float32
+        'labels': list(vocabulary),
+        'finite_sum': finite_sum.tolist(),
+        'finite_count': finite_count.tolist()
+    }
+    with open(paths['meta'], 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return meta
+
+def load_partition(path, columns):
+    """Partição do CSV (features em memmap, códigos de rótulo, metadados); recria se o CSV mudou"""
+    paths = _cache_paths(path)
+    stat = os.stat(path)
+    meta = None
+    if os.path.exists(paths['meta']):
+        with open(paths['meta'], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    if (meta is None or meta.get('version') != CACHE_VERSION or meta['size'] != stat.st_size
+            or meta['mtime_ns'] != stat.st_mtime_ns or meta['columns'] != columns):
+        started = time.perf_counter()
+        meta = build_cache(path, columns)
+        print(f"  {meta['source']}: {meta['rows']} linhas convertidas em {time.perf_counter() - started:.1f}s")
+    else:
+        print(f"  {meta['source']}: {meta['rows']} linhas do cache")
+        
+    shape = (meta['rows'], len(columns))
+    X = np.memmap(paths['features'], dtype=np.float32, mode='r', shape=shape) if meta['rows'] \
+        else np.empty(shape, dtype=np.float32)
+    return X, np.load(paths['labels']), meta
+
+def open_dataset(limit):
+    """
+    Abre as partições do cache sem copiá-las para a memória
+    
+    Returns:
+        lista de (features em memmap, códigos de rótulo globais), colunas, vocabulário de
+        rótulos (ordenado) e valor de preenchimento do NaN por coluna (média global)
+    """
+    files = sorted(f for f in os.listdir(DATASET_DIR) if f.endswith('.csv'))[:limit]
+    header = pd.read_csv(os.path.join(DATASET_DIR, files[0]), nrows=0).columns
+    # Nomes repetidos no CSV viram "nome.1" no pandas: fica só a primeira ocorrência
+    columns = [
+        col for col in header
+        if col not in DROP_COLUMNS and col != LABEL_COLUMN
+        and not (col.rsplit('.', 1)[0] in header and col.rsplit('.', 1)[-1].isdigit())
+    ]
+    
+    loaded = [load_partition(os.path.join(DATASET_DIR, f), columns) for f in files]
+    
+    # Rótulos: vocabulário global a partir dos vocabulários das partições
+    vocabulary = sorted({label for _, _, meta in loaded for label in meta['labels']})
+    index = {label: i for i, label in enumerate(vocabulary)}
+    partitions = [
+        (X, np.array([index[label] for label in meta['labels']], dtype=np.int16)[part_codes])
+        for X, part_codes, meta in loaded
+    ]
+    
+    # NaN (inclusive inf) recebe a média da coluna no conjunto carregado
+    total = np.sum([meta['finite_sum'] for _, _, meta in loaded], axis=0)
+    count = np.sum([meta['finite_count'] for _, _, meta in loaded], axis=0)
+    fill = np.divide(total, count, out=np.zeros(len(columns)), where=count > 0)
+    return partitions, columns, vocabulary, fill
+
 def load_data(limit):
-    files = [f for f in os.listdir(DATASET_DIR) if f.endswith('.csv')][:limit]
-    dfs = []
-    for f in files:
-        df = pd.read_csv(os.path.join(DATASET_DIR, f), low_memory=False)
-        df = df.loc[:, ~df.columns.duplicated()]
-        if 'Timestamp' in df.columns:
-            df.drop('Timestamp', axis=1, inplace=True)
-        dfs.append(df)
-    return pd.concat(dfs, ignore_index=True)
+    """
+    Carrega os CSVs pelo cache binário (criado na primeira leitura de cada arquivo)
+    
+    Returns:
+        X (DataFrame float32, NaN/inf já tratados), rótulos (Categorical) e dtypes das colunas
+    """
+    partitions, columns, vocabulary, fill = open_dataset(limit)
+    # Uma única cópia em memória: as partições são lidas direto do memmap
+    X = np.concatenate([part[0] for part in partitions]) if len(partitions) > 1 else np.array(partitions[0][0])
+    labels = pd.Categorical.from_codes(np.concatenate([part[1] for part in partitions]), categories=vocabulary)
+    
+    for j in range(len(columns)):
+        column = X[:, j]
+        missing = np.isnan(column)
+        if missing.any():
+            column[missing] = fill[j]
+        
+    return pd.DataFrame(X, columns=columns, copy=False), labels, feature_dtypes(columns)
 
 # ========== PRÉ-PROCESSAMENTO ==========
-def preprocess(df):
+def fit_label_encoder(categories):
+    """LabelEncoder sobre o vocabulário de rótulos (salvo em label_encoder.pkl)"""
     le = LabelEncoder()
-    y = le.fit_transform(df['Label'])
-    X = df.drop('Label', axis=1)
-
-    for col in X.select_dtypes(include=['float64']).columns:
-        X[col] = X[col].astype('float32')
-    for col in X.select_dtypes(include=['int64']).columns:
-        X[col] = X[col].astype('int32')
-
-    X = X.replace([np.inf, -np.inf], np.nan)
-    for col in X.columns:
-        if X[col].isnull().any():
-            if X[col].dtype.kind in 'fi':
-                X[col].fillna(X[col].mean(), inplace=True)
-            else:
-                X[col].fillna(X[col].mode()[0], inplace=True)
-
+    le.fit(np.asarray(categories))
     joblib.dump(le, 'label_encoder.pkl')
+    return le
+
+def preprocess(X, labels):
+    """Codifica os rótulos (as features já chegam limpas do cache)"""
+    le = fit_label_encoder(labels.categories)
+    y = le.transform(np.asarray(labels.categories))[labels.codes]
     return X, y, le.classes_
 
 # ========== SELEÇÃO DE FEATURES ==========
@@ -59,21 +294,146 @@ def select_features(X, y, k=50):
     return X_new, selected
 
 # ========== TREINAMENTO XGBOOST ==========
-def train_xgboost(X, y, classes):
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+def split_data(X, y):
+    """Divisão treino/teste fixa, compartilhada pelo modelo completo e pela cascata"""
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
 
-    if APPLY_SMOTE:
-        print("\nAplicando SMOTE para balanceamento...")
-        sm = SMOTE(random_state=42)
-        X_train, y_train = sm.fit_resample(X_train, y_train)
-        print(f"Shape após SMOTE: {X_train.shape}")
+def training_config():
+    """Configuração de treino registrada junto com o tempo e a memória"""
+    return {
+        'device': 'cuda' if USE_GPU else 'cpu',
+        'tree_method': 'hist',
+        'max_bin': MAX_BIN,
+        'balancing': BALANCING,
+        'external_memory': EXTERNAL_MEMORY,
+        'feature_selection': FEATURE_SELECTION,
+        'tuning': TUNING,
+        'csvs': NUM_CSVS
+    }
+
+class TrainingProfile:
+    """Tempo de parede e pico de memória de cada etapa de uma configuração de treino"""
+    
+    def __init__(self, config):
+        self.config = config
+        self.started = self._last = time.perf_counter()
+        self.stages = []
+        
+    def mark(self, stage):
+        now = time.perf_counter()
+        entry = {'stage': stage, 'wall_s': round(now - self._last, 2), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+        self.stages.append(entry)
+        self._last = now
+        print(f"⏱ {stage}: {entry['wall_s']:.1f}s, pico de memória {entry['peak_rss_mb']:.0f} MB")
+        
+    def summary(self):
+        return {
+            'config': self.config,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'wall_s': round(time.perf_counter() - self.started, 2),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': self.stages
+        }
+        
+    def save(self, path=None):
+        """Acrescenta esta execução ao histórico e imprime a comparação entre configurações"""
+        path = path or PROFILE_LOG
+        runs = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                runs = json.load(f)
+        runs.append(self.summary())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(runs, f, indent=2)
+            
+        print("\n=== Configurações de treino ===")
+        print(f"{'device':<7}{'memória ext.':<14}{'balanceamento':<15}{'csvs':>5}{'tempo (s)':>11}{'pico (MB)':>11}")
+        for run in runs[-10:]:
+            config = run['config']
+            print(f"{config['device']:<7}{str(config['external_memory']):<14}{str(config['balancing']):<15}"
+                  f"{config['csvs']:>5}{run['wall_s']:>11.1f}{run['peak_rss_mb']:>11.0f}")
+        return runs
+
+def class_weights(counts):
+    """Peso 'balanced' por classe (n / (k * n_classe)): substitui o SMOTE sem criar linhas"""
+    counts = np.asarray(counts, dtype=np.float64)
+    weights = np.zeros(len(counts), dtype=np.float32)
+    present = counts > 0
+    weights[present] = counts.sum() / (present.sum() * counts[present])
+    return weights
+
+class PartitionIterator(xgb.DataIter):
+    """Lotes das partições do cache para a memória externa do XGBoost (só linhas dos grupos pedidos)"""
+    
+    def __init__(self, partitions, groups, selected, columns, fill, weights=None, batch_rows=CHUNK_ROWS):
+        """
+        Args:
+            partitions: lista de (features em memmap, rótulos) de open_dataset
+            groups: grupo de cada linha por partição (-1 = teste, 0..N_FOLDS-1 = fold)
+            selected: grupos entregues ao XGBoost
+            columns: índices das colunas usadas pelo modelo
+            fill: valor do NaN por coluna (todas as colunas)
+            weights: peso por classe (class_weights) ou None
+        """
+        self.partitions = partitions
+        self.groups = groups
+        self.selected = list(selected)
+        self.columns = np.asarray(columns)
+        self.fill = np.asarray(fill, dtype=np.float32)[self.columns]
+        self.weights = weights
+        self.batch_rows = batch_rows
+        self.reset()
+        super().__init__(cache_prefix=os.path.join(CACHE_DIR, 'xgb'))
+        
+    def batches(self):
+        for (X, y), groups in zip(self.partitions, self.groups):
+            for start in range(0, len(X), self.batch_rows):
+                rows = np.flatnonzero(np.isin(groups[start:start + self.batch_rows], self.selected)) + start
+                if not len(rows):
+                    continue
+                batch = X[rows][:, self.columns]
+                missing = np.isnan(batch)
+                if missing.any():
+                    batch[missing] = self.fill[np.nonzero(missing)[1]]
+                yield batch, y[rows]
+                
+    def reset(self):
+        self._batches = self.batches()
+        
+    def next(self, input_data):
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        X, y = batch
+        input_data(data=X, label=y, weight=self.weights[y] if self.weights is not None else None)
+        return True
+    
+    def predict(self, model):
+        """Rótulos verdadeiros e previstos nas linhas do iterador, lote a lote"""
+        y_true, y_pred = [], []
+        for X, y in self.batches():
+            y_true.append(y)
+            y_pred.append(model.inplace_predict(X))
+        return np.concatenate(y_true), np.concatenate(y_pred)
+
+def build_matrix(data, label=None, weight=None, ref=None, nthread=None):
+    """QuantileDMatrix do 'hist': direto do array ou, com um PartitionIterator, em memória externa
+    
+    nthread limita as threads da quantização (None = todos os núcleos).
+    """
+    if isinstance(data, PartitionIterator):
+        if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+            return xgb.ExtMemQuantileDMatrix(data, max_bin=MAX_BIN, ref=ref, nthread=nthread)
+        return xgb.DMatrix(data, nthread=nthread)  # xgboost < 3.0: páginas em cache no disco
+    return xgb.QuantileDMatrix(data, label=label, weight=weight, max_bin=MAX_BIN, ref=ref, nthread=nthread)
 
+def xgboost_params(classes, overrides=None):
     params = {
         'objective': 'multi:softmax',
         'num_class': len(classes),
-        'device': 'cuda',
+        'device': 'cuda' if USE_GPU else 'cpu',
+        'tree_method': 'hist',
+        'max_bin': MAX_BIN,
         'eval_metric': 'mlogloss',
         'max_depth': 6,
         'learning_rate': 0.05,
@@ -84,15 +444,24 @@ def train_xgboost(X, y, classes):
         'n_jobs': -1, 
         'seed': 42
     }
+    params.update(overrides or {})
+    return params
 
-    skf = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
+def _fit_and_report(classes, folds, final_matrix, predict_test, profile=None, overrides=None):
+    """
+    Validação cruzada com early stopping, modelo final e relatório no teste
+    
+    Args:
+        folds: gerador de (dtrain, dval, predict_val) por fold; predict_val(model) -> (y, previsto)
+        final_matrix: função que monta a matriz com todo o treino
+        predict_test: função (model) -> (y, previsto) no teste
+        overrides: hiperparâmetros que substituem os padrões (ex.: vencedor da busca)
+    """
+    params = xgboost_params(classes, overrides)
     results = []
 
-    for fold, (train_idx, val_idx) in enumerate(skf.split(X_train, y_train)):
+    for fold, (dtrain, dval, predict_val) in enumerate(folds):
         print(f"\n=== Fold {fold+1} ===")
-        dtrain = xgb.DMatrix(X_train[train_idx].astype('float32'), label=y_train[train_idx])
-        dval = xgb.DMatrix(X_train[val_idx].astype('float32'), label=y_train[val_idx])
-
         model = xgb.train(
             params,
             dtrain,
@@ -101,23 +470,28 @@ def train_xgboost(X, y, classes):
             early_stopping_rounds=50,
             verbose_eval=50
         )
+        del dtrain, dval
 
-        preds = model.predict(xgb.DMatrix(X_train[val_idx].astype('float32')))
-        report = classification_report(y_train[val_idx], preds, output_dict=True)
+        y_val, preds = predict_val(model)
+        report = classification_report(y_val, preds, output_dict=True)
         accuracy = report['accuracy']
         results.append(accuracy)
         print(f"Fold {fold+1} Accuracy: {accuracy:.4f}")
+        if profile:
+            profile.mark(f'fold {fold+1}')
 
     print("\nTreinando modelo final...")
     final_model = xgb.train(
         params,
-        xgb.DMatrix(X_train.astype('float32'), label=y_train),
+        final_matrix(),
         num_boost_round=model.best_iteration + 50
     )
+    if profile:
+        profile.mark('modelo final')
 
-    test_preds = final_model.predict(xgb.DMatrix(X_test.astype('float32')))
+    y_test, test_preds = predict_test(final_model)
     print("\nRelatório Final de Classificação:")
-    print(classification_report(y_test, test_preds, target_names=classes))
+    print(classification_report(y_test, test_preds, labels=range(len(classes)), target_names=classes))
 
     plt.figure(figsize=(12, 8))
     xgb.plot_importance(final_model, max_num_features=20)
@@ -129,6 +503,521 @@ def train_xgboost(X, y, classes):
 
     return final_model
 
+def train_xgboost(X, y, classes, profile=None, overrides=None):
+    """Treino com o dataset em memória: uma conversão float32 e QuantileDMatrix por fold"""
+    X = np.asarray(X, dtype=np.float32)
+    X_train, X_test, y_train, y_test = split_data(X, y)
+    del X
+
+    weights = None
+    if BALANCING == 'smote':
+        from imblearn.over_sampling import SMOTE
+        print("\nAplicando SMOTE para balanceamento...")
+        sm = SMOTE(random_state=42)
+        X_train, y_train = sm.fit_resample(X_train, y_train)
+        print(f"Shape após SMOTE: {X_train.shape}")
+    elif BALANCING == 'weights':
+        weights = class_weights(np.bincount(y_train, minlength=len(classes)))
+        print(f"\nPesos por classe: {dict(zip(classes, np.round(weights, 3)))}")
+
+    def folds():
+        skf = StratifiedKFold(n_splits=N_FOLDS, shuffle=True, random_state=42)
+        for train_idx, val_idx in skf.split(X_train, y_train):
+            # A matriz quantizada não guarda a cópia das linhas do fold
+            dtrain = build_matrix(
+                X_train[train_idx], label=y_train[train_idx],
+                weight=weights[y_train[train_idx]] if weights is not None else None
+            )
+            dval = build_matrix(X_train[val_idx], label=y_train[val_idx], ref=dtrain)
+            yield dtrain, dval, lambda model: (y_train[val_idx], model.inplace_predict(X_train[val_idx]))
+            
+    return _fit_and_report(
+        classes,
+        folds(),
+        lambda: build_matrix(X_train, label=y_train, weight=weights[y_train] if weights is not None else None),
+        lambda model: (y_test, model.inplace_predict(X_test)),
+        profile,
+        overrides
+    )
+
+def assign_groups(partitions, test_size=0.2, seed=42):
+    """Grupo de cada linha no modo externo: -1 = teste, 0..N_FOLDS-1 = fold de validação"""
+    rng = np.random.default_rng(seed)
+    groups = []
+    for _, y in partitions:
+        draw = rng.random(len(y))
+        group = np.minimum((draw - test_size) / (1 - test_size) * N_FOLDS, N_FOLDS - 1).astype(np.int8)
+        group[draw < test_size] = -1
+        groups.append(group)
+    return groups
+
+def sample_partitions(partitions, groups, columns, fill, n_rows, seed=42):
+    """Amostra uniforme das partições em memória (DataFrame float32 sem NaN, rótulos e grupos)"""
+    total = sum(len(y) for _, y in partitions)
+    keep = np.sort(np.random.default_rng(seed).choice(total, size=min(n_rows, total), replace=False))
+    X, y, sampled_groups = [], [], []
+    offset = 0
+    for (part_X, part_y), group in zip(partitions, groups):
+        rows = keep[(keep >= offset) & (keep < offset + len(part_y))] - offset
+        X.append(part_X[rows])
+        y.append(part_y[rows])
+        sampled_groups.append(group[rows])
+        offset += len(part_y)
+    X = np.concatenate(X)
+    missing = np.isnan(X)
+    X[missing] = np.asarray(fill, dtype=np.float32)[np.nonzero(missing)[1]]
+    return (
+        pd.DataFrame(X, columns=columns, copy=False),
+        np.concatenate(y).astype(np.int64),
+        np.concatenate(sampled_groups)
+    )
+
+def train_xgboost_external(partitions, groups, columns, fill, classes, profile=None, overrides=None):
+    """
+    Treino em memória externa: as partições do cache são lidas em lotes a cada passada
+    
+    Args:
+        partitions: lista de (features em memmap, rótulos codificados) de open_dataset
+        groups: grupo de cada linha por partição (assign_groups)
+        columns: índices das colunas usadas pelo modelo
+        fill: valor do NaN por coluna
+    """
+    if BALANCING == 'smote':
+        raise ValueError("SMOTE precisa do conjunto inteiro em memória: use BALANCING = 'weights'")
+        
+    train_folds = list(range(N_FOLDS))
+    weights = None
+    if BALANCING == 'weights':
+        counts = sum(
+            np.bincount(y[group >= 0], minlength=len(classes)) for (_, y), group in zip(partitions, groups)
+        )
+        weights = class_weights(counts)
+        print(f"\nPesos por classe: {dict(zip(classes, np.round(weights, 3)))}")
+        
+    def iterator(selected, weights=None):
+        return PartitionIterator(partitions, groups, selected, columns, fill, weights)
+        
+    # Pesos só no treino: validação e teste sem peso, como no modo em memória
+    def folds():
+        for fold in train_folds:
+            dtrain = build_matrix(iterator([f for f in train_folds if f != fold], weights))
+            validation = iterator([fold])
+            yield dtrain, build_matrix(validation, ref=dtrain), validation.predict
+            
+    return _fit_and_report(
+        classes,
+        folds(),
+        lambda: build_matrix(iterator(train_folds, weights)),
+        iterator([-1]).predict,
+        profile,
+        overrides
+    )
+
+# ========== BUSCA DE HIPERPARÂMETROS ==========
+# Estado de cada processo do pool: dados em memmap e matrizes quantizadas por fold
+_TUNING_STATE = {}
+
+def sample_params(rng):
+    """Sorteia um candidato do SEARCH_SPACE"""
+    params = {}
+    for name, space in SEARCH_SPACE.items():
+        if isinstance(space, list):
+            params[name] = space[int(rng.integers(len(space)))]
+        elif len(space) == 3 and space[2] == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(space[0]), np.log(space[1]))))
+        else:
+            params[name] = float(rng.uniform(space[0], space[1]))
+    return params
+
+def _tuning_worker_init(data_dir, folds, weights, history, pruned, nthread):
+    _TUNING_STATE.update({
+        'X': np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r'),
+        'y': np.load(os.path.join(data_dir, 'y.npy')),
+        'folds': folds,
+        'weights': weights,
+        'history': history,
+        'pruned': pruned,
+        'nthread': nthread,
+        'matrices': {}
+    })
+
+def _fold_matrices(fold):
+    """Matrizes do fold quantizadas uma vez por processo e reaproveitadas por todos os trials"""
+    state = _TUNING_STATE
+    if fold not in state['matrices']:
+        train_idx, val_idx = state['folds'][fold]
+        y_train = state['y'][train_idx]
+        # Quantização dentro do orçamento de threads do job, como o treino
+        dtrain = build_matrix(
+            state['X'][train_idx], label=y_train,
+            weight=state['weights'][y_train] if state['weights'] is not None else None,
+            nthread=state['nthread']
+        )
+        dval = build_matrix(state['X'][val_idx], label=state['y'][val_idx], ref=dtrain, nthread=state['nthread'])
+        state['matrices'][fold] = (dtrain, dval)
+    return state['matrices'][fold]
+
+class _MedianPruning(xgb.callback.TrainingCallback):
+    """Interrompe o trial cujo mlogloss de validação fica acima da mediana dos outros na mesma rodada"""
+    
+    def __init__(self, trial, fold):
+        super().__init__()
+        self.trial = trial
+        self.fold = fold
+        
+    def after_iteration(self, model, epoch, evals_log):
+        rounds = epoch + 1
+        if rounds % PRUNE_EVERY:
+            return False
+        history, pruned = _TUNING_STATE['history'], _TUNING_STATE['pruned']
+        value = evals_log['val']['mlogloss'][-1]
+        history[(self.trial, self.fold, rounds)] = value
+        if self.trial in pruned:  # Outro fold do mesmo trial já foi podado
+            return True
+        if rounds < PRUNE_WARMUP:
+            return False
+        others = [v for (trial, fold, r), v in history.items()
+                  if fold == self.fold and r == rounds and trial != self.trial]
+        if len(others) >= PRUNE_MIN_TRIALS and value > np.median(others):
+            pruned[self.trial] = rounds
+            return True
+        return False
+
+def _tuning_job(trial, fold, params):
+    """Treina um fold de um trial no processo do pool"""
+    state = _TUNING_STATE
+    dtrain, dval = _fold_matrices(fold)
+    started = time.perf_counter()
+    model = xgb.train(
+        dict(params, nthread=state['nthread']),
+        dtrain,
+        num_boost_round=TUNING_ROUNDS,
+        evals=[(dval, 'val')],
+        early_stopping_rounds=50,
+        verbose_eval=False,
+        callbacks=[_MedianPruning(trial, fold)]
+    )
+    train_s = time.perf_counter() - started
+    
+    _, val_idx = state['folds'][fold]
+    preds = model.inplace_predict(state['X'][val_idx])
+    report = classification_report(state['y'][val_idx], preds, output_dict=True, zero_division=0)
+    return {
+        'trial': trial,
+        'fold': fold,
+        'mlogloss': float(model.best_score),
+        # Como no modelo final: melhor iteração + as 50 rodadas de paciência
+        'rounds': model.num_boosted_rounds(),
+        'accuracy': report['accuracy'],
+        'f1_macro': report['macro avg']['f1-score'],
+        'train_s': train_s,
+        'pruned_at': state['pruned'].get(trial),
+        # O modelo do 1º fold representa o trial na medição de latência
+        'model': bytes(model.save_raw('ubj')) if fold == 0 else None
+    }
+
+def measure_latency(raw_model, X, single_rows=500, batch_rows=1024, seed=42):
+    """Latência de inferência em 1 thread: por fluxo (p50/p99) e por linha num lote"""
+    model = xgb.Booster(model_file=bytearray(raw_model))
+    model.set_param({'nthread': 1})
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(X[np.sort(rng.choice(len(X), size=min(max(single_rows, batch_rows), len(X)),
+                                             replace=False))])
+    model.inplace_predict(rows[:1])  # Aquecimento
+    
+    timings = []
+    for row in rows[:single_rows]:
+        started = time.perf_counter()
+        model.inplace_predict(row[None, :])
+        timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    model.inplace_predict(rows[:batch_rows])
+    batch_s = time.perf_counter() - started
+    return {
+        'latency_p50_ms': float(np.percentile(timings, 50) * 1e3),
+        'latency_p99_ms': float(np.percentile(timings, 99) * 1e3),
+        'batch_us_per_row': batch_s / min(batch_rows, len(rows)) * 1e6,
+        'model_kb': len(raw_model) / 1024
+    }
+
+def tune_xgboost(X, y, classes, n_trials=TUNING_TRIALS, cores=TUNING_CORES, output=LEADERBOARD_PATH):
+    """
+    Busca aleatória de hiperparâmetros com validação cruzada paralela e poda pela mediana
+    
+    Cada (trial, fold) é um job do pool; os processos quantizam os folds uma vez e os
+    reaproveitam em todos os trials. O 1º trial são os parâmetros atuais (referência).
+    
+    Returns:
+        leaderboard (lista de dicts, melhores primeiro), também gravado em JSON
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+    
+    X = np.asarray(X, dtype=np.float32)
+    X_train, _, y_train, _ = split_data(X, y)
+    del X
+    weights = None
+    if BALANCING == 'weights':
+        weights = class_weights(np.bincount(y_train, minlength=len(classes)))
+    elif BALANCING == 'smote':
+        print("⚠️ SMOTE não é aplicado na busca: os trials usam os dados originais")
+    skf = StratifiedKFold(n_splits=N_FOLDS, shuffle=True, random_state=42)
+    folds = list(skf.split(X_train, y_train))
+    
+    rng = np.random.default_rng(42)
+    base = xgboost_params(classes)
+    candidates = [{name: base[name] for name in SEARCH_SPACE if name in base}]
+    candidates += [sample_params(rng) for _ in range(n_trials - 1)]
+    
+    nthread = max(1, min(TUNING_THREADS_PER_JOB, cores))
+    workers = max(1, min(cores // nthread, len(candidates) * N_FOLDS))
+    print(f"\n=== Busca: {len(candidates)} trials x {N_FOLDS} folds, "
+          f"{workers} processos x {nthread} thread(s) ===")
+    
+    results = defaultdict(list)
+    started = time.perf_counter()
+    # Os processos leem o treino do disco (memmap) em vez de receber cópias serializadas;
+    # o diretório temporário é apagado ao fim da busca
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='tuning-', dir=CACHE_DIR) as data_dir:
+        np.save(os.path.join(data_dir, 'X.npy'), X_train)
+        np.save(os.path.join(data_dir, 'y.npy'), y_train)
+        with multiprocessing.Manager() as manager:
+            history, pruned = manager.dict(), manager.dict()
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_tuning_worker_init,
+                initargs=(data_dir, folds, weights, history, pruned, nthread)
+            ) as pool:
+                # Submetidos em ordem: os primeiros trials formam a mediana usada pelos seguintes
+                jobs = [
+                    pool.submit(_tuning_job, trial, fold, xgboost_params(classes, candidate))
+                    for trial, candidate in enumerate(candidates) for fold in range(N_FOLDS)
+                ]
+                for job in as_completed(jobs):
+                    result = job.result()
+                    results[result['trial']].append(result)
+                    if len(results[result['trial']]) == N_FOLDS:
+                        status = 'podado' if result['trial'] in pruned else 'ok'
+                        print(f"  trial {result['trial']:>3}: {status}, mlogloss "
+                              f"{np.mean([r['mlogloss'] for r in results[result['trial']]]):.4f}")
+            pruned = dict(pruned)
+    search_s = time.perf_counter() - started
+    
+    # Latência medida depois do pool, sem concorrência pelos núcleos
+    leaderboard = []
+    for trial, candidate in enumerate(candidates):
+        folds_done = results[trial]
+        entry = {
+            'trial': trial,
+            'params': candidate,
+            'status': f"podado na rodada {pruned[trial]}" if trial in pruned else 'ok',
+            'mlogloss': float(np.mean([r['mlogloss'] for r in folds_done])),
+            'accuracy': float(np.mean([r['accuracy'] for r in folds_done])),
+            'f1_macro': float(np.mean([r['f1_macro'] for r in folds_done])),
+            'rounds': int(np.mean([r['rounds'] for r in folds_done])),
+            'train_s': float(sum(r['train_s'] for r in folds_done))
+        }
+        if trial not in pruned:
+            raw_model = next(r['model'] for r in folds_done if r['fold'] == 0)
+            entry.update(measure_latency(raw_model, X_train))
+        leaderboard.append(entry)
+        
+    # Fronteira de Pareto: nenhum outro trial é ao mesmo tempo mais preciso e mais rápido
+    complete = [e for e in leaderboard if e['status'] == 'ok']
+    for entry in complete:
+        entry['pareto'] = not any(
+            other['mlogloss'] <= entry['mlogloss'] and other['latency_p99_ms'] <= entry['latency_p99_ms']
+            and (other['mlogloss'] < entry['mlogloss'] or other['latency_p99_ms'] < entry['latency_p99_ms'])
+            for other in complete
+        )
+    leaderboard.sort(key=lambda e: (e['status'] != 'ok', e['mlogloss']))
+    
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'search_s': round(search_s, 1),
+            'cores': cores,
+            'workers': workers,
+            'threads_per_job': nthread,
+            'pruned': len(pruned),
+            'leaderboard': leaderboard
+        }, f, indent=2)
+        
+    print(f"\nBusca concluída em {search_s:.0f}s ({len(pruned)} de {len(candidates)} trials podados)")
+    print(f"{'trial':>5} {'mlogloss':>9} {'acurácia':>9} {'f1 macro':>9} {'rodadas':>8} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'µs/linha':>9}  pareto")
+    for entry in (e for e in leaderboard if e['status'] == 'ok'):
+        print(f"{entry['trial']:>5} {entry['mlogloss']:>9.4f} {entry['accuracy']:>9.4f} "
+              f"{entry['f1_macro']:>9.4f} {entry['rounds']:>8} {entry['latency_p50_ms']:>7.3f} "
+              f"{entry['latency_p99_ms']:>7.3f} {entry['batch_us_per_row']:>9.2f}  "
+              f"{'*' if entry['pareto'] else ''}")
+    print(f"Leaderboard salvo em: {output}")
+    return leaderboard
+
+def select_candidate(leaderboard, latency_budget_ms=TUNING_LATENCY_BUDGET_MS):
+    """Melhor mlogloss dentro do orçamento de latência p99 (None = sem limite)"""
+    for entry in leaderboard:
+        if entry['status'] == 'ok' and (latency_budget_ms is None or entry['latency_p99_ms'] <= latency_budget_ms):
+            return entry
+    return None
+
+# ========== CASCATA (1º ESTÁGIO) ==========
+def calibrate_band(p_attack, is_attack, full_attack, target_recall, target_precision):
+    """
+    Escolhe a faixa [low, high) de escalonamento para o 1º estágio
+    
+    Args:
+        p_attack: probabilidade de ataque dada pelo 1º estágio
+        is_attack: rótulo verdadeiro (ataque ou não)
+        full_attack: veredito do modelo completo (ataque ou não)
+        target_recall: recall de ataques exigido da cascata
+        target_precision: precisão exigida para o 1º estágio decidir ataque sozinho
+        
+    Returns:
+        dict com low, high, recall, precision e fração escalonada
+    """
+    candidates = np.unique(np.concatenate(([0.0], p_attack)))
+    attacks = max(int(is_attack.sum()), 1)
+    
+    # high: menor limiar cuja precisão isolada atinge o alvo (inf = nunca decide ataque)
+    high = np.inf
+    for t in candidates[::-1]:
+        above = p_attack >= t
+        if is_attack[above].mean() < target_precision:
+            break
+        high = t
+        
+    # low: maior limiar (menos escalonamento) que ainda mantém o recall da cascata
+    direct_hits = int((is_attack & (p_attack >= high)).sum())
+    low = 0.0
+    for t in candidates[candidates <= high][::-1]:
+        band = (p_attack >= t) & (p_attack < high)
+        if (direct_hits + int((is_attack & band & full_attack).sum())) / attacks >= target_recall:
+            low = t
+            break
+            
+    # Limiares no meio do intervalo entre valores de folha: imunes a arredondamento
+    def midpoint(t):
+        below = candidates[candidates < t]
+        return (t + below[-1]) / 2 if len(below) and np.isfinite(t) else t
+    low, high = midpoint(low), midpoint(high)
+    
+    band = (p_attack >= low) & (p_attack < high)
+    flagged = (p_attack >= high) | (band & full_attack)
+    return {
+        'low': float(low),
+        'high': float(high),
+        'recall': float((flagged & is_attack).sum() / attacks),
+        'precision': float(is_attack[flagged].mean()) if flagged.any() else 0.0,
+        'escalation_rate': float(band.mean())
+    }
+
+def train_cascade(X, y, classes, feature_names, full_model, model_path='xgboost_model.model', held_out=None):
+    """Treina o 1º estágio e calibra a faixa de incerteza contra o modelo completo
+    
+    held_out marca as linhas que o modelo completo não viu no treino (modo externo);
+    sem ele, vale a mesma divisão de split_data usada pelo treino em memória.
+    """
+    feature_names = list(feature_names)
+    columns = [feature_names.index(name) for name in TIER1_FEATURES if name in feature_names]
+    if not columns:
+        print("\nNenhuma feature barata disponível: cascata não gerada")
+        return None
+    tier1_features = [feature_names[i] for i in columns]
+    benign = list(classes).index(BENIGN_LABEL) if BENIGN_LABEL in list(classes) else 0
+    
+    X = np.asarray(X, dtype=np.float32)
+    if held_out is None:
+        X_train, X_test, y_train, y_test = split_data(X, y)
+    else:
+        X_train, X_test, y_train, y_test = X[~held_out], X[held_out], y[~held_out], y[held_out]
+    tier1 = DecisionTreeClassifier(
+        max_depth=TIER1_MAX_DEPTH, class_weight='balanced', random_state=42
+    )
+    tier1.fit(X_train[:, columns], y_train)
+    
+    # Metade do teste calibra a faixa; a outra metade confere o resultado
+    X_cal, X_eval, y_cal, y_eval = train_test_split(
+        X_test, y_test, test_size=0.5, random_state=42, stratify=y_test
+    )
+    
+    def score(X_part, y_part):
+        p_attack = 1.0 - tier1.predict_proba(X_part[:, columns])[:, benign]
+        full_attack = full_model.predict(xgb.DMatrix(X_part)) != benign
+        return p_attack, y_part != benign, full_attack
+        
+    band = calibrate_band(*score(X_cal, y_cal), CASCADE_TARGET_RECALL, CASCADE_TARGET_PRECISION)
+    p_attack, is_attack, full_attack = score(X_eval, y_eval)
+    escalated = (p_attack >= band['low']) & (p_attack < band['high'])
+    flagged = (p_attack >= band['high']) | (escalated & full_attack)
+    attacks = max(int(is_attack.sum()), 1)
+    check = {
+        'recall': float((flagged & is_attack).sum() / attacks),
+        'escalation_rate': float(escalated.mean()),
+        'full_model_recall': float((full_attack & is_attack).sum() / attacks)
+    }
+    
+    print("\n=== Cascata ===")
+    print(f"Features do 1º estágio: {tier1_features}")
+    print(f"Faixa de incerteza: [{band['low']:.4f}, {band['high']:.4f})")
+    print(f"Calibração: recall {band['recall']:.4f}, escalonados {band['escalation_rate']:.2%}")
+    print(f"Validação:  recall {check['recall']:.4f} (modelo completo sozinho: "
+          f"{check['full_model_recall']:.4f}), escalonados {check['escalation_rate']:.2%}")
+    if band['recall'] < CASCADE_TARGET_RECALL:
+        print(f"⚠️ Recall alvo {CASCADE_TARGET_RECALL} inalcançável: todo fluxo abaixo de "
+              f"{band['high']:.4f} será escalonado")
+    
+    cascade = {
+        'model': tier1,
+        'features': tier1_features,
+        'benign_class': benign,
+        'low': band['low'],
+        'high': band['high'],
+        'target_recall': CASCADE_TARGET_RECALL,
+        'target_precision': CASCADE_TARGET_PRECISION,
+        'calibration': band,
+        'validation': check
+    }
+    cascade_path = os.path.splitext(model_path)[0] + '.cascade.pkl'
+    joblib.dump(cascade, cascade_path)
+    print(f"Cascata salva em: {cascade_path}")
+    return cascade
+
+# ========== PACOTE DO MODELO ==========
+def save_model_bundle(path, model, feature_names, dtypes, classes, metadata=None, cascade=None):
+    """
+    Salva modelo, features (na ordem de treino), dtypes, classes e metadados num único arquivo
+    
+    Args:
+        path: arquivo de saída (.bundle)
+        model: Booster do XGBoost ou estimador do scikit-learn
+        feature_names: colunas na ordem em que o modelo as recebe
+        dtypes: dtype de cada coluna no treino
+        classes: classes do LabelEncoder (índice = saída do modelo)
+        metadata: informações do treino
+        cascade: 1º estágio gerado por train_cascade (opcional)
+    """
+    feature_names = [str(name) for name in feature_names]
+    if isinstance(model, xgb.Booster):
+        # Formato nativo (UBJSON): independe da versão do pickle do xgboost
+        model_type, payload = 'xgboost', bytes(model.save_raw('ubj'))
+    else:
+        model_type, payload = 'sklearn', model
+        
+    bundle = {
+        'format': MODEL_BUNDLE_FORMAT,
+        'version': MODEL_BUNDLE_VERSION,
+        'model_type': model_type,
+        'model': payload,
+        'features': feature_names,
+        'dtypes': {name: str(dtypes[name]) for name in feature_names},
+        'classes': [str(name) for name in classes],
+        'metadata': dict(metadata or {}),
+        'cascade': cascade
+    }
+    joblib.dump(bundle, path)
+    print(f"Pacote do modelo salvo em: {path} ({len(feature_names)} features)")
+    return bundle
+
 class XGBModelValidator:
     def __init__(self, model_path, label_encoder_path=None):
         """
@@ -252,19 +1141,81 @@ if __name__ == "__main__":
 
 # ========== EXECUÇÃO ==========
 if __name__ == '__main__':
-    print("=== Carregando dados ===")
-    df = load_data(NUM_CSVS)
+    profile = TrainingProfile(training_config())
+    
+    if EXTERNAL_MEMORY:
+        print("=== Abrindo partições (memória externa) ===")
+        partitions, columns, vocabulary, fill = open_dataset(NUM_CSVS)
+        le = fit_label_encoder(vocabulary)
+        to_class = le.transform(vocabulary)
+        partitions = [(part_X, to_class[codes]) for part_X, codes in partitions]
+        classes = le.classes_
+        dtypes = feature_dtypes(columns)
+        class_counts = sum(np.bincount(codes, minlength=len(classes)) for _, codes in partitions)
+        
+        # Seleção de features e cascata usam uma amostra; o XGBoost lê tudo em lotes
+        groups = assign_groups(partitions)
+        X, y, sample_groups = sample_partitions(partitions, groups, columns, fill, SAMPLE_ROWS)
+        feature_names = X.columns
+        profile.mark('carga')
+    else:
+        print("=== Carregando dados ===")
+        X, labels, dtypes = load_data(NUM_CSVS)
 
-    print("\n=== Pré-processamento ===")
-    X, y, classes = preprocess(df)
+        print("\n=== Pré-processamento ===")
+        X, y, classes = preprocess(X, labels)
+        feature_names = X.columns
+        class_counts = np.bincount(y, minlength=len(classes))
+        profile.mark('carga')
 
     if FEATURE_SELECTION:
         print("\nSelecionando melhores features...")
-        X, selected = select_features(X, y, k=50)
-        print(f"Features selecionadas: {list(selected)}")
+        X, feature_names = select_features(X, y, k=50)
+        print(f"Features selecionadas: {list(feature_names)}")
+        profile.mark('seleção de features')
+
+    overrides = None
+    if TUNING:
+        # No modo externo a busca roda sobre a amostra em memória
+        chosen = select_candidate(tune_xgboost(X, y, classes))
+        if chosen:
+            overrides = chosen['params']
+            print(f"Trial escolhido: {chosen['trial']} {overrides}")
+        else:
+            print("⚠️ Nenhum trial dentro do orçamento de latência: mantidos os parâmetros padrão")
+        profile.mark('busca de hiperparâmetros')
 
     print("\n=== Treinando XGBoost ===")
     print(f"Shape final: {X.shape}")
     print(f"Classes: {classes}")
-    model = train_xgboost(X, y, classes)
-    
\ No newline at end of file
+    if EXTERNAL_MEMORY:
+        model = train_xgboost_external(
+            partitions, groups, [columns.index(name) for name in feature_names], fill, classes, profile, overrides
+        )
+    else:
+        model = train_xgboost(X, y, classes, profile, overrides)
+    
+    cascade = None
+    if CASCADE:
+        # No modo externo a cascata é calibrada só na amostra do teste do modelo completo
+        held_out = sample_groups == -1 if EXTERNAL_MEMORY else None
+        cascade = train_cascade(X, y, classes, feature_names, model, held_out=held_out)
+        profile.mark('cascata')
+        
+    save_model_bundle(
+        MODEL_BUNDLE_PATH, model, feature_names, dtypes, classes,
+        metadata={
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+            'rows': int(class_counts.sum()),
+            'class_counts': {str(c): int(n) for c, n in zip(classes, class_counts)},
+            'feature_selection': FEATURE_SELECTION,
+            'balancing': BALANCING,
+            'hyperparameters': overrides,
+            'num_boost_round': model.num_boosted_rounds(),
+            'xgboost_version': xgb.__version__,
+            'sklearn_version': sklearn.__version__,
+            'training': profile.summary()
+        },
+        cascade=cascade
+    )
+    profile.save()